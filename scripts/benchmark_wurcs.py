@@ -0,0 +1,448 @@
+# Benchmarks for the glycan tree type classifier and the process_wurcs.py CSV pipeline.
+# python benchmark_wurcs.py generate -o corpus.csv --size 100000
+# python benchmark_wurcs.py run --corpus corpus.csv -o results.json
+# python benchmark_wurcs.py compare baseline.json results.json
+
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+NAG = "a2122h-1b_1-5_2*NCC/3=O"
+BMA = "a1122h-1b_1-5"
+MAN = "a1122h-1a_1-5"
+GAL = "a2112h-1b_1-5"
+FUC = "a1221m-1a_1-5"
+SIA = "Aad21122h-2a_2-6_5*NCC/3=O"
+XYP = "a212h-1b_1-5"
+GLC = "a2122h-1a_1-5"
+UNKNOWN = "a0000h-1x_1-5"
+
+# Relative frequency of each family of glycan in a generated corpus, roughly as in Privateer output for the PDB
+DEFAULT_TYPE_MIX = {
+    "truncated": 0.45,
+    "high_mannose": 0.25,
+    "complex": 0.2,
+    "hybrid": 0.05,
+    "other": 0.03,
+    "unrecognised": 0.01,
+    "error": 0.01,
+}
+BENCHMARKS = ("parse", "classify", "check_type", "classify_batch", "classify_batch_distinct", "process_csv")
+COMPARED_METRICS = ("seconds", "p50_us", "p99_us", "peak_rss_kb")
+
+class _GlycanBuilder:
+    # Residues are numbered in the order they are added, which is the order they appear in the WURCS
+    def __init__(self):
+        self.residues = []
+        self.linkages = []
+        self.used = {}
+
+    def add(self, descriptor, donor=None, carbon=None, anomeric=1):
+        self.residues.append(descriptor)
+        acceptor = len(self.residues) - 1
+        if donor is not None:
+            self.linkages.append((donor, carbon, acceptor, anomeric))
+            self.used.setdefault(donor, set()).add(carbon)
+        return acceptor
+
+    def free_carbons(self, residue, carbons):
+        return [carbon for carbon in carbons if carbon not in self.used.get(residue, ())]
+
+    def wurcs(self):
+        from glycan_tree_type_identifier import residue_id
+        unique = list(dict.fromkeys(self.residues))
+        order = "-".join(str(unique.index(residue) + 1) for residue in self.residues)
+        linkages = "_".join(f"{residue_id(donor)}{carbon}-{residue_id(acceptor)}{anomeric}"
+                            for donor, carbon, acceptor, anomeric in sorted(self.linkages))
+        descriptors = "".join(f"[{residue}]" for residue in unique)
+        return f"WURCS=2.0/{len(unique)},{len(self.residues)},{len(self.linkages)}/{descriptors}/{order}/{linkages}"
+
+def generate_glycan(rng: random.Random, kind: str, max_antennae: int = 4, max_extensions: int = 2):
+    """
+    Generate the WURCS of a random N-glycan.
+
+    :param rng: The random number generator.
+    :param kind: 'truncated', 'high_mannose', 'complex', 'hybrid', 'other', 'unrecognised' or 'error'.
+    :param max_antennae: Maximum number of antennae of complex glycans, from 2 to 4.
+    :param max_extensions: Maximum number of LacNAc repeats on each antenna, which sets the size of the largest
+        glycans.
+    :return: A WURCS string, or 'ERROR' for the 'error' kind.
+    """
+    if kind == "error":
+        return "ERROR"
+
+    glycan = _GlycanBuilder()
+    if kind == "other":
+        # Glucose chains and other non N-glycans, which have no mannose
+        residue = glycan.add(GLC)
+        for _ in range(rng.randint(1, 5)):
+            residue = glycan.add(GLC, residue, 4)
+        return glycan.wurcs()
+
+    root = glycan.add(NAG)
+    if kind == "truncated":
+        # NAG, NAG-NAG or the chitobiose core with its BMA, optionally fucosylated
+        length = rng.choice((1, 1, 2, 2, 3))
+        residue = root
+        for descriptor in (NAG, BMA)[:length - 1]:
+            residue = glycan.add(descriptor, residue, 4)
+        if rng.random() < 0.2:
+            glycan.add(FUC, root, 6)
+        return glycan.wurcs()
+
+    core = glycan.add(NAG, root, 4)
+    bma = glycan.add(BMA, core, 4)
+    if rng.random() < 0.1:
+        glycan.add(XYP, bma, 2)
+    arm3 = glycan.add(MAN, bma, 3)
+    arm6 = glycan.add(MAN, bma, 6)
+
+    def antenna(donor, carbon):
+        residue = glycan.add(NAG, donor, carbon)
+        for _ in range(rng.randint(0, max_extensions)):
+            residue = glycan.add(GAL, residue, 4)
+            if rng.random() < 0.3:
+                glycan.add(SIA, residue, 6, 2)
+                break
+            residue = glycan.add(NAG, residue, 3)
+
+    def mannoses(residues, count):
+        residues = list(residues)
+        for _ in range(count):
+            donor = rng.choice(residues)
+            carbons = glycan.free_carbons(donor, (2, 3, 6))
+            if carbons:
+                residues.append(glycan.add(MAN, donor, rng.choice(carbons)))
+
+    if kind == "high_mannose":
+        mannoses((arm3, arm6), rng.randint(0, 6))
+    elif kind == "hybrid":
+        antenna(arm3, 2)
+        mannoses((arm6,), rng.randint(1, 2))
+    else:
+        for donor, carbon in ((arm3, 2), (arm6, 2), (arm3, 4), (arm6, 6))[:rng.randint(2, max(2, max_antennae))]:
+            antenna(donor, carbon)
+        if kind == "unrecognised":
+            glycan.residues[rng.randrange(len(glycan.residues))] = UNKNOWN
+
+    if kind != "high_mannose" and rng.random() < 0.4:
+        glycan.add(FUC, root, 6)
+    return glycan.wurcs()
+
+def generate_corpus(size: int, seed: int = 0, type_mix: dict = None, max_antennae: int = 4,
+                    max_extensions: int = 2, duplicate_ratio: float = 0.9):
+    """
+    Generate a synthetic corpus of WURCS strings resembling the output of privateer_wurcs.py.
+
+    :param size: Number of WURCS strings.
+    :param seed: Seed of the random number generator, so a corpus can be regenerated exactly.
+    :param type_mix: Relative frequency of each kind of glycan, see generate_glycan, DEFAULT_TYPE_MIX by default.
+    :param max_antennae: Maximum number of antennae of complex glycans, from 2 to 4.
+    :param max_extensions: Maximum number of LacNAc repeats on each antenna.
+    :param duplicate_ratio: Fraction of the strings that repeat an earlier one. Repeats follow a Zipf
+        distribution, so a few glycans such as a single NAG account for most rows, as in the PDB.
+    :return: A list of WURCS strings.
+    """
+    rng = random.Random(seed)
+    type_mix = type_mix or DEFAULT_TYPE_MIX
+    kinds = list(type_mix)
+    weights = [type_mix[kind] for kind in kinds]
+
+    distinct_count = max(1, round(size * (1 - duplicate_ratio)))
+    distinct = [generate_glycan(rng, kind, max_antennae, max_extensions)
+                for kind in rng.choices(kinds, weights, k=min(size, distinct_count))]
+    corpus = distinct + rng.choices(distinct, [1 / (rank + 1) for rank in range(len(distinct))],
+                                    k=size - len(distinct))
+    rng.shuffle(corpus)
+    return corpus
+
+def write_corpus_csv(path: str, corpus):
+    """
+    Write a corpus as a process_wurcs.py input CSV, with the columns of the privateer_wurcs.py output.
+
+    :param path: Path to the CSV file.
+    :param corpus: List of WURCS strings.
+    """
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["FileName", "TSChainId", "ID", "WURCS"])
+        for index, wurcs in enumerate(corpus):
+            writer.writerow([f"{index // 8:05d}", "ABCDEFGH"[index % 8], f"{'ABCDEFGH'[index % 8]}-NAG-1", wurcs])
+
+def read_corpus_csv(path: str):
+    """
+    :param path: Path to a CSV file with a 'WURCS' column.
+    :return: The list of WURCS strings in the file.
+    """
+    with open(path, newline='') as file:
+        return [row["WURCS"] for row in csv.DictReader(file)]
+
+def percentile(sorted_values, fraction: float):
+    """
+    :param sorted_values: Values sorted in ascending order.
+    :param fraction: The percentile as a fraction, e.g. 0.99.
+    :return: The nearest-rank percentile of the values.
+    """
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def peak_rss_kb():
+    """
+    :return: The peak resident set size of this process in KiB, or None if it cannot be measured on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def summarise(seconds: float, calls: int, latencies_ns=None):
+    """
+    :param seconds: Wall-clock time of the benchmark.
+    :param calls: Number of WURCS strings processed.
+    :param latencies_ns: Optional latency of each call in nanoseconds.
+    :return: Dictionary of the benchmark metrics.
+    """
+    result = {"calls": calls, "seconds": seconds, "calls_per_second": calls / seconds if seconds else 0.0}
+    if latencies_ns:
+        latencies_ns = sorted(latencies_ns)
+        result["mean_us"] = sum(latencies_ns) / len(latencies_ns) / 1000
+        for name, fraction in (("p50_us", 0.5), ("p90_us", 0.9), ("p99_us", 0.99), ("max_us", 1.0)):
+            result[name] = percentile(latencies_ns, fraction) / 1000
+    return result
+
+def _time_calls(function, items):
+    perf_counter_ns = time.perf_counter_ns
+    latencies = []
+    append = latencies.append
+    start = time.perf_counter()
+    for item in items:
+        call_start = perf_counter_ns()
+        function(item)
+        append(perf_counter_ns() - call_start)
+    return summarise(time.perf_counter() - start, len(latencies), latencies)
+
+def run_benchmark(name: str, corpus_csv: str, workers: int = 1, chunk_size: int = 5000, cache_size: int = 100000):
+    """
+    Run one benchmark over a corpus in this process.
+
+    'parse' times parse_wurcs, 'classify' times check_type on already parsed glycans, leaving out 'ERROR' strings,
+    'check_type' times parsing and classifying each string, 'classify_batch' times the vectorized classifier over the
+    whole corpus as one batch, 'classify_batch_distinct' over only the distinct strings, so that the batch gains
+    nothing from repeated strings and can be compared with 'check_type', and 'process_csv' times the whole CSV
+    pipeline, including its cache.
+
+    :param name: One of BENCHMARKS.
+    :param corpus_csv: Path to the corpus CSV file.
+    :param workers: Worker processes for the process_csv benchmark.
+    :param chunk_size: Chunk size for the process_csv benchmark.
+    :param cache_size: Cache size for the process_csv benchmark.
+    :return: Dictionary of the benchmark metrics, including the peak RSS of the process.
+    """
+    import glycan_tree_type_identifier as gtti
+    corpus = read_corpus_csv(corpus_csv)
+    start_rss = peak_rss_kb()
+
+    if name == "parse":
+        result = _time_calls(gtti.parse_wurcs, corpus)
+    elif name == "classify":
+        parsed = [glycan for glycan in map(gtti.parse_wurcs, corpus) if glycan is not None]
+        result = _time_calls(gtti.check_type, parsed)
+    elif name == "check_type":
+        result = _time_calls(gtti.check_type, corpus)
+    elif name == "classify_batch":
+        from vectorized_tree_types import classify_batch
+        start = time.perf_counter()
+        classify_batch(corpus)
+        result = summarise(time.perf_counter() - start, len(corpus))
+    elif name == "classify_batch_distinct":
+        from vectorized_tree_types import classify_batch
+        distinct = list(dict.fromkeys(corpus))
+        start = time.perf_counter()
+        classify_batch(distinct)
+        result = summarise(time.perf_counter() - start, len(distinct))
+    elif name == "process_csv":
+        from process_wurcs import process_csv
+        with tempfile.TemporaryDirectory() as tmpdir:
+            start = time.perf_counter()
+            process_csv(corpus_csv, os.path.join(tmpdir, "output.csv"), cache_size=cache_size, workers=workers,
+                        chunk_size=chunk_size)
+            result = summarise(time.perf_counter() - start, len(corpus))
+    else:
+        raise ValueError(f"Unknown benchmark {name}, expected one of {', '.join(BENCHMARKS)}")
+
+    result["start_rss_kb"] = start_rss
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+def run_benchmarks(corpus_csv: str, names=BENCHMARKS, repeat: int = 1, **options):
+    """
+    Run benchmarks over a corpus, each in a fresh process so that its peak RSS is its own.
+
+    :param corpus_csv: Path to the corpus CSV file.
+    :param names: Names of the benchmarks to run.
+    :param repeat: Number of runs of each benchmark, of which the fastest is kept.
+    :param options: Passed to run_benchmark.
+    :return: Dictionary of benchmark name to metrics.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(run_benchmark, (name, corpus_csv), options))
+        results[name] = min(runs, key=lambda run: run["seconds"])
+    return results
+
+def compare_results(baseline: dict, current: dict, tolerance: float = 0.1):
+    """
+    Compare two benchmark result files.
+
+    :param baseline: Results of the reference run.
+    :param current: Results of the run being checked.
+    :param tolerance: Relative increase of a metric that counts as a regression.
+    :return: A list of (benchmark, metric, baseline value, current value, relative change, regressed) rows, for
+        each of COMPARED_METRICS found in both runs.
+    """
+    rows = []
+    for name, metrics in current["benchmarks"].items():
+        reference = baseline["benchmarks"].get(name)
+        if reference is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if reference.get(metric) is None or metrics.get(metric) is None:
+                continue
+            change = (metrics[metric] - reference[metric]) / reference[metric] if reference[metric] else 0.0
+            rows.append((name, metric, reference[metric], metrics[metric], change, change > tolerance))
+    return rows
+
+def format_comparison(rows):
+    """
+    :param rows: The output of compare_results.
+    :return: A table of the comparison, one metric per line.
+    """
+    lines = [f"{'benchmark':<12} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for name, metric, reference, value, change, regressed in rows:
+        lines.append(f"{name:<12} {metric:<12} {reference:>12.4g} {value:>12.4g} {change:>+8.1%}"
+                     f"{'  REGRESSION' if regressed else ''}")
+    return "\n".join(lines)
+
+def _parse_type_mix(text):
+    type_mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in DEFAULT_TYPE_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown glycan kind {kind}")
+        type_mix[kind] = float(weight)
+    return type_mix
+
+if __name__ == "__main__":
+    corpus_options = argparse.ArgumentParser(add_help=False)
+    corpus_options.add_argument("--size", type=int, default=100000, help="Number of WURCS strings")
+    corpus_options.add_argument("--seed", type=int, default=0, help="Seed of the corpus generator")
+    corpus_options.add_argument(
+        "--type-mix",
+        type=_parse_type_mix,
+        help="Relative frequency of each kind of glycan, e.g. high_mannose=1,complex=2. Kinds: "
+             f"{', '.join(DEFAULT_TYPE_MIX)}"
+    )
+    corpus_options.add_argument("--max-antennae", type=int, default=4, help="Maximum antennae of complex glycans")
+    corpus_options.add_argument("--max-extensions", type=int, default=2, help="Maximum LacNAc repeats per antenna")
+    corpus_options.add_argument(
+        "--duplicate-ratio",
+        type=float,
+        default=0.9,
+        help="Fraction of the strings that repeat an earlier one"
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="benchmark_wurcs",
+        description="""Generate synthetic WURCS corpora and benchmark the glycan tree type classifier."""
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", parents=[corpus_options], help="Write a synthetic corpus CSV")
+    generate.add_argument("-o", "--output_csv", required=True, help="Path to the corpus CSV file")
+
+    run = commands.add_parser("run", parents=[corpus_options], help="Run benchmarks and save their results")
+    run.add_argument("--corpus", help="Corpus CSV file, generated from the corpus options if not given")
+    run.add_argument("-o", "--output_json", help="Path to save the results to")
+    run.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    run.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark, of which the fastest is kept")
+    run.add_argument("--workers", type=int, default=1, help="Worker processes for the process_csv benchmark")
+    run.add_argument("--chunk-size", type=int, default=5000, help="Chunk size for the process_csv benchmark")
+    run.add_argument("--cache-size", type=int, default=100000, help="Cache size for the process_csv benchmark")
+    run.add_argument("--baseline", help="Results file to compare against")
+    run.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown that counts as a regression")
+
+    compare = commands.add_parser("compare", help="Compare two results files")
+    compare.add_argument("baseline", help="Results file of the reference run")
+    compare.add_argument("current", help="Results file of the run being checked")
+    compare.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown that counts as a regression")
+
+    args = parser.parse_args()
+
+    if args.command in ("generate", "run"):
+        corpus_parameters = {"size": args.size, "seed": args.seed, "type_mix": args.type_mix or DEFAULT_TYPE_MIX,
+                             "max_antennae": args.max_antennae, "max_extensions": args.max_extensions,
+                             "duplicate_ratio": args.duplicate_ratio}
+
+    if args.command == "generate":
+        write_corpus_csv(args.output_csv, generate_corpus(**corpus_parameters))
+
+    elif args.command == "run":
+        from glycan_tree_type_identifier import CLASSIFIER_VERSION
+        with tempfile.TemporaryDirectory() as tmpdir:
+            corpus_csv = args.corpus
+            if corpus_csv is None:
+                corpus_csv = os.path.join(tmpdir, "corpus.csv")
+                write_corpus_csv(corpus_csv, generate_corpus(**corpus_parameters))
+            else:
+                corpus_parameters = {"path": os.path.abspath(corpus_csv)}
+            corpus = read_corpus_csv(corpus_csv)
+            corpus_parameters.update(rows=len(corpus), distinct=len(set(corpus)))
+            benchmarks = run_benchmarks(corpus_csv, args.benchmarks, repeat=args.repeat, workers=args.workers,
+                                        chunk_size=args.chunk_size, cache_size=args.cache_size)
+
+        results = {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "classifier_version": CLASSIFIER_VERSION,
+            "corpus": corpus_parameters,
+            "benchmarks": benchmarks,
+        }
+        for name, metrics in benchmarks.items():
+            latency = f", p50 {metrics['p50_us']:.1f} us, p99 {metrics['p99_us']:.1f} us" if "p50_us" in metrics else ""
+            print(f"{name}: {metrics['seconds']:.3f} s ({metrics['calls_per_second']:.0f} calls/s){latency}, "
+                  f"peak RSS {metrics['peak_rss_kb']} KiB")
+        if args.output_json:
+            with open(args.output_json, 'w') as file:
+                json.dump(results, file, indent=2)
+        if args.baseline:
+            with open(args.baseline) as file:
+                rows = compare_results(json.load(file), results, args.tolerance)
+            print(format_comparison(rows))
+            sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        rows = compare_results(baseline, current, args.tolerance)
+        print(format_comparison(rows))
+        sys.exit(1 if any(row[-1] for row in rows) else 0)
@@ -0,0 +1,144 @@
+# Bounded LRU cache in front of check_type, for runs where the same WURCS strings appear many times.
+
+from collections import OrderedDict
+from glycan_tree_type_identifier import check_type, parse_wurcs
+from glycan_fingerprint import classification_key
+
+def normalise_wurcs(WURCS: str):
+    """
+    Normalise a WURCS string so that equivalent inputs share a cache key.
+
+    :param WURCS: The WURCS string, optionally wrapped in whitespace or double quotes.
+    :return: The bare WURCS string.
+    """
+    return WURCS.strip().strip('"')
+
+class ClassificationCache:
+    """
+    Least recently used cache of glycan tree types keyed on the normalised WURCS string.
+
+    With canonical=True, a WURCS string that misses is parsed and looked up again by its classification_key, so
+    equivalent glycans written differently are only classified once. Keys of both kinds share the maxsize entries.
+
+    :param maxsize: The maximum number of entries to keep before evicting the least recently used.
+    :param classify: The function used to classify a WURCS string on a cache miss. With canonical=True it is
+        passed the ParsedGlycan instead, unless the WURCS string is a Privateer error.
+    :param canonical: Also cache results by the classification_key of the glycan.
+    """
+    def __init__(self, maxsize: int = 100000, classify=check_type, canonical: bool = False):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self.classify_function = classify
+        self.canonical = canonical
+        self.hits = 0
+        self.misses = 0
+        self.equivalent_hits = 0
+        self.evictions = 0
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, WURCS: str):
+        return normalise_wurcs(WURCS) in self._results
+
+    def get(self, WURCS: str):
+        """
+        :param WURCS: The WURCS string of the glycan.
+        :return: The cached type of the glycan, or None if it has not been seen recently.
+        """
+        key = normalise_wurcs(WURCS)
+        results = self._results
+        if key in results:
+            self.hits += 1
+            results.move_to_end(key)
+            return results[key]
+        self.misses += 1
+
+    def put(self, WURCS: str, result: str):
+        """
+        Cache the type of a glycan, evicting the least recently used entry if the cache is full.
+
+        :param WURCS: The WURCS string of the glycan.
+        :param result: The type of the glycan.
+        """
+        results = self._results
+        results[normalise_wurcs(WURCS)] = result
+        if len(results) > self.maxsize:
+            results.popitem(last=False)
+            self.evictions += 1
+
+    def classify(self, WURCS: str):
+        """
+        :param WURCS: The WURCS string of the glycan.
+        :return: The cached type of the glycan, classifying it first if it has not been seen recently.
+        """
+        result = self.get(WURCS)
+        if result is None:
+            key = normalise_wurcs(WURCS)
+            result = self.classify_equivalent(key)
+            self.put(key, result)
+        return result
+
+    def classify_equivalent(self, WURCS: str):
+        """
+        Classify a WURCS string that missed the cache, reusing the cached type of an equivalent glycan if the cache
+        is canonical. The result is only cached under the classification_key, for the caller to put() under the
+        WURCS string.
+
+        :param WURCS: The normalised WURCS string of the glycan.
+        :return: The type of the glycan.
+        :raises ValueError: If the WURCS string is malformed.
+        """
+        if not self.canonical:
+            return self.classify_function(WURCS)
+        parsed = parse_wurcs(WURCS)
+        if parsed is None:
+            return self.classify_function(WURCS)
+        key = classification_key(parsed)
+        results = self._results
+        if key in results:
+            self.equivalent_hits += 1
+            results.move_to_end(key)
+            return results[key]
+        result = self.classify_function(parsed)
+        results[key] = result
+        if len(results) > self.maxsize:
+            results.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        """
+        Remove all cached results and reset the counters.
+        """
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.equivalent_hits = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        :return: A dictionary of the cache counters and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._results),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "equivalent_hits": self.equivalent_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def format_stats(self):
+        """
+        :return: The cache counters as a single human readable line.
+        """
+        stats = self.stats()
+        equivalent = f" ({stats['equivalent_hits']} of an equivalent glycan)" if self.canonical else ""
+        return (f"Cache: {stats['hits']} hits, {stats['misses']} misses{equivalent}, {stats['evictions']} evictions, "
+                f"hit rate {stats['hit_rate']:.1%} ({stats['size']}/{stats['maxsize']} entries)")
@@ -0,0 +1,415 @@
+# Long-running local HTTP service that classifies WURCS strings, so tools do not pay interpreter startup and the
+# residue database load for every glycan.
+# python classification_service.py --port 8765
+# curl -d '"WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"' http://127.0.0.1:8765/classify
+# curl -d '["WURCS=...", "WURCS=..."]' http://127.0.0.1:8765/classify
+# curl http://127.0.0.1:8765/metrics
+
+import argparse
+import asyncio
+import json
+import math
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+from classification_cache import ClassificationCache, normalise_wurcs
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+class ServiceError(Exception):
+    """
+    An error response from the classification service.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+class ServiceMetrics:
+    """
+    Request, batch and latency counters of a ClassificationService.
+
+    :param window: Number of most recent request latencies kept for the percentiles.
+    """
+    def __init__(self, window: int = 10000):
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.wurcs = 0
+        self.batches = 0
+        self.batched_wurcs = 0
+        self.latencies = deque(maxlen=window)
+
+    def record_request(self, seconds: float, wurcs_count: int, error: bool = False):
+        self.requests += 1
+        self.wurcs += wurcs_count
+        self.errors += error
+        self.latencies.append(seconds)
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.batched_wurcs += size
+
+    def snapshot(self):
+        """
+        :return: A dictionary of the counters, the throughput and the request latency percentiles in milliseconds.
+        """
+        uptime = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+        percentiles = {}
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+            rank = max(1, math.ceil(fraction * len(latencies)))
+            percentiles[name] = latencies[rank - 1] * 1000 if latencies else 0.0
+        return {
+            "uptime_seconds": uptime,
+            "requests": self.requests,
+            "errors": self.errors,
+            "wurcs": self.wurcs,
+            "wurcs_per_second": self.wurcs / uptime if uptime else 0.0,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_wurcs / self.batches if self.batches else 0.0,
+            "latency_ms": percentiles,
+        }
+
+class MicroBatcher:
+    """
+    Coalesces WURCS strings submitted by concurrent requests into batches, classified together.
+
+    A batch is classified when it reaches max_batch_size strings or max_delay seconds after its first string
+    arrived, whichever is first.
+
+    :param classify_batch: Function from a list of WURCS strings to a list of results, with an exception instance
+        in place of the result of a string that could not be classified.
+    :param max_batch_size: Maximum number of WURCS strings in a batch.
+    :param max_delay: Seconds a string may wait for others to join its batch.
+    :param metrics: Optional ServiceMetrics to record batch sizes in.
+    """
+    def __init__(self, classify_batch, max_batch_size: int = 256, max_delay: float = 0.002, metrics=None):
+        self.classify_batch = classify_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, wurcs_list):
+        """
+        :param wurcs_list: List of WURCS strings.
+        :return: List of results, with an exception instance where a string could not be classified.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for wurcs in wurcs_list:
+            future = loop.create_future()
+            self._queue.put_nowait((wurcs, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(queue.get_nowait())
+
+            try:
+                results = self.classify_batch([wurcs for wurcs, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class ClassificationService:
+    """
+    Classifies WURCS strings over HTTP, keeping the residue index and an LRU cache of results warm between requests.
+
+    Endpoints:
+        POST /classify with a JSON string, a JSON array of strings or a bare WURCS string as the body.
+        GET /classify?wurcs=... for a single string.
+        GET /metrics for the ServiceMetrics and cache counters.
+        GET /health
+
+    :param cache_size: Number of distinct WURCS results kept in memory.
+    :param max_batch_size: Maximum number of WURCS strings classified together.
+    :param max_delay: Seconds a request may wait for others to join its batch.
+    """
+    def __init__(self, cache_size: int = 100000, max_batch_size: int = 256, max_delay: float = 0.002):
+        self.cache = ClassificationCache(cache_size, canonical=True)
+        self.metrics = ServiceMetrics()
+        self.batcher = MicroBatcher(self.classify_batch, max_batch_size, max_delay, self.metrics)
+        self._server = None
+
+    def classify_batch(self, wurcs_list):
+        """
+        :param wurcs_list: List of WURCS strings.
+        :return: List of tree types, with the exception raised in place of the result of a string that could not be
+            classified, so one malformed string only fails its own request of a coalesced batch.
+        """
+        classify = self.cache.classify
+        results = []
+        for wurcs in wurcs_list:
+            try:
+                results.append(classify(wurcs))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        """
+        Start the batcher and, if port is not None, listen for HTTP connections.
+
+        :param host: Address to listen on, the loopback interface by default.
+        :param port: Port to listen on, 0 for any free port, None to only serve a LoopbackClient.
+        :return: The port listened on, or None.
+        """
+        self.batcher.start()
+        if port is None:
+            return
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765):
+        port = await self.start(host, port)
+        print(f"Classifying WURCS on http://{host}:{port}/classify")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle(self, method: str, target: str, body: bytes = b""):
+        """
+        Handle one request, independently of how it arrived.
+
+        :param method: The HTTP method.
+        :param target: The request target, a path with an optional query string.
+        :param body: The request body.
+        :return: (HTTP status, JSON-serialisable response).
+        """
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok"}
+        if url.path == "/metrics":
+            return 200, dict(self.metrics.snapshot(), cache=self.cache.stats())
+        if url.path != "/classify":
+            return 404, {"error": f"Unknown path {url.path}"}
+
+        start = time.perf_counter()
+        if method == "GET":
+            wurcs = parse_qs(url.query).get("wurcs")
+            if not wurcs:
+                return 400, {"error": "Missing wurcs query parameter"}
+            request = wurcs[0]
+        elif method == "POST":
+            try:
+                request = _parse_body(body)
+            except ValueError as e:
+                self.metrics.record_request(time.perf_counter() - start, 0, error=True)
+                return 400, {"error": str(e)}
+        else:
+            return 405, {"error": f"Method {method} not allowed"}
+
+        wurcs_list = [request] if isinstance(request, str) else request
+        results = await self.batcher.submit(wurcs_list)
+        errors = {index: str(result) for index, result in enumerate(results) if isinstance(result, Exception)}
+        self.metrics.record_request(time.perf_counter() - start, len(wurcs_list), error=bool(errors))
+
+        if isinstance(request, str):
+            if errors:
+                return 400, {"wurcs": request, "error": errors[0]}
+            return 200, {"wurcs": request, "result": results[0]}
+        response = {"results": [None if index in errors else result for index, result in enumerate(results)]}
+        if errors:
+            response["errors"] = {str(index): message for index, message in errors.items()}
+        return 200, response
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await _write_response(writer, 400, {"error": "Malformed request line"}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await _write_response(writer, 400, {"error": "Invalid Content-Length"}, close=True)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await _write_response(writer, 413, {"error": "Request body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self.handle(method.upper(), target, body)
+                close = (headers.get("connection", "").lower() == "close"
+                         or (version == "HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive"))
+                await _write_response(writer, status, response, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def _parse_body(body: bytes):
+    # A JSON string or array of strings, or a bare WURCS string
+    text = body.decode("utf-8").strip()
+    if not text:
+        raise ValueError("Empty request body")
+    if text[0] not in '"[':
+        return normalise_wurcs(text)
+    try:
+        request = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if isinstance(request, str):
+        return request
+    if isinstance(request, list) and all(isinstance(wurcs, str) for wurcs in request):
+        return request
+    raise ValueError("Expected a WURCS string or an array of WURCS strings")
+
+async def _write_response(writer, status, response, close=False):
+    body = json.dumps(response).encode()
+    writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n"
+                 .encode("latin-1") + body)
+    await writer.drain()
+
+def _result(status, response, wurcs):
+    if status != 200:
+        raise ServiceError(status, response.get("error", ""))
+    return response["result"] if isinstance(wurcs, str) else response["results"]
+
+class LoopbackClient:
+    """
+    Stand-in for a network client that sends requests straight to a ClassificationService in the same event loop,
+    for tests and for tools that embed the service.
+
+    :param service: A started ClassificationService, e.g. started with port=None.
+    """
+    def __init__(self, service: ClassificationService):
+        self.service = service
+
+    async def classify(self, wurcs):
+        """
+        :param wurcs: A WURCS string, or a list of WURCS strings.
+        :return: The tree type, or a list of tree types with None where a string was malformed.
+        :raises ServiceError: If the service rejected the request.
+        """
+        status, response = await self.service.handle("POST", "/classify", json.dumps(wurcs).encode())
+        return _result(status, response, wurcs)
+
+    async def metrics(self):
+        return (await self.service.handle("GET", "/metrics"))[1]
+
+class ServiceClient:
+    """
+    Blocking client of a ClassificationService listening over HTTP.
+
+    :param url: Base URL of the service.
+    :param timeout: Seconds to wait for a response.
+    """
+    def __init__(self, url: str = "http://127.0.0.1:8765", timeout: float = 60.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        request = urllib.request.Request(self.url + path, data=body,
+                                         headers={"Content-Type": "application/json"} if body else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def classify(self, wurcs):
+        """
+        :param wurcs: A WURCS string, or a list of WURCS strings.
+        :return: The tree type, or a list of tree types with None where a string was malformed.
+        :raises ServiceError: If the service rejected the request.
+        """
+        status, response = self._request("/classify", json.dumps(wurcs).encode())
+        return _result(status, response, wurcs)
+
+    def metrics(self):
+        return self._request("/metrics")[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="classification_service",
+        description="""Serve glycan tree types over HTTP on this machine."""
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on, the loopback interface by default")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=100000,
+        help="Number of distinct WURCS results to keep in memory"
+    )
+    parser.add_argument("--max-batch-size", type=int, default=256, help="Maximum WURCS strings classified together")
+    parser.add_argument(
+        "--max-delay-ms",
+        type=float,
+        default=2.0,
+        help="Milliseconds a request may wait for concurrent requests to join its batch"
+    )
+
+    args = parser.parse_args()
+
+    service = ClassificationService(args.cache_size, args.max_batch_size, args.max_delay_ms / 1000)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,252 @@
+# Persistent SQLite store of glycan tree types, so reruns over a growing CSV only classify new WURCS strings.
+# Each result is stored with a fingerprint of the classifier version, and is recomputed when it changes.
+# Changes to the residue database are applied incrementally: when the store is opened with a different database,
+# only the stored WURCS that contain an added, removed or renamed residue are reclassified.
+# python classification_store.py --store data/wurcs_classification_store.sqlite
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import glycan_tree_type_identifier
+from glycan_tree_type_identifier import check_type, database_version, get_residue_descriptors
+from classification_cache import normalise_wurcs
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "wurcs_classification_store.sqlite")
+
+def classifier_fingerprint():
+    """
+    :return: A hash of the classifier version. The residue database is tracked separately, see
+        ClassificationStore.sync_database.
+    """
+    digest = hashlib.sha256()
+    digest.update(glycan_tree_type_identifier.CLASSIFIER_VERSION.encode())
+    return digest.hexdigest()[:16]
+
+class DatabaseUpdate:
+    """
+    Summary of the stored results reclassified after a change to the residue database.
+
+    :ivar old_version: database_version of the database the store was last synced with, None for a new store.
+    :ivar new_version: database_version of the current database.
+    :ivar added: Residue descriptors added to the database.
+    :ivar removed: Residue descriptors removed from the database.
+    :ivar renamed: Residue descriptors whose residue name changed.
+    :ivar reclassified: Number of stored WURCS that were reclassified.
+    :ivar transitions: Dictionary of (old result, new result) to the number of WURCS whose result changed.
+    """
+    def __init__(self, old_version, new_version):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.added = []
+        self.removed = []
+        self.renamed = []
+        self.reclassified = 0
+        self.transitions = {}
+
+    @property
+    def database_modified(self):
+        """
+        :return: True if the database differs from the one the store was last synced with.
+        """
+        return self.old_version is not None and self.old_version != self.new_version
+
+    @property
+    def changed(self):
+        """
+        :return: Number of stored WURCS whose result changed.
+        """
+        return sum(self.transitions.values())
+
+    def record(self, old_result: str, new_result: str):
+        self.reclassified += 1
+        if old_result != new_result:
+            self.transitions[old_result, new_result] = self.transitions.get((old_result, new_result), 0) + 1
+
+    def format(self):
+        """
+        :return: The update as human readable lines.
+        """
+        if not self.database_modified:
+            return f"Residue database {self.new_version}: no stored results affected"
+        lines = [f"Residue database {self.old_version} -> {self.new_version}: {len(self.added)} residues added, "
+                 f"{len(self.removed)} removed, {len(self.renamed)} renamed; {self.reclassified} stored results "
+                 f"reclassified, {self.changed} changed"]
+        for (old_result, new_result), count in sorted(self.transitions.items(), key=lambda item: -item[1]):
+            lines.append(f"  {old_result} -> {new_result}: {count}")
+        return "\n".join(lines)
+
+class ClassificationStore:
+    """
+    On-disk mapping of WURCS string to glycan tree type.
+
+    :param path: Path to the SQLite file, created if it does not exist.
+    :param fingerprint: Fingerprint that stored results must match to be reused, defaults to classifier_fingerprint().
+    :param classify: The function used to classify a WURCS string that is not in the store.
+    :param batch_size: Number of new results to buffer before writing them to disk.
+    :param database: The residue database that classify uses, by default the one check_type uses.
+    :ivar database_update: The DatabaseUpdate applied when the store was opened.
+    """
+    def __init__(self, path: str = DEFAULT_STORE_PATH, fingerprint: str = None, classify=check_type, batch_size: int = 10000,
+                 database: dict = None):
+        self.path = path
+        self.fingerprint = fingerprint if fingerprint is not None else classifier_fingerprint()
+        self.classify_function = classify
+        self.batch_size = batch_size
+        self.database = database if database is not None else glycan_tree_type_identifier.get_residue_index().database
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._pending = []
+        self._pending_unrecognised = []
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (wurcs TEXT PRIMARY KEY, result TEXT NOT NULL, fingerprint TEXT NOT NULL) WITHOUT ROWID"
+        )
+        # Reverse index of the residues missing from the database to the WURCS that contain them
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS unrecognised (residue TEXT NOT NULL, wurcs TEXT NOT NULL, PRIMARY KEY (residue, wurcs)) WITHOUT ROWID"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._connection.commit()
+        self.database_update = self.sync_database()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, WURCS: str):
+        """
+        :param WURCS: The WURCS string of the glycan.
+        :return: The stored type of the glycan, or None if it is not stored or was stored by a different classifier.
+        """
+        row = self._connection.execute(
+            "SELECT result, fingerprint FROM results WHERE wurcs = ?", (normalise_wurcs(WURCS),)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return
+        if row[1] != self.fingerprint:
+            self.stale += 1
+            return
+        self.hits += 1
+        return row[0]
+
+    def put(self, WURCS: str, result: str):
+        """
+        Store the type of a glycan. Results are buffered and written every batch_size calls.
+
+        :param WURCS: The WURCS string of the glycan.
+        :param result: The type of the glycan.
+        """
+        key = normalise_wurcs(WURCS)
+        self._pending.append((key, result, self.fingerprint))
+        if result == "Sugar WURCS not recognised":
+            database = self.database
+            self._pending_unrecognised.extend((residue, key) for residue in get_residue_descriptors(key)
+                                              if residue not in database)
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+
+    def classify(self, WURCS: str):
+        """
+        :param WURCS: The WURCS string of the glycan.
+        :return: The stored type of the glycan, classifying and storing it if it is unseen or stale.
+        """
+        key = normalise_wurcs(WURCS)
+        result = self.get(key)
+        if result is None:
+            result = self.classify_function(key)
+            self.put(key, result)
+        return result
+
+    def commit(self):
+        """
+        Write buffered results to disk.
+        """
+        if self._pending:
+            self._connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", self._pending)
+            self._pending = []
+        if self._pending_unrecognised:
+            self._connection.executemany("INSERT OR IGNORE INTO unrecognised VALUES (?, ?)", self._pending_unrecognised)
+            self._pending_unrecognised = []
+        self._connection.commit()
+
+    def sync_database(self):
+        """
+        Bring the stored results up to date with the residue database, reclassifying only the WURCS affected by
+        residues added to, removed from or renamed in the database since the store was last synced.
+
+        WURCS with an added residue are found through the reverse index of unrecognised residues, and WURCS with a
+        removed or renamed residue by searching the stored strings.
+
+        :return: A DatabaseUpdate.
+        """
+        self.commit()
+        connection = self._connection
+        row = connection.execute("SELECT value FROM metadata WHERE key = 'database'").fetchone()
+        old_database = json.loads(row[0]) if row is not None else None
+        update = DatabaseUpdate(database_version(old_database) if old_database is not None else None,
+                                database_version(self.database))
+
+        if old_database is not None and old_database != self.database:
+            update.added = [residue for residue in self.database if residue not in old_database]
+            update.removed = [residue for residue in old_database if residue not in self.database]
+            update.renamed = [residue for residue in self.database
+                              if residue in old_database and old_database[residue] != self.database[residue]]
+            affected = set()
+            for residue in update.added:
+                affected.update(wurcs for wurcs, in connection.execute(
+                    "SELECT wurcs FROM unrecognised WHERE residue = ?", (residue,)))
+            for residue in update.removed + update.renamed:
+                affected.update(wurcs for wurcs, in connection.execute(
+                    "SELECT wurcs FROM results WHERE fingerprint = ? AND instr(wurcs, ?) > 0",
+                    (self.fingerprint, f"[{residue}]")))
+
+            for wurcs in sorted(affected):
+                row = connection.execute("SELECT result FROM results WHERE wurcs = ? AND fingerprint = ?",
+                                         (wurcs, self.fingerprint)).fetchone()
+                connection.execute("DELETE FROM unrecognised WHERE wurcs = ?", (wurcs,))
+                if row is None:
+                    continue
+                result = self.classify_function(wurcs)
+                update.record(row[0], result)
+                self.put(wurcs, result)
+
+        connection.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                               [("database", json.dumps(self.database)), ("database_version", update.new_version)])
+        self.commit()
+        return update
+
+    def close(self):
+        """
+        Write buffered results and close the database.
+        """
+        self.commit()
+        self._connection.close()
+
+    def __len__(self):
+        self.commit()
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def format_stats(self):
+        """
+        :return: The store counters as a single human readable line.
+        """
+        return f"Store: {self.hits} reused, {self.misses} new, {self.stale} reclassified after a classifier change"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="classification_store",
+        description="""Reclassify the stored results affected by changes to the residue database, and report how
+        many changed."""
+    )
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Path to the SQLite store")
+
+    args = parser.parse_args()
+
+    with ClassificationStore(args.store) as store:
+        print(store.database_update.format())
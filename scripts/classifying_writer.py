@@ -0,0 +1,188 @@
+# Classify the rows extracted by privateer_wurcs.py as they are written, so the crawl produces one output with a
+# Results column instead of a CSV that process_wurcs.py has to read back and write again.
+# python privateer_wurcs.py -d pdb_directory -o output.csv --classify
+
+import queue
+import threading
+from classification_cache import ClassificationCache
+from glycan_tree_type_identifier import RESULT_COLUMNS, check_type, classify_glycan
+from process_wurcs import Quarantine
+from wurcs_writer import OUTPUT_COLUMNS
+import stage_profiler
+
+def classify_records(records, cache: ClassificationCache, details: bool = False, quarantine: Quarantine = None,
+                     first_row: int = 1):
+    """
+    Pipeline stage that appends the type of each glycan to its (FileName, TSChainId, ID, WURCS) record.
+
+    :param records: Iterable of records, with the WURCS string last.
+    :param cache: ClassificationCache that classifies the WURCS strings, with classify_glycan if details is True.
+    :param details: Append the RESULT_COLUMNS of the GlycanResult of each record instead of its type.
+    :param quarantine: Optional Quarantine for records that cannot be classified, which are then left out. Without
+        one, the first such record raises.
+    :param first_row: Number of the first record, for the quarantine.
+    :return: Generator of the records with the result appended, as tuples.
+    """
+    classify = cache.classify
+    for row_number, record in enumerate(records, first_row):
+        try:
+            result = classify(record[-1])
+        except Exception as error:
+            if quarantine is None:
+                raise
+            quarantine.add(row_number, list(record), error)
+            continue
+        yield tuple(record) + (tuple(result.to_row()) if details else (result,))
+
+def classified_columns(details: bool = False):
+    """
+    :param details: Whether the RESULT_COLUMNS of each GlycanResult are written instead of its type.
+    :return: The columns of the output of classify_records.
+    """
+    return OUTPUT_COLUMNS + (list(RESULT_COLUMNS) if details else ["Results"])
+
+class ClassifyingWriter:
+    """
+    Writer with the interface of WurcsWriter that classifies each row before passing it on to another writer.
+
+    Rows are handed to a classification thread through a bounded queue, so classifying the rows of one PDB file
+    overlaps with extracting the next, and extraction blocks once queue_size batches are waiting. Rows only count
+    as written once the wrapped writer has written them, so buffered_rows includes the queued rows. With
+    profiling enabled, rows are classified as they are written, as the StageProfiler is not thread safe. Once a
+    batch fails, it and every later batch are left unwritten and stay counted in buffered_rows, so files whose rows
+    were lost are never taken as written.
+
+    :param writer: WurcsWriter with the columns of classified_columns(details).
+    :param cache_size: Number of distinct WURCS results to keep in memory.
+    :param details: Write the RESULT_COLUMNS of the GlycanResult of each row instead of its type.
+    :param queue_size: Number of batches of rows, one per write_rows call, that may wait to be classified.
+    :param quarantine: Quarantine for rows that cannot be classified, closed with the writer. Without one, such a
+        row raises from the next write_rows, flush or close, so rows are never left out of the output unrecorded.
+    """
+    def __init__(self, writer, cache_size: int = 100000, details: bool = False, queue_size: int = 64,
+                 quarantine: Quarantine = None):
+        self.writer = writer
+        self.details = details
+        self.cache = ClassificationCache(cache_size, classify=classify_glycan if details else check_type,
+                                         canonical=True)
+        self.quarantine = quarantine
+        self.rows_received = 0
+        self._lock = threading.Lock()
+        self._queued_rows = 0
+        self._error = None
+        self._failed = False
+        self._queue = None
+        self._thread = None
+        if stage_profiler.active is None:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._classify_queued, name="classifying-writer", daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An error already on its way out is not hidden behind the failure it caused
+        self._close(raise_failure=exc_type is None)
+
+    @property
+    def rows_written(self):
+        return self.writer.rows_written
+
+    @property
+    def buffered_rows(self):
+        """
+        :return: Number of rows waiting to be classified or written, or that never will be as an earlier batch failed.
+        """
+        return self._queued_rows + self.writer.buffered_rows
+
+    def _write(self, rows, first_row):
+        classified = list(classify_records(rows, self.cache, self.details, self.quarantine, first_row))
+        with self._lock:
+            self.writer.write_rows(classified)
+
+    def _classify_queued(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                rows, first_row = batch
+                if not self._failed:
+                    self._write(rows, first_row)
+                    # Only counted as written once the wrapped writer has the rows, so the count never falls short
+                    with self._lock:
+                        self._queued_rows -= len(rows)
+            except BaseException as error:
+                self._failed = True
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write_rows(self, rows):
+        """
+        Queue rows to be classified and written, waiting if the queue is full.
+
+        :param rows: List of (FileName, TSChainId, ID, WURCS) tuples.
+        :raises TooManyErrors: If the quarantine has reached its max_errors, possibly on an earlier batch. Without a
+            quarantine, the error of a row that could not be classified is raised instead.
+        """
+        self._raise_error()
+        rows = list(rows)
+        first_row = self.rows_received + 1
+        self.rows_received += len(rows)
+        with self._lock:
+            self._queued_rows += len(rows)
+        if self._queue is not None:
+            self._queue.put((rows, first_row))
+            return
+        if self._failed:
+            return
+        try:
+            self._write(rows, first_row)
+        except BaseException:
+            self._failed = True
+            raise
+        self._queued_rows -= len(rows)
+
+    def flush(self):
+        """
+        Classify and write all queued rows.
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._check_failed()
+        with self._lock:
+            self.writer.flush()
+
+    def _check_failed(self):
+        self._raise_error()
+        if self._failed:
+            raise RuntimeError(f"{self.buffered_rows} rows were not written after an earlier error")
+
+    def close(self):
+        """
+        Classify and write all queued rows, then close the wrapped writer.
+
+        :raises RuntimeError: If rows were left unwritten after an error that was already raised.
+        """
+        self._close(raise_failure=True)
+
+    def _close(self, raise_failure):
+        try:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            if raise_failure:
+                self._check_failed()
+        finally:
+            # Output that is missing rows after an error is left unpublished, if the wrapped writer publishes it
+            self.writer.close(publish=raise_failure and not self._failed)
+            if self.quarantine is not None:
+                self.quarantine.close()
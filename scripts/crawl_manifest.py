@@ -0,0 +1,157 @@
+# Checkpoint manifest for the Privateer crawl, so an interrupted or incremental run skips PDB files already processed.
+# The manifest is an append-only CSV of FileName, mtime, size, status and Privateer seconds, where the last line for a
+# file wins.
+
+import csv
+import os
+
+DONE_STATUSES = ("ok", "empty")
+MANIFEST_HEADER = ["FileName", "mtime", "size", "status", "seconds"]
+
+def manifest_key(file_path: str, root: str = None):
+    """
+    :param file_path: Path to a structure file.
+    :param root: Directory the crawl started from, or None for a flat directory.
+    :return: The path of the file relative to root, with '/' separators, or its name if root is None. For a file
+        directly in root the two are the same, so manifests of flat directories keep their keys.
+    """
+    if root is None:
+        return os.path.basename(file_path)
+    return os.path.relpath(file_path, root).replace(os.sep, "/")
+
+class CrawlManifest:
+    """
+    Record of the outcome of each PDB file processed by privateer_wurcs.py.
+
+    A manifest written before the seconds column was added is rewritten with it, keeping the last line of each file.
+
+    :param path: Path to the manifest CSV file, created if it does not exist.
+    :param root: Directory the crawl started from. Files are recorded by their manifest_key, their path relative to
+        it, so files with the same name in different subdirectories have their own entries.
+    :ivar entries: Dictionary of manifest_key to (mtime, size, status, seconds), seconds being None if not recorded.
+    """
+    def __init__(self, path: str, root: str = None):
+        self.path = path
+        self.root = root
+        self.entries = {}
+        header = None
+        if os.path.exists(path):
+            with open(path, newline='') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    seconds = row.get("seconds")
+                    self.entries[row["FileName"]] = (int(row["mtime"]), int(row["size"]), row["status"],
+                                                     float(seconds) if seconds else None)
+                header = reader.fieldnames
+        if header is not None and header != MANIFEST_HEADER:
+            self._rewrite()
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(MANIFEST_HEADER)
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def should_process(self, file_path: str, only_changed: bool = False):
+        """
+        Decide whether a PDB file needs to be run through Privateer.
+
+        By default files that finished are skipped and files that failed or timed out are retried. With
+        only_changed, files are processed only if they are new or their mtime or size has changed since they
+        were recorded, whatever their previous status.
+
+        :param file_path: Path to the PDB file.
+        :param only_changed: Compare the file against the manifest instead of retrying failures.
+        :return: True if the file should be processed.
+        """
+        entry = self.entries.get(manifest_key(file_path, self.root))
+        if entry is None:
+            return True
+        if only_changed:
+            stat = os.stat(file_path)
+            return (stat.st_mtime_ns, stat.st_size) != entry[:2]
+        return entry[2] not in DONE_STATUSES
+
+    def record(self, file_path: str, status: str, seconds: float = None):
+        """
+        Append the outcome of a PDB file to the manifest, flushing it so a crash does not lose it.
+
+        :param file_path: Path to the PDB file.
+        :param status: 'ok', 'empty', 'timeout' or 'error'.
+        :param seconds: Wall-clock seconds Privateer spent on the file, if known.
+        """
+        stat = os.stat(file_path)
+        file_name = manifest_key(file_path, self.root)
+        self.entries[file_name] = (stat.st_mtime_ns, stat.st_size, status, seconds)
+        self._writer.writerow([file_name, stat.st_mtime_ns, stat.st_size, status,
+                               f"{seconds:.3f}" if seconds is not None else ""])
+        self._file.flush()
+
+    def timings(self):
+        """
+        :return: Dictionary of manifest_key to the seconds Privateer spent on the file on its last recorded run, for
+            the files with a timing.
+        """
+        return {file_name: entry[3] for file_name, entry in self.entries.items() if entry[3] is not None}
+
+    def _rewrite(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(MANIFEST_HEADER)
+            for file_name, (mtime, size, status, seconds) in self.entries.items():
+                writer.writerow([file_name, mtime, size, status, seconds if seconds is not None else ""])
+        os.replace(temporary_path, self.path)
+
+    def close(self):
+        self._file.close()
+
+class PendingCheckpoints:
+    """
+    Outcomes of PDB files that wait to be recorded in a CrawlManifest until the rows of the files have left the
+    buffer of the writer, so a crash or a failed write cannot mark files done whose rows were never written.
+
+    :param manifest: The CrawlManifest to record the outcomes in.
+    :param writer: The writer the rows of the files are written to, with a buffered_rows count.
+    :param at_close: Only record the outcomes on flush, for output such as Parquet that cannot be read until the
+        writer has closed, however many rows are buffered.
+    """
+    def __init__(self, manifest: CrawlManifest, writer, at_close: bool = False):
+        self.manifest = manifest
+        self.writer = writer
+        self.at_close = at_close
+        self.pending = []
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, file_path: str, status: str, seconds: float = None):
+        """
+        Record the outcome of a file once no rows are buffered, along with those of the files before it, unless
+        outcomes are only recorded at close.
+
+        :param file_path: Path to the PDB file, whose rows have been passed to the writer.
+        :param status: 'ok', 'empty', 'timeout' or 'error'.
+        :param seconds: Wall-clock seconds Privateer spent on the file, if known.
+        """
+        self.pending.append((file_path, status, seconds))
+        if not self.at_close and self.writer.buffered_rows == 0:
+            self.flush()
+
+    def flush(self):
+        """
+        Record the outcome of every pending file. Only call it once the writer has written all their rows, e.g.
+        after it closed without an error.
+        """
+        for file_path, status, seconds in self.pending:
+            self.manifest.record(file_path, status, seconds)
+        self.pending.clear()
@@ -0,0 +1,113 @@
+# Size-aware ordering of the PDB files of a Privateer crawl, so the largest structures start first instead of holding
+# up the end of the run, with an estimate of the time remaining.
+# Files are estimated from the seconds recorded for them in the crawl manifest, or from their size.
+
+import os
+from crawl_manifest import manifest_key
+
+def scan_pdb_files(directory: str, suffixes=(".pdb",), recursive: bool = False):
+    """
+    List the PDB files of a directory with their sizes, from a single os.scandir pass over each directory.
+
+    :param directory: Directory of PDB files.
+    :param suffixes: File name endings of the files to list.
+    :param recursive: Also list the files in subdirectories, e.g. of a PDB mirror. Symbolic links to directories
+        are not followed.
+    :return: List of (path, size in bytes), in the order they were found.
+    """
+    files = []
+    directories = [directory]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffixes) and entry.is_file():
+                    files.append((entry.path, entry.stat().st_size))
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+    return files
+
+class CrawlSchedule:
+    """
+    Longest-first order of the files of a crawl, and the estimated time left as files finish.
+
+    The cost of a file is the seconds Privateer spent on it on a previous run if they are known, otherwise its
+    size converted to seconds at the rate of the files with known timings, or its size in bytes if there are none.
+    Handing files to workers in decreasing cost means the largest ones run alongside the many small ones, instead
+    of being left to run alone at the end. The estimate of the time left is calibrated against the time the
+    finished files actually took.
+
+    :param files: List of (path, size in bytes).
+    :param timings: Dictionary of manifest_key, as recorded in the CrawlManifest, to previous Privateer seconds.
+    :param workers: Number of files processed at once.
+    :param root: Directory the crawl started from, as given to the CrawlManifest.
+    :ivar order: Paths of the files, most costly first.
+    :ivar costs: Dictionary of path to estimated cost.
+    """
+    def __init__(self, files, timings: dict = None, workers: int = 1, root: str = None):
+        timings = timings or {}
+        self.workers = workers
+        keys = {path: manifest_key(path, root) for path, _ in files}
+        timed = [(size, timings[keys[path]]) for path, size in files if keys[path] in timings]
+        timed_bytes = sum(size for size, _ in timed)
+        # Seconds per byte, or None if the costs are left in bytes
+        self.seconds_per_byte = sum(seconds for _, seconds in timed) / timed_bytes if timed_bytes else None
+        self.costs = {}
+        for path, size in files:
+            seconds = timings.get(keys[path])
+            if seconds is None:
+                self.costs[path] = size * self.seconds_per_byte if self.seconds_per_byte is not None else size
+            else:
+                self.costs[path] = seconds
+        self.order = sorted(self.costs, key=lambda path: -self.costs[path])
+        self.remaining_cost = sum(self.costs.values())
+        self._finished = set()
+        self._next_unfinished = 0
+        self._finished_cost = 0.0
+        self._finished_seconds = 0.0
+
+    def __len__(self):
+        return len(self.order)
+
+    def finish(self, path: str, seconds: float):
+        """
+        :param path: Path of a file that finished, in any status.
+        :param seconds: Wall-clock seconds it took.
+        """
+        if path in self._finished or path not in self.costs:
+            return
+        self._finished.add(path)
+        cost = self.costs[path]
+        self.remaining_cost -= cost
+        self._finished_cost += cost
+        self._finished_seconds += seconds
+        order = self.order
+        while self._next_unfinished < len(order) and order[self._next_unfinished] in self._finished:
+            self._next_unfinished += 1
+
+    def remaining_seconds(self):
+        """
+        :return: Estimated seconds until every file has finished, or None before the first file finishes if the
+            costs are in bytes.
+        """
+        if self._next_unfinished == len(self.order):
+            return 0.0
+        if self._finished_cost:
+            rate = self._finished_seconds / self._finished_cost
+        elif self.seconds_per_byte is not None:
+            rate = 1.0
+        else:
+            return None
+        # The work is shared between the workers, but the largest file left cannot be split between them
+        largest = self.costs[self.order[self._next_unfinished]]
+        return max(max(self.remaining_cost, 0.0) / self.workers, largest) * rate
+
+    def format_remaining(self):
+        """
+        :return: The estimated time left, e.g. '1h02m', or '?' if it cannot be estimated yet.
+        """
+        seconds = self.remaining_seconds()
+        if seconds is None:
+            return "?"
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
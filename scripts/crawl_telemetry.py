@@ -0,0 +1,158 @@
+# Per-file telemetry of the Privateer crawl, as an append-only JSON Lines log written by privateer_wurcs.py, and a
+# report of the slowest structures and of the throughput over time, to choose the timeout and spot regressions.
+# python crawl_telemetry.py -i output.csv.telemetry.jsonl
+# python crawl_telemetry.py -i output.csv.telemetry.jsonl --top 50 --interval 600
+
+import argparse
+import json
+import time
+from crawl_manifest import manifest_key
+
+class TelemetryLog:
+    """
+    Append-only log of one JSON object per PDB file processed, flushed as each is recorded.
+
+    Each object has the keys run (start time of the run that processed the file), time (when it finished), file
+    (its manifest_key), outcome ('ok', 'empty', 'timeout' or 'error'), bytes (size of the file read), seconds
+    (Privateer wall-clock time), glycans (number of glycans Privateer reported), rows (rows written) and error
+    (message, or null).
+
+    :param path: Path to the log, created if it does not exist.
+    :param root: Directory the crawl started from, as given to the CrawlManifest.
+    """
+    def __init__(self, path: str, root: str = None):
+        self.path = path
+        self.root = root
+        self.run = round(time.time(), 3)
+        self._file = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, file_path: str, outcome: str, bytes_read: int, seconds: float = None, glycans: int = 0,
+               rows: int = 0, error: str = None):
+        """
+        :param file_path: Path to the PDB file.
+        :param outcome: 'ok', 'empty', 'timeout' or 'error'.
+        :param bytes_read: Size of the file in bytes.
+        :param seconds: Wall-clock seconds Privateer spent on the file, if known.
+        :param glycans: Number of glycans Privateer reported.
+        :param rows: Number of rows written to the output.
+        :param error: Error message, if the file failed.
+        """
+        self._file.write(json.dumps({
+            "run": self.run, "time": round(time.time(), 3), "file": manifest_key(file_path, self.root),
+            "outcome": outcome, "bytes": bytes_read, "seconds": round(seconds, 3) if seconds is not None else None,
+            "glycans": glycans, "rows": rows, "error": error}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def read_telemetry(path: str):
+    """
+    :param path: Path to a TelemetryLog.
+    :return: Generator of the records, as dictionaries. A line cut short by a crash is skipped.
+    """
+    with open(path) as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def slowest(records, count: int = 20):
+    """
+    :param records: Telemetry records.
+    :param count: Number of files to return.
+    :return: The count records with the longest Privateer time, slowest first.
+    """
+    timed = [record for record in records if record["seconds"] is not None]
+    timed.sort(key=lambda record: -record["seconds"])
+    return timed[:count]
+
+def percentiles(records, points=(50, 90, 99, 100)):
+    """
+    :param records: Telemetry records.
+    :param points: Percentiles to compute.
+    :return: Dictionary of percentile to the Privateer seconds below which that share of the files finished, empty
+        if no record has a time.
+    """
+    seconds = sorted(record["seconds"] for record in records if record["seconds"] is not None)
+    if not seconds:
+        return {}
+    return {point: seconds[min(len(seconds) - 1, max(0, -(-point * len(seconds) // 100) - 1))] for point in points}
+
+def throughput(records, interval: float = 3600):
+    """
+    :param records: Telemetry records.
+    :param interval: Width in seconds of the time buckets.
+    :return: List of (bucket start time, files, bytes, rows, Privateer seconds, failed files), in time order, for
+        the buckets in which files finished.
+    """
+    buckets = {}
+    for record in records:
+        start = record["time"] - record["time"] % interval
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = [0, 0, 0, 0.0, 0]
+        bucket[0] += 1
+        bucket[1] += record["bytes"]
+        bucket[2] += record["rows"]
+        bucket[3] += record["seconds"] or 0.0
+        bucket[4] += record["outcome"] in ("timeout", "error")
+    return [(start, *bucket) for start, bucket in sorted(buckets.items())]
+
+def format_report(records, top: int = 20, interval: float = 3600):
+    """
+    :param records: List of telemetry records.
+    :param top: Number of slowest files to list.
+    :param interval: Width in seconds of the throughput buckets.
+    :return: The report, with the count of each outcome, the Privateer time percentiles, the slowest files and the
+        throughput of each interval.
+    """
+    outcomes = {}
+    for record in records:
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+    lines = [f"{'outcome':<12} {'files':>10}"]
+    for outcome, count in sorted(outcomes.items(), key=lambda item: -item[1]):
+        lines.append(f"{outcome:<12} {count:>10}")
+
+    points = percentiles(records)
+    if points:
+        lines.append("")
+        lines.append("Privateer seconds: " + ", ".join(f"p{point} {seconds:.1f}" for point, seconds in points.items()))
+
+    lines.append("")
+    lines.append(f"{'slowest file':<24} {'outcome':<8} {'seconds':>10} {'MB':>8} {'glycans':>8} {'rows':>8}")
+    for record in slowest(records, top):
+        lines.append(f"{record['file']:<24} {record['outcome']:<8} {record['seconds']:>10.1f} "
+                     f"{record['bytes'] / 1e6:>8.1f} {record['glycans']:>8} {record['rows']:>8}")
+
+    lines.append("")
+    lines.append(f"{'interval':<20} {'files/min':>10} {'MB/s':>8} {'rows/min':>10} {'mean s':>8} {'failed':>7}")
+    for start, files, bytes_read, rows, seconds, failed in throughput(records, interval):
+        lines.append(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(start)):<20} {files * 60 / interval:>10.1f} "
+                     f"{bytes_read / 1e6 / interval:>8.2f} {rows * 60 / interval:>10.1f} {seconds / files:>8.1f} "
+                     f"{failed:>7}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="crawl_telemetry",
+        description="""Report the slowest structures and the throughput over time of Privateer crawls."""
+    )
+    parser.add_argument("-i", "--input", required=True, help="Path to the telemetry log written by privateer_wurcs.py")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest files to list")
+    parser.add_argument("--interval", type=float, default=3600, help="Seconds per throughput interval")
+    parser.add_argument("--last-run", action="store_true", help="Only report the last run in the log")
+
+    args = parser.parse_args()
+
+    records = list(read_telemetry(args.input))
+    if args.last_run and records:
+        records = [record for record in records if record["run"] == records[-1]["run"]]
+    print(format_report(records, args.top, args.interval))
@@ -0,0 +1,144 @@
+# Process pool with a wall-clock timeout per task, for running Privateer on many PDB files.
+# A task that runs past its timeout has its worker killed and replaced, so one pathological structure
+# only costs a single worker slot instead of stalling the whole crawl.
+
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+
+def _worker_loop(function, connection):
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        try:
+            result = ("ok", function(task))
+        except Exception as e:
+            result = ("error", f"{type(e).__name__}: {e}")
+        connection.send(result)
+
+class _Worker:
+    def __init__(self, context, function):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(function, child_connection), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.connection.send(task)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+class ExtractionPool:
+    """
+    Pool of worker processes that each run function on one task at a time.
+
+    :param function: The function run on each task. It must be picklable for the 'spawn' start method.
+    :param workers: Number of worker processes.
+    :param timeout: Wall-clock seconds a task may run before its worker is killed and replaced, None for no limit.
+    """
+    def __init__(self, function, workers: int = 1, timeout: float = None):
+        if workers < 1:
+            raise ValueError("At least one worker is needed")
+        self.function = function
+        self.timeout = timeout
+        self.respawned = 0
+        self._context = multiprocessing.get_context()
+        self._workers = [_Worker(self._context, function) for _ in range(workers)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _respawn(self, worker):
+        worker.kill()
+        self.respawned += 1
+        replacement = _Worker(self._context, self.function)
+        self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+    def imap_unordered(self, tasks):
+        """
+        Run function on each task, yielding results as they finish.
+
+        :param tasks: Iterable of tasks, read lazily as workers become free.
+        :return: Generator of (task, status, value, seconds) tuples, where status is 'ok' with the function's
+            return value, 'error' with the exception message, or 'timeout' with None.
+        """
+        tasks = iter(tasks)
+        finished = object()
+        idle = list(self._workers)
+        busy = {}
+        exhausted = False
+
+        while True:
+            while idle and not exhausted:
+                task = next(tasks, finished)
+                if task is finished:
+                    exhausted = True
+                    break
+                worker = idle.pop()
+                worker.submit(task)
+                busy[worker.connection] = worker
+
+            if not busy:
+                return
+
+            wait_for = None
+            if self.timeout is not None:
+                next_deadline = min(worker.started for worker in busy.values()) + self.timeout
+                wait_for = max(0.0, next_deadline - time.monotonic())
+
+            for connection in wait(list(busy), wait_for):
+                worker = busy.pop(connection)
+                task = worker.task
+                seconds = time.monotonic() - worker.started
+                try:
+                    status, value = connection.recv()
+                except (EOFError, OSError):
+                    # The worker died without replying, e.g. a segmentation fault in the extension module
+                    worker.process.join()
+                    status, value = "error", f"Worker exited with code {worker.process.exitcode}"
+                    worker = self._respawn(worker)
+                idle.append(worker)
+                yield task, status, value, seconds
+
+            if self.timeout is not None:
+                now = time.monotonic()
+                for connection, worker in list(busy.items()):
+                    if now - worker.started >= self.timeout:
+                        del busy[connection]
+                        task = worker.task
+                        seconds = now - worker.started
+                        idle.append(self._respawn(worker))
+                        yield task, "timeout", None, seconds
+
+    def close(self):
+        """
+        Stop all worker processes.
+        """
+        for worker in self._workers:
+            worker.stop()
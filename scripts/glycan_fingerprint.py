@@ -0,0 +1,193 @@
+# Canonical keys of parsed glycans, so that WURCS strings which differ only in how the glycan was written can share
+# one classification and be grouped for statistics.
+# python glycan_fingerprint.py -i output.csv -o groups.csv
+# python glycan_fingerprint.py -i output.csv --group-by topology
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import sys
+from array import array
+from glycan_tree_type_identifier import UNRECOGNISED, get_residue_index, parse_wurcs
+
+# Residues counted on their own in a composition vector, every other residue is counted as 'other'
+COMPOSITION_RESIDUES = ("NAG", "BMA", "MAN", "GAL", "FUC", "SIA")
+
+def classification_key(parsed):
+    """
+    Key of everything check_type reads from a parsed glycan: the residue code of each residue in WURCS order and
+    the donor and acceptor of each linkage.
+
+    Glycans with the same key have the same GlycanResult, so the key can stand in for the WURCS string in a cache.
+    It is the same for WURCS strings that list their unique residues in a different order, spell a residue with
+    another descriptor of the same name, or differ only in linkage carbons. Residue order is kept, as the high
+    mannose check and the choice of branch point depend on it.
+
+    :param parsed: The ParsedGlycan of the glycan.
+    :return: The key, as bytes.
+    """
+    residue_codes = parsed.residue_codes
+    order = parsed.order
+    if UNRECOGNISED in residue_codes:
+        # check_type returns "Sugar WURCS not recognised" whatever the rest of the glycan is, with its residue count
+        return b"?" + len(order).to_bytes(4, "little")
+    codes = array('h', [residue_codes[num - 1] for num in order])
+    return b"".join((len(order).to_bytes(4, "little"), codes.tobytes(), parsed.donors.tobytes(),
+                     parsed.acceptors.tobytes()))
+
+def topology_hash(parsed):
+    """
+    Hash of the tree of a glycan, from the names of its residues and which residue each is linked to.
+
+    The hash does not depend on the order of the unique residues or of the residues in the WURCS string, on the
+    letters assigned to the residues, on the order of the children of a residue, or on linkage carbons, so it
+    groups glycans with the same structure. Unlike classification_key it is not a cache key, as check_type can
+    give glycans with the same topology different types when their residues are listed in a different order.
+
+    :param parsed: The ParsedGlycan of the glycan.
+    :return: A 16 character hexadecimal hash.
+    """
+    residue_index = get_residue_index()
+    residue_codes = parsed.residue_codes
+    names = [residue_index.name(residue_codes[num - 1]) or "?" for num in parsed.order]
+    tree = parsed.tree
+    parent = tree.parent
+
+    # Canonical form of each subtree, children first, with the forms of siblings sorted
+    forms = [None] * len(names)
+    for residue in reversed(tree.preorder):
+        children = tree.children_of(residue)
+        if children:
+            forms[residue] = f"{names[residue]}({','.join(sorted(forms[child] for child in children))})"
+        else:
+            forms[residue] = names[residue]
+    roots = sorted(forms[residue] for residue in tree.preorder if parent[residue] == -1)
+    return hashlib.blake2b(";".join(roots).encode(), digest_size=8).hexdigest()
+
+def composition(parsed):
+    """
+    :param parsed: The ParsedGlycan of the glycan.
+    :return: Dictionary of residue name to the number of residues of the glycan with that name, with None for
+        residues that are not in the database.
+    """
+    residue_index = get_residue_index()
+    residue_codes = parsed.residue_codes
+    counts = {}
+    for num in parsed.order:
+        name = residue_index.name(residue_codes[num - 1])
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def composition_vector(parsed):
+    """
+    :param parsed: The ParsedGlycan of the glycan.
+    :return: Tuple of the counts of each of COMPOSITION_RESIDUES, followed by the count of all other residues.
+    """
+    counts = composition(parsed)
+    vector = [counts.pop(name, 0) for name in COMPOSITION_RESIDUES]
+    vector.append(sum(counts.values()))
+    return tuple(vector)
+
+def format_composition(vector):
+    """
+    :param vector: A composition_vector.
+    :return: The vector as a string, e.g. 'NAG2 BMA1 MAN5'.
+    """
+    return " ".join(f"{name}{count}" for name, count in zip(COMPOSITION_RESIDUES + ("other",), vector) if count)
+
+class CompositionIndex:
+    """
+    Groups of glycans by composition and by topology, with a count of the types of each group.
+
+    Each distinct WURCS string is parsed once, however many rows it appears in.
+
+    :ivar groups: Dictionary of composition vector to dictionary of topology hash to dictionary of type to count.
+    :ivar wurcs: Dictionary of WURCS string to its (composition vector, topology hash), None for a Privateer error.
+    """
+    def __init__(self):
+        self.groups = {}
+        self.wurcs = {}
+
+    def add(self, WURCS: str, result: str):
+        """
+        :param WURCS: The WURCS string of the glycan.
+        :param result: The type of the glycan.
+        :return: The (composition vector, topology hash) of the glycan, or None if it could not be parsed.
+        """
+        if WURCS in self.wurcs:
+            keys = self.wurcs[WURCS]
+        else:
+            try:
+                parsed = parse_wurcs(WURCS)
+            except (ValueError, IndexError):
+                parsed = None
+            keys = self.wurcs[WURCS] = (composition_vector(parsed), topology_hash(parsed)) if parsed else None
+        if keys is not None:
+            results = self.groups.setdefault(keys[0], {}).setdefault(keys[1], {})
+            results[result] = results.get(result, 0) + 1
+        return keys
+
+    def topologies(self, vector):
+        """
+        :param vector: A composition vector.
+        :return: Dictionary of topology hash to dictionary of type to count, for the glycans with the composition.
+        """
+        return self.groups.get(tuple(vector), {})
+
+    def summary(self, group_by: str = "composition"):
+        """
+        :param group_by: 'composition' for one group per composition, or 'topology' for one group per topology.
+        :return: List of (composition vector, topology hash or None, rows, dictionary of type to count), largest
+            group first.
+        """
+        summary = []
+        for vector, topologies in self.groups.items():
+            if group_by == "topology":
+                for topology, results in topologies.items():
+                    summary.append((vector, topology, sum(results.values()), results))
+            else:
+                results = {}
+                for topology_results in topologies.values():
+                    for result, count in topology_results.items():
+                        results[result] = results.get(result, 0) + count
+                summary.append((vector, None, sum(results.values()), results))
+        summary.sort(key=lambda group: -group[2])
+        return summary
+
+def index_csv(input_csv: str):
+    """
+    :param input_csv: Path to a CSV with WURCS and Results columns, such as the output of process_wurcs.py.
+    :return: CompositionIndex of the rows.
+    """
+    index = CompositionIndex()
+    with open(input_csv, newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        wurcs_index = header.index("WURCS")
+        results_index = header.index("Results")
+        for row in reader:
+            index.add(row[wurcs_index], row[results_index])
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="glycan_fingerprint",
+        description="""Group classified glycans by composition or topology and count the types of each group."""
+    )
+    parser.add_argument("-i", "--input_csv", required=True, help="Path to the output CSV file of process_wurcs.py")
+    parser.add_argument("-o", "--output_csv", default="-", help="Path to the CSV file of groups, or - for stdout")
+    parser.add_argument("--group-by", choices=("composition", "topology"), default="composition",
+                        help="Group glycans by composition, or by topology within each composition")
+
+    args = parser.parse_args()
+
+    summary = index_csv(args.input_csv).summary(args.group_by)
+    with (open(args.output_csv, 'w', newline='') if args.output_csv != '-'
+          else contextlib.nullcontext(sys.stdout)) as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["Composition", "Topology", "Rows", "Results"])
+        for vector, topology, rows, results in summary:
+            writer.writerow([format_composition(vector), topology or "", rows,
+                             "; ".join(f"{result}: {count}" for result, count in
+                                       sorted(results.items(), key=lambda item: -item[1]))])
@@ -0,0 +1,332 @@
+# Read-only columnar index over the classified CSV written by process_wurcs.py, memory-mapped so that lookups by
+# FileName and by result are slices of the file instead of scans of the CSV.
+# python glycan_table_index.py build -i output.csv -o output.gtix
+# python glycan_table_index.py query output.gtix --file 1abc --result Hybrid
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"GTIX0001"
+RESULTS_COLUMN = "Results"
+FILE_COLUMN = "FileName"
+
+class _StringColumn:
+    """
+    A column of strings stored as n + 1 offsets into a block of UTF-8 data.
+    """
+    __slots__ = ("offsets", "data")
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, index: int):
+        """
+        :return: The UTF-8 bytes of a value, as a memoryview of the index file.
+        """
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index: int):
+        return str(self.raw(index), "utf-8")
+
+class GlycanTableIndex:
+    """
+    Memory-mapped index of a classified glycan table, built by build_index.
+
+    Rows keep their order in the CSV. Each column is stored as offsets into a block of UTF-8 data, the results as
+    one byte codes into categories, and the rows of each FileName and of each result as sorted lists of row
+    numbers. Lookups return memoryviews of the file, so nothing is copied or parsed until a value is read.
+    Memoryviews returned by the index must be released before it is closed.
+
+    :param path: Path to the index file.
+    :ivar columns: Names of the columns of the table, including Results.
+    :ivar categories: The distinct results, indexed by their code.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._views = []
+        if bytes(self._view[:8]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a glycan table index")
+        header_length = int.from_bytes(self._view[8:16], "little")
+        header = json.loads(bytes(self._view[16:16 + header_length]))
+        if header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path} was built on a {header['byteorder']}-endian machine")
+        self._sections = header["sections"]
+        self.columns = header["columns"]
+        self.categories = header["categories"]
+        self._category_codes = {category: code for code, category in enumerate(self.categories)}
+
+        self._string_columns = {column: _StringColumn(self._section(f"{column}.offsets", 'Q'),
+                                                      self._section(f"{column}.data"))
+                                for column in self.columns if column != RESULTS_COLUMN}
+        self.codes = self._section("results.codes", 'B')
+        self._category_offsets = self._section("categories.offsets", 'Q')
+        self._category_rows = self._section("categories.rows", 'I')
+        self._file_names = _StringColumn(self._section("files.names.offsets", 'Q'), self._section("files.names.data"))
+        self._file_offsets = self._section("files.offsets", 'Q')
+        self._file_rows = self._section("files.rows", 'I')
+
+    def _section_view(self, offset, length, item_format=None):
+        view = self._view[offset:offset + length]
+        if item_format is not None:
+            view = view.cast(item_format)
+        self._views.append(view)
+        return view
+
+    def _section(self, name, item_format=None):
+        offset, length = self._sections[name]
+        return self._section_view(offset, length, item_format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def column(self, name: str):
+        """
+        :param name: Name of a column other than Results.
+        :return: The column, indexable by row number.
+        """
+        return self._string_columns[name]
+
+    def result(self, row: int):
+        return self.categories[self.codes[row]]
+
+    def row(self, row: int):
+        """
+        :param row: Row number, counted from 0 after the header of the CSV.
+        :return: Dictionary of column name to value.
+        """
+        return {column: self.result(row) if column == RESULTS_COLUMN else self._string_columns[column][row]
+                for column in self.columns}
+
+    def file_names(self):
+        """
+        :return: Generator of the distinct FileNames, in sorted order.
+        """
+        return (self._file_names[index] for index in range(len(self._file_names)))
+
+    def file_rows(self, file_name: str):
+        """
+        :param file_name: A FileName.
+        :return: memoryview of the row numbers of the file, empty if it is not in the table.
+        """
+        names = self._file_names
+        index = bisect_left(_Keys(names), file_name.encode())
+        if index == len(names) or bytes(names.raw(index)) != file_name.encode():
+            return self._file_rows[0:0]
+        return self._file_rows[self._file_offsets[index]:self._file_offsets[index + 1]]
+
+    def category_rows(self, result: str):
+        """
+        :param result: A glycan tree type, e.g. 'Hybrid'.
+        :return: memoryview of the row numbers with the result, empty if there are none.
+        """
+        code = self._category_codes.get(result)
+        if code is None:
+            return self._category_rows[0:0]
+        return self._category_rows[self._category_offsets[code]:self._category_offsets[code + 1]]
+
+    def find(self, file_name: str = None, result: str = None):
+        """
+        :param file_name: Only rows of this FileName.
+        :param result: Only rows with this result.
+        :return: Sequence of the matching row numbers, in table order.
+        """
+        if file_name is None and result is None:
+            return range(len(self))
+        if file_name is None:
+            return self.category_rows(result)
+        rows = self.file_rows(file_name)
+        if result is None:
+            return rows
+        code = self._category_codes.get(result)
+        codes = self.codes
+        return [row for row in rows if codes[row] == code]
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+class _Keys:
+    # Sequence of the UTF-8 bytes of a string column, so bisect can search it without decoding every value
+    def __init__(self, column):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, index):
+        return bytes(self.column.raw(index))
+
+def build_index(input_csv: str, index_path: str):
+    """
+    Build a GlycanTableIndex from a CSV with FileName and Results columns, such as the output of process_wurcs.py.
+
+    The CSV is read once and each column is streamed to a temporary file, so only the offsets and row numbers are
+    held in memory.
+
+    :param input_csv: Path to the classified CSV file.
+    :param index_path: Path to the index file to write.
+    :return: Number of rows indexed.
+    """
+    with open(input_csv, newline='') as infile:
+        reader = csv.reader(infile)
+        columns = next(reader)
+        for required in (FILE_COLUMN, RESULTS_COLUMN):
+            if required not in columns:
+                raise ValueError(f"{input_csv} has no {required} column")
+        file_index = columns.index(FILE_COLUMN)
+        results_index = columns.index(RESULTS_COLUMN)
+        string_indices = [index for index, column in enumerate(columns) if index != results_index]
+
+        data_files = {index: tempfile.TemporaryFile() for index in string_indices}
+        offsets = {index: array('Q', [0]) for index in string_indices}
+        codes = array('B')
+        category_codes = {}
+        category_rows = []
+        file_rows = {}
+
+        try:
+            for row_number, row in enumerate(reader):
+                for index in string_indices:
+                    value = row[index].encode()
+                    data_files[index].write(value)
+                    column_offsets = offsets[index]
+                    column_offsets.append(column_offsets[-1] + len(value))
+                code = category_codes.get(row[results_index])
+                if code is None:
+                    if len(category_codes) == 256:
+                        raise ValueError(f"{input_csv} has more than 256 distinct results")
+                    code = category_codes[row[results_index]] = len(category_codes)
+                    category_rows.append(array('I'))
+                codes.append(code)
+                category_rows[code].append(row_number)
+                rows = file_rows.get(row[file_index])
+                if rows is None:
+                    rows = file_rows[row[file_index]] = array('I')
+                rows.append(row_number)
+
+            file_names = sorted(file_rows, key=str.encode)
+            sections = [("results.codes", codes)]
+            sections += _grouped("categories", category_rows)
+            sections += _grouped("files", [file_rows[name] for name in file_names])
+            encoded_names = [name.encode() for name in file_names]
+            name_offsets = array('Q', [0])
+            for name in encoded_names:
+                name_offsets.append(name_offsets[-1] + len(name))
+            sections += [("files.names.offsets", name_offsets), ("files.names.data", b"".join(encoded_names))]
+            for index in string_indices:
+                sections += [(f"{columns[index]}.offsets", offsets[index]), (f"{columns[index]}.data", data_files[index])]
+
+            _write_index(index_path, columns, list(category_codes), sections, len(codes))
+        finally:
+            for data_file in data_files.values():
+                data_file.close()
+    return len(codes)
+
+def _grouped(name, groups):
+    group_offsets = array('Q', [0])
+    rows = array('I')
+    for group in groups:
+        rows.extend(group)
+        group_offsets.append(len(rows))
+    return [(f"{name}.offsets", group_offsets), (f"{name}.rows", rows)]
+
+def _section_length(content):
+    if isinstance(content, array):
+        return len(content) * content.itemsize
+    if isinstance(content, bytes):
+        return len(content)
+    return content.seek(0, os.SEEK_END)
+
+def _write_index(index_path, columns, categories, sections, row_count):
+    # Sections are laid out after the header at 8 byte aligned offsets, which the header records
+    header = {"byteorder": sys.byteorder, "rows": row_count, "columns": columns, "categories": categories,
+              "sections": {}}
+    header_length = 4096
+    while True:
+        offset = _align(16 + header_length)
+        for name, content in sections:
+            length = _section_length(content)
+            header["sections"][name] = [offset, length]
+            offset = _align(offset + length)
+        encoded = json.dumps(header).encode()
+        if len(encoded) <= header_length:
+            break
+        header_length = len(encoded)
+
+    temporary_path = f"{index_path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(header_length.to_bytes(8, "little"))
+        file.write(encoded.ljust(header_length))
+        for name, content in sections:
+            file.write(b"\0" * (header["sections"][name][0] - file.tell()))
+            if isinstance(content, (array, bytes)):
+                file.write(content)
+            else:
+                content.seek(0)
+                shutil.copyfileobj(content, file)
+    os.replace(temporary_path, index_path)
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="glycan_table_index",
+        description="""Index a classified glycan CSV for instant lookups by FileName and result."""
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build an index from the output CSV of process_wurcs.py")
+    build.add_argument("-i", "--input_csv", required=True, help="Path to the classified CSV file")
+    build.add_argument("-o", "--output_index", required=True, help="Path to the index file")
+
+    query = commands.add_parser("query", help="Print the rows of an index matching a FileName and/or result as CSV")
+    query.add_argument("index", help="Path to the index file")
+    query.add_argument("--file", help="Only rows of this FileName")
+    query.add_argument("--result", help="Only rows with this result, e.g. Hybrid")
+    query.add_argument("--count", action="store_true", help="Only print the number of matching rows")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Indexed {build_index(args.input_csv, args.output_index)} rows")
+    else:
+        with GlycanTableIndex(args.index) as index:
+            rows = index.find(args.file, args.result)
+            if args.count:
+                print(len(rows))
+            else:
+                writer = csv.writer(sys.stdout)
+                writer.writerow(index.columns)
+                for row in rows:
+                    values = index.row(row)
+                    writer.writerow([values[column] for column in index.columns])
+            del rows
@@ -1,57 +1,443 @@
 # Identify whether a glycan tree is high mannose, complex or hybrid.
 # python glycan_tree_type_identifier.py --wurcs "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+# python glycan_tree_type_identifier.py --file wurcs.txt
 
+import marshal
+import os
 import re
-import argparse
+from array import array
+from itertools import accumulate
 from typing import List
-import json
+import stage_profiler
 
-with open('/Users/lcs551/phd/year_1/xhpi/glycan_composition_identification/data/sugar_wurcs_database.json', 'r') as jsonfile:
-    database = json.load(jsonfile)
+# Bump whenever a change to the classification logic can change a result, so that stored results are recomputed
+CLASSIFIER_VERSION = "2"
 
-def get_unique_sugars(WURCS: str):
+DATABASE_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                                             "sugar_wurcs_database.json"))
+_COMPILED_FORMAT = 1
+
+_WURCS_REGEX = re.compile(r"\[(\S*)\]/([0-9-]*)/")
+_LINKAGE_REGEX = re.compile(r"[a-zA-Z]+[0-9]-[a-zA-Z]+[0-9]")
+
+# WURCS residue IDs are a-z, then A-Z, then two or more letters (aa, ab, ...), i.e. bijective base 52
+_RESIDUE_ID_LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_LETTER_POSITIONS = bytes.maketrans(_RESIDUE_ID_LETTERS.encode(), bytes(range(52)))
+
+# Category flags of a residue code
+IS_MANNOSE = 1  # MAN or BMA, the residues of the N-glycan core
+IS_FUCOSE = 2   # FUC or FUL, which can form a branch of its own
+IS_HEXNAC = 4   # Unsubstituted N-acetylhexosamines such as NAG
+
+UNRECOGNISED = -1  # Code of a residue that is not in the database
+
+_HEXNAC_REGEX = re.compile(r"a[12]{4}h-1[abx]_1-5_2\*NCC/3=O")
+
+class ResidueIndex:
+    """
+    The residue database compiled to small integer codes, one per residue name, with category flags.
+
+    :ivar codes: Dictionary of WURCS residue descriptor to residue code.
+    :ivar names: Residue name of each code.
+    :ivar flags: IS_MANNOSE, IS_FUCOSE and IS_HEXNAC flags of each code.
+    :ivar man_code: Code of MAN, or UNRECOGNISED if it is not in the database.
+    :ivar database: The residue database, a dictionary of WURCS residue descriptor to residue name.
+    """
+    __slots__ = ("codes", "names", "flags", "man_code", "database")
+
+    def __init__(self, database: dict):
+        self.database = database
+        name_codes = {}
+        self.codes = {}
+        self.names = []
+        self.flags = []
+        for descriptor, name in database.items():
+            code = name_codes.get(name)
+            if code is None:
+                code = name_codes[name] = len(self.names)
+                self.names.append(name)
+                self.flags.append(0)
+            if name in ("MAN", "BMA"):
+                self.flags[code] |= IS_MANNOSE
+            if name in ("FUC", "FUL"):
+                self.flags[code] |= IS_FUCOSE
+            if _HEXNAC_REGEX.fullmatch(descriptor):
+                self.flags[code] |= IS_HEXNAC
+            self.codes[descriptor] = code
+        self.man_code = name_codes.get("MAN", UNRECOGNISED)
+
+    def name(self, code: int):
+        """
+        :param code: A residue code.
+        :return: The residue name of the code, or None if it is UNRECOGNISED.
+        """
+        return self.names[code] if code != UNRECOGNISED else None
+
+    def to_compiled(self):
+        """
+        :return: The index as a tuple of builtin types, which marshal can save.
+        """
+        return self.database, self.codes, self.names, self.flags, self.man_code
+
+    @classmethod
+    def from_compiled(cls, compiled: tuple):
+        """
+        :param compiled: The output of to_compiled().
+        :return: The ResidueIndex, without rebuilding it from the database.
+        """
+        residue_index = cls.__new__(cls)
+        residue_index.database, residue_index.codes, residue_index.names, residue_index.flags, \
+            residue_index.man_code = compiled
+        return residue_index
+
+def database_version(database: dict):
+    """
+    :param database: A residue database, a dictionary of WURCS residue descriptor to residue name.
+    :return: A short hash identifying the content of the database.
+    """
+    import hashlib
+    import json
+    return hashlib.sha256(json.dumps(database, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_residue_index(database_path: str = DATABASE_PATH, compiled_path: str = None):
+    """
+    Load the residue database, from its compiled form if that is up to date with the JSON file.
+
+    The compiled form is a marshal file next to the JSON file, rebuilt when the size or modification time of the
+    JSON file changes. If it cannot be written, e.g. in a read-only install, the JSON file is loaded every time.
+
+    :param database_path: Path to the JSON residue database.
+    :param compiled_path: Path to the compiled form, by default the database path with a .marshal extension.
+    :return: A ResidueIndex.
+    """
+    if compiled_path is None:
+        compiled_path = os.path.splitext(database_path)[0] + ".marshal"
+    stat = os.stat(database_path)
+    key = (_COMPILED_FORMAT, CLASSIFIER_VERSION, marshal.version, stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(compiled_path, 'rb') as file:
+            compiled_key, compiled = marshal.loads(file.read())
+        if compiled_key == key:
+            return ResidueIndex.from_compiled(compiled)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    import json
+    with open(database_path, 'r') as jsonfile:
+        residue_index = ResidueIndex(json.load(jsonfile))
+    temporary_path = f"{compiled_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, 'wb') as file:
+            file.write(marshal.dumps((key, residue_index.to_compiled())))
+        os.replace(temporary_path, compiled_path)
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return residue_index
+
+_residue_index = None
+_residue_sections = {}
+
+def get_residue_index():
+    """
+    :return: The ResidueIndex of the residue database, loaded on first use.
+    """
+    global _residue_index
+    if _residue_index is None:
+        _residue_index = load_residue_index()
+        _residue_sections.clear()
+    return _residue_index
+
+def __getattr__(name):
+    # residue_index and database are loaded on first use, so that importing the module does not read the database
+    if name == "residue_index":
+        return get_residue_index()
+    if name == "database":
+        return get_residue_index().database
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ParsedGlycan:
+    """
+    A WURCS string tokenized once, so that check_type and the helper functions do not rescan it.
+
+    :ivar residue_codes: ResidueIndex codes of the unique residues, UNRECOGNISED where a residue is not in the database.
+    :ivar order: 1-based index into residue_codes for each residue of the glycan, in WURCS order.
+    :ivar linkages: Linkages in the format 'donor-acceptor', e.g. 'a4-b1'.
+    :ivar donors: Residue position (0 for 'a', 1 for 'b', ...) of the donor of each linkage.
+    :ivar acceptors: Residue position of the acceptor of each linkage.
+    """
+    __slots__ = ("residue_codes", "order", "linkages", "donors", "acceptors", "_tree")
+
+    def __init__(self, residue_codes: array, order: array, linkages: List[str], donors: array, acceptors: array):
+        self.residue_codes = residue_codes
+        self.order = order
+        self.linkages = linkages
+        self.donors = donors
+        self.acceptors = acceptors
+        self._tree = None
+
+    @property
+    def tree(self):
+        """
+        :return: The GlycanTree of the glycan, built on first use.
+        """
+        if self._tree is None:
+            self._tree = build_tree(len(self.order), self.donors, self.acceptors)
+        return self._tree
+
+    @property
+    def residues(self):
+        """
+        :return: Names of the unique residues, None where a residue is not in the database.
+        """
+        residue_index = get_residue_index()
+        return [residue_index.name(code) for code in self.residue_codes]
+
+    def __repr__(self):
+        return f"ParsedGlycan(residues={self.residues}, order={self.order.tolist()}, linkages={self.linkages})"
+
+def parse_wurcs(WURCS: str, residue_cache: dict = None):
+    """
+    Tokenize a WURCS string in a single pass.
+
+    :param WURCS: The WURCS string to parse, optionally wrapped in double quotes.
+    :param residue_cache: Optional dictionary of residue section to residue codes, so that repeated residue sections
+        are only looked up in the residue index once. Defaults to a module-level cache. Cached arrays are shared.
+    :return: A ParsedGlycan, or None if the WURCS string is a Privateer error.
+    :raises ValueError: If the WURCS string has no residue or order section.
+    """
+    profiler = stage_profiler.active
+    if profiler is None:
+        return _parse_wurcs(WURCS, residue_cache, None)
+    outer = profiler.switch("parse")
+    try:
+        return _parse_wurcs(WURCS, residue_cache, profiler)
+    finally:
+        # Also on a malformed string, so the time of later calls is not charged to this stage
+        profiler.switch(outer, enter=False)
+
+def _parse_wurcs(WURCS, residue_cache, profiler):
+    if 'ERROR' in WURCS:
+        return
+    match = _WURCS_REGEX.search(WURCS)
+    if match is None:
+        raise ValueError(f"Malformed WURCS string: {WURCS}")
+
+    order = array('i', map(int, match.group(2).split("-")))
+    linkages = _LINKAGE_REGEX.findall(WURCS, match.end())
+    joined = "".join(linkages)
+    if len(joined) == 5 * len(linkages):
+        # Every linkage has one-letter residue IDs, e.g. 'a4-b1', so the donor and acceptor are every 5th character
+        positions = joined.encode().translate(_LETTER_POSITIONS)
+        donors = array('i', list(positions[0::5]))
+        acceptors = array('i', list(positions[3::5]))
+    else:
+        donors = array('i')
+        acceptors = array('i')
+        for linkage in linkages:
+            donor, acceptor = linkage.split("-")
+            donors.append(residue_position(donor[:-1]))
+            acceptors.append(residue_position(acceptor[:-1]))
+
+    if profiler is not None:
+        profiler.switch("lookup")
+    section = match.group(1)
+    if residue_cache is None:
+        residue_cache = _residue_sections
+        if len(residue_cache) > 100000:
+            residue_cache.clear()
+    residue_codes = residue_cache.get(section)
+    if residue_codes is None:
+        residue_codes = residue_cache[section] = _lookup_residues(section)
+
+    return ParsedGlycan(residue_codes, order, linkages, donors, acceptors)
+
+def residue_position(residue_id: str):
+    """
+    :param residue_id: A WURCS residue ID, e.g. 'a', 'Z' or 'aa'.
+    :return: The 0-based position of the residue in the glycan.
+    """
+    position = 0
+    for letter in residue_id:
+        position = position * 52 + _RESIDUE_ID_LETTERS.index(letter) + 1
+    return position - 1
+
+def residue_id(position: int):
+    """
+    :param position: The 0-based position of a residue in the glycan.
+    :return: The WURCS residue ID of the position, e.g. 'a', 'Z' or 'aa'.
+    """
+    if 0 <= position < 52:
+        return _RESIDUE_ID_LETTERS[position]
+    letters = []
+    position += 1
+    while position:
+        position, letter = divmod(position - 1, 52)
+        letters.append(_RESIDUE_ID_LETTERS[letter])
+    return "".join(reversed(letters))
+
+def _lookup_residues(section: str):
+    codes = get_residue_index().codes
+    return array('h', [codes.get(string, UNRECOGNISED) for string in section.split("][")])
+
+def _as_parsed(WURCS):
+    if isinstance(WURCS, ParsedGlycan):
+        return WURCS
+    return parse_wurcs(WURCS)
+
+def get_unique_sugars(WURCS):
     """
     Find unique sugars in the given WURCS string.
 
-    :param WURCS: The WURCS string to search for unique sugars.
+    :param WURCS: The WURCS string, or ParsedGlycan, to search for unique sugars.
     :return: A list of sugar names corresponding to the unique sugars found in the WURCS string.
     """
-    if 'ERROR' in WURCS:
+    parsed = _as_parsed(WURCS)
+    if parsed is None:
         return
-    sugar_regex ="\[\S*\]"
-    sugars = re.findall(sugar_regex, WURCS)
-    x = sugars[0]
-    x = x.lstrip("[").rstrip("]")
-    y = x.split("][")
-
-    sugar_names = []
-
-    # Search database
-    for string in y:
-        if string in database:
-            sugar_names.append(database[string])
-        else:
-            sugar_names.append(None)
+    return parsed.residues
 
-    return sugar_names
+def get_residue_descriptors(WURCS: str):
+    """
+    :param WURCS: The WURCS string.
+    :return: The WURCS descriptors of the unique residues, e.g. ['a2122h-1b_1-5_2*NCC/3=O', 'a1122h-1b_1-5'], or
+        None if the WURCS string is a Privateer error.
+    :raises ValueError: If the WURCS string has no residue or order section.
+    """
+    if 'ERROR' in WURCS:
+        return
+    match = _WURCS_REGEX.search(WURCS)
+    if match is None:
+        raise ValueError(f"Malformed WURCS string: {WURCS}")
+    return match.group(1).split("][")
 
-def get_sugar_order(WURCS: str):
+def get_sugar_order(WURCS):
     """
-    :param WURCS: The WURCS code of the sugar molecule.
+    :param WURCS: The WURCS code, or ParsedGlycan, of the sugar molecule.
     :return: The list of sugar order. Each element represents the order of a sugar.
     """
-    order_regex = "/[0-9-]*/"
-    order = re.findall(order_regex, WURCS)[0]
-    return order.replace("/","").split("-")
+    return [str(num) for num in _as_parsed(WURCS).order]
 
-def get_linkages(WURCS: str):
+def get_linkages(WURCS):
     """
-    :param WURCS: The WURCS string from which linkages need to be extracted.
+    :param WURCS: The WURCS string, or ParsedGlycan, from which linkages need to be extracted.
     :return: A list of linkages found in the WURCS string.
     """
-    linkage_regex = "[a-z]{1}[0-9]{1}-{1}[a-z]{1}[0-9]"
-    linkages = re.findall(linkage_regex, WURCS)
-    return linkages
+    return list(_as_parsed(WURCS).linkages)
+
+class GlycanTree:
+    """
+    Adjacency-array model of a glycan, with residues identified by their 0-based position and every field a list
+    of residue positions or counts.
+
+    The children of residue i are children[child_offsets[i]:child_offsets[i + 1]], in linkage order. Residues are
+    also stored in preorder, so the residues of the subtree rooted at i are
+    preorder[position[i]:position[i] + subtree_size[i]].
+
+    :ivar parent: Parent of each residue, -1 for a root.
+    :ivar child_offsets: Offsets into children for each residue, with one extra entry at the end.
+    :ivar children: Children of all residues, grouped by parent.
+    :ivar preorder: Residues reachable from a root, in depth first order.
+    :ivar position: Index of each residue in preorder, -1 if it is not reachable from a root.
+    :ivar depth: Number of linkages between each residue and its root.
+    :ivar subtree_size: Number of residues in the subtree rooted at each residue, including itself.
+    :ivar branch_point: The first residue, in linkage order, with more than one child, or -1 if there is none.
+    """
+    __slots__ = ("parent", "child_offsets", "children", "preorder", "position", "depth", "subtree_size",
+                 "branch_point")
+
+    def __init__(self, parent, child_offsets, children, preorder, position, depth, subtree_size, branch_point):
+        self.parent = parent
+        self.child_offsets = child_offsets
+        self.children = children
+        self.preorder = preorder
+        self.position = position
+        self.depth = depth
+        self.subtree_size = subtree_size
+        self.branch_point = branch_point
+
+    def __len__(self):
+        return len(self.parent)
+
+    def children_of(self, residue: int):
+        """
+        :param residue: Position of a residue.
+        :return: Positions of the children of the residue.
+        """
+        return self.children[self.child_offsets[residue]:self.child_offsets[residue + 1]]
+
+    def subtree(self, residue: int):
+        """
+        :param residue: Position of a residue.
+        :return: Positions of the residues in the subtree rooted at the residue, in depth first order.
+        """
+        start = self.position[residue]
+        return self.preorder[start:start + self.subtree_size[residue]]
+
+    def branches(self):
+        """
+        :return: One list of residue positions per child of the branch point, or None if the glycan is unbranched.
+        """
+        if self.branch_point == -1:
+            return
+        return [self.subtree(child) for child in self.children_of(self.branch_point)]
+
+def build_tree(residue_count: int, donors: array, acceptors: array):
+    """
+    Build the GlycanTree of a glycan from its linkages, in time linear in the number of residues and linkages.
+
+    A residue keeps the first parent it is linked to, and linkages to residues outside the glycan are ignored, so
+    malformed or cyclic linkages cannot cause unbounded recursion.
+
+    :param residue_count: Number of residues in the glycan.
+    :param donors: Position of the donor residue of each linkage.
+    :param acceptors: Position of the acceptor residue of each linkage.
+    :return: A GlycanTree.
+    """
+    parent = [-1] * residue_count
+    child_counts = [0] * (residue_count + 1)
+    edges = []
+    for donor, acceptor in zip(donors, acceptors):
+        if acceptor < residue_count and donor < residue_count and parent[acceptor] == -1 and donor != acceptor:
+            parent[acceptor] = donor
+            child_counts[donor + 1] += 1
+            edges.append((donor, acceptor))
+
+    child_offsets = list(accumulate(child_counts))
+    children = [0] * len(edges)
+    filled = child_offsets[:]
+    for donor, acceptor in edges:
+        children[filled[donor]] = acceptor
+        filled[donor] += 1
+
+    # Depth first from every root, with an explicit stack so deep glycans cannot hit the recursion limit
+    preorder = []
+    position = [-1] * residue_count
+    depth = [0] * residue_count
+    stack = [residue for residue in range(residue_count - 1, -1, -1) if parent[residue] == -1]
+    while stack:
+        residue = stack.pop()
+        position[residue] = len(preorder)
+        preorder.append(residue)
+        if parent[residue] != -1:
+            depth[residue] = depth[parent[residue]] + 1
+        start = child_offsets[residue]
+        end = child_offsets[residue + 1]
+        if start != end:
+            stack.extend(reversed(children[start:end]))
+
+    subtree_size = [1] * residue_count
+    for residue in reversed(preorder):
+        if parent[residue] != -1:
+            subtree_size[parent[residue]] += subtree_size[residue]
+
+    branch_point = -1
+    for donor, _ in edges:
+        if child_offsets[donor + 1] - child_offsets[donor] > 1 and position[donor] != -1:
+            branch_point = donor
+            break
+
+    return GlycanTree(parent, child_offsets, children, preorder, position, depth, subtree_size, branch_point)
 
 def organise_linkages(linkages: List[str]):
     """
@@ -60,39 +446,19 @@ def organise_linkages(linkages: List[str]):
     :param linkages: List of linkages in the format 'donor-acceptor'.
     :return: List of branches, where each branch is a list of nodes.
     """
-    links = {}
-
+    donors = array('i')
+    acceptors = array('i')
     for linkage in linkages:
         donor, acceptor = linkage.split("-")
-        links.setdefault(donor[0], []).append(acceptor[0])
-     
-    for k, v in links.items():
-        if len(v) > 1:
-            branchpoint = k
-            break
-    else:
-        # Executed if the loop completes without a break aka there are no branches
+        donors.append(residue_position(donor.rstrip("0123456789?")))
+        acceptors.append(residue_position(acceptor.rstrip("0123456789?")))
+    if not linkages:
         return
 
-    def search(node, curr): 
-        if node not in links: 
-            curr.append(node)
-            return
-        else:
-            curr.append(node)
-        
-        for child in links[node]:
-            search(child, curr)
-            
-        return curr
-
-    branches = []
-    for node in links[branchpoint]:
-        output = []
-        search(node, output)
-        branches.append(output)
-    
-    return branches
+    branches = build_tree(max(max(donors), max(acceptors)) + 1, donors, acceptors).branches()
+    if branches is None:
+        return
+    return [[residue_id(residue) for residue in branch] for branch in branches]
 
 def branches_to_sugars(branches: List, sugar_alphabet_map: dict):
     """
@@ -119,21 +485,124 @@ def branches_to_sugars(branches: List, sugar_alphabet_map: dict):
         return "Branch error"
     return sugar_branches
 
-def check_type(WURCS: str):
+# Reason codes of a GlycanResult: the rule of check_type that decided the type of the glycan
+REASON_PRIVATEER_ERROR = "privateer_error"            # Privateer could not produce a WURCS string
+REASON_UNRECOGNISED_RESIDUE = "unrecognised_residue"  # A residue is not in the database
+REASON_NO_MANNOSE = "no_mannose"                      # No MAN or BMA residue, so there is no core
+REASON_UNBRANCHED = "unbranched"                      # No residue has more than one child
+REASON_MANNOSE_TAIL = "mannose_tail"                  # Every residue after the first mannose is a mannose
+REASON_LONE_FUCOSE = "lone_fucose"                    # Two branches, one of them a single fucose
+REASON_BRANCH_ERROR = "branch_error"                  # The branches could not be mapped to residues
+REASON_MANNOSE_ONLY_BRANCH = "mannose_only_branch"    # At least one branch of MAN residues only
+REASON_NO_MANNOSE_ONLY_BRANCH = "no_mannose_only_branch"
+
+# Column names of GlycanResult.to_row(), for tabular output
+RESULT_COLUMNS = ("Results", "Reason", "Residues", "Mannoses", "Branches", "BranchPoint", "MannoseOnlyBranches")
+
+class GlycanResult:
+    """
+    The type of a glycan with the values check_type computed on the way to it. Values of steps that were not
+    reached before the type was decided are None.
+
+    :ivar category: The type of the glycan, one of TREE_TYPES.
+    :ivar reason: The REASON_ code of the rule that decided the type.
+    :ivar residue_count: Number of residues of the glycan.
+    :ivar mannose_count: Number of MAN or BMA residues.
+    :ivar branch_count: Number of branches at the branch point.
+    :ivar branch_point: WURCS residue ID of the branch point, e.g. 'c'.
+    :ivar mannose_only_branches: Number of branches of MAN residues only.
+    """
+    __slots__ = ("category", "reason", "residue_count", "mannose_count", "branch_count", "branch_point",
+                 "mannose_only_branches")
+
+    def __init__(self, category: str, reason: str, residue_count: int = None, mannose_count: int = None,
+                 branch_count: int = None, branch_point: str = None, mannose_only_branches: int = None):
+        self.category = category
+        self.reason = reason
+        self.residue_count = residue_count
+        self.mannose_count = mannose_count
+        self.branch_count = branch_count
+        self.branch_point = branch_point
+        self.mannose_only_branches = mannose_only_branches
+
+    def __iter__(self):
+        return iter((self.category, self.reason, self.residue_count, self.mannose_count, self.branch_count,
+                     self.branch_point, self.mannose_only_branches))
+
+    def __eq__(self, other):
+        return isinstance(other, GlycanResult) and tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return "GlycanResult(" + ", ".join(f"{name}={value!r}" for name, value in zip(self.__slots__, self)) + ")"
+
+    def to_row(self):
+        """
+        :return: List of the values as strings, in the order of RESULT_COLUMNS, with '' for None.
+        """
+        return ["" if value is None else str(value) for value in self]
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        :param row: The output of to_row().
+        :return: The GlycanResult.
+        """
+        values = [None if value == "" else value for value in row]
+        for index in (2, 3, 4, 6):
+            if values[index] is not None:
+                values[index] = int(values[index])
+        return cls(*values)
+
+def check_type(WURCS):
     """
     The `check_type` method is used to determine the type of a glycan based on its WURCS string representation.
 
-    :param WURCS: The WURCS string representation of the glycan.
+    :param WURCS: The WURCS string representation of the glycan, or its ParsedGlycan.
     :return: The type of the glycan, which can be "High Mannose", "Hybrid", or "Complex".
+    :raises ValueError: If the WURCS string is malformed.
 
     """
-    sugars = get_unique_sugars(WURCS=WURCS)
-    if sugars == None:
-        return "Error producing WURCS string"
-    if any(sugar is None for sugar in sugars):
-        return "Sugar WURCS not recognised"
-    order = get_sugar_order(WURCS=WURCS)
-    sugar_list = [sugars[int(num) - 1] for num in order] # Correspond sugar names to their order
+    profiler = stage_profiler.active
+    if profiler is None:
+        return _check_type(WURCS, None).category
+    return classify_glycan(WURCS).category
+
+def classify_glycan(WURCS):
+    """
+    Classify a glycan as check_type does, keeping the reason for its type and the counts it was based on.
+
+    :param WURCS: The WURCS string representation of the glycan, or its ParsedGlycan.
+    :return: A GlycanResult.
+    :raises ValueError: If the WURCS string is malformed.
+    """
+    profiler = stage_profiler.active
+    if profiler is None:
+        return _check_type(WURCS, None)
+    outer = profiler.switch(None)
+    try:
+        result = _check_type(WURCS, profiler)
+    finally:
+        profiler.switch(outer, enter=False)
+    profiler.outcome(result.category)
+    return result
+
+def _check_type(WURCS, profiler):
+    parsed = _as_parsed(WURCS)
+    if parsed is None:
+        return GlycanResult("Error producing WURCS string", REASON_PRIVATEER_ERROR)
+    if profiler is not None:
+        profiler.switch("core")
+    residue_index = _residue_index or get_residue_index()
+    residue_codes = parsed.residue_codes
+    residue_count = len(parsed.order)
+    if UNRECOGNISED in residue_codes:
+        return GlycanResult("Sugar WURCS not recognised", REASON_UNRECOGNISED_RESIDUE, residue_count)
+    flags = residue_index.flags
+    sugar_list = [residue_codes[num - 1] for num in parsed.order] # Correspond residue codes to their order
+    sugar_flags = [flags[code] for code in sugar_list]
 
     # Check if there is a suitable glycan core: 
     # Must have MAN/BMA residue to be long enough to be considered (excludes glycan chains of just NAG or NAG, NAG)
@@ -141,82 +610,170 @@ def check_type(WURCS: str):
     
     suitable_glycan = 0
     
-    for sugar in sugar_list:
-        if sugar == 'MAN' or sugar == 'BMA':
+    for sugar_flag in sugar_flags:
+        if sugar_flag & IS_MANNOSE:
             suitable_glycan +=1            
     
     if suitable_glycan == 0:
-        return "Unsuitable core glycan"
+        return GlycanResult("Unsuitable core glycan", REASON_NO_MANNOSE, residue_count, 0)
 
-    linkages = get_linkages(WURCS=WURCS)
-    branches = organise_linkages(linkages=linkages)
+    if profiler is not None:
+        profiler.switch("tree")
+    tree = parsed.tree
+    branches = tree.branches()
 
     # The glycan must have a branch to be classified, otherwise its too short
     if branches is None:
-        return "Unsuitable core glycan"
-    
-    sugar_map = {}
-    alphabet_map = {}
-    alphabet = "abcdefghijklmnopqrstuvxyz"
+        return GlycanResult("Unsuitable core glycan", REASON_UNBRANCHED, residue_count, suitable_glycan, 0)
 
-    for index, pos in enumerate(order): 
-        pos = int(pos)
-        sugar_map[pos] = sugars[pos-1]
-        alphabet_map[alphabet[index]] = pos
-
-    sugar_alphabet_map = {}
-    for k, v in alphabet_map.items(): 
-        sugar_alphabet_map[k] = sugar_map[v]
+    if profiler is not None:
+        profiler.switch("branches")
+    branch_point = residue_id(tree.branch_point)
 
     ### Identify whether the glycan tree is high mannose or not, by seeing if any ###
     ### MAN/BMA residues are found in the list after the first MAN residue is found ###
     found_man = False
 
-    for value in sugar_list:
+    for sugar_flag in sugar_flags:
         if found_man:
-            if value != 'MAN' and value != 'BMA':
+            if not sugar_flag & IS_MANNOSE:
                 found_man = False
                 break
-        elif value == 'MAN' or value == 'BMA':
+        elif sugar_flag & IS_MANNOSE:
             found_man = True
 
     if found_man:
-        return "High Mannose"
+        return GlycanResult("High Mannose", REASON_MANNOSE_TAIL, residue_count, suitable_glycan, len(branches),
+                            branch_point)
    
-    branches = branches_to_sugars(branches=branches, sugar_alphabet_map=sugar_alphabet_map)    
+    branches = branches_to_sugars(branches=branches, sugar_alphabet_map=sugar_list)
 
     # If there is a fucose, it is counted as a branch, but the main chain might still be too short to be classified
     if len(branches) == 2:
         for branch in branches:
-            if branch == ["FUC"] or branch == ["FUL"]:
-                return "Complex"
+            if len(branch) == 1 and flags[branch[0]] & IS_FUCOSE:
+                return GlycanResult("Complex", REASON_LONE_FUCOSE, residue_count, suitable_glycan, 2, branch_point)
 
     if branches == 'Branch error':
-        return branches
+        return GlycanResult(branches, REASON_BRANCH_ERROR, residue_count, suitable_glycan, None, branch_point)
 
     # Check how many of the branches are mannose only, if any of them are, then it is a hybrid otherwise it is complex
+    man_code = residue_index.man_code
     mannose_only_branches = 0
     for branch in branches:
-        if list(set(branch)) == ["MAN"]:
+        if all(code == man_code for code in branch):
             mannose_only_branches+=1
     
     if mannose_only_branches > 0:
-        return "Hybrid"
+        return GlycanResult("Hybrid", REASON_MANNOSE_ONLY_BRANCH, residue_count, suitable_glycan, len(branches),
+                            branch_point, mannose_only_branches)
+
+    return GlycanResult("Complex", REASON_NO_MANNOSE_ONLY_BRANCH, residue_count, suitable_glycan, len(branches),
+                        branch_point, 0)
+
+TREE_TYPES = (
+    "High Mannose",
+    "Hybrid",
+    "Complex",
+    "Unsuitable core glycan",
+    "Sugar WURCS not recognised",
+    "Error producing WURCS string",
+    "Branch error",
+)
+TREE_TYPE_CODES = {label: code for code, label in enumerate(TREE_TYPES)}
+
+class TreeTypeBatch:
+    """
+    Glycan tree types of a batch of WURCS strings, as small integer codes into a label table.
+
+    The codes can be attached to a DataFrame without a Python string per row, e.g.
+    ``pd.Categorical.from_codes(batch.codes, categories=batch.labels)``.
+
+    :ivar codes: array('b') of indices into labels, one per WURCS string.
+    :ivar labels: The tree type labels, TREE_TYPES.
+    :ivar residue_counts: NumPy array of the number of residues of each glycan, if counts were requested.
+    :ivar branch_counts: NumPy array of the number of branches at the branch point of each glycan, 0 if it is
+        unbranched or could not be parsed, if counts were requested.
+    """
+    __slots__ = ("codes", "labels", "residue_counts", "branch_counts")
 
-    return "Complex"
+    def __init__(self, codes: array, residue_counts=None, branch_counts=None):
+        self.codes = codes
+        self.labels = TREE_TYPES
+        self.residue_counts = residue_counts
+        self.branch_counts = branch_counts
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index: int):
+        return self.labels[self.codes[index]]
+
+def check_types(WURCS_list, counts: bool = False):
+    """
+    Classify many WURCS strings, sharing parsing state between them.
+
+    :param WURCS_list: Sequence or iterator of WURCS strings.
+    :param counts: Also return the residue and branch counts of each glycan as NumPy columns.
+    :return: A TreeTypeBatch with one code per WURCS string.
+    :raises ValueError: If a WURCS string is malformed.
+    """
+    codes = array('b')
+    residue_counts = array('i') if counts else None
+    branch_counts = array('i') if counts else None
+    residue_cache = {}
+
+    for WURCS in WURCS_list:
+        parsed = parse_wurcs(WURCS, residue_cache)
+        if parsed is None:
+            codes.append(TREE_TYPE_CODES["Error producing WURCS string"])
+        else:
+            codes.append(TREE_TYPE_CODES[check_type(parsed)])
+        if counts:
+            if parsed is None:
+                residue_counts.append(0)
+                branch_counts.append(0)
+            else:
+                branches = parsed.tree.branches()
+                residue_counts.append(len(parsed.order))
+                branch_counts.append(len(branches) if branches else 0)
+
+    if counts:
+        import numpy as np
+        return TreeTypeBatch(codes, np.frombuffer(residue_counts, dtype=np.intc),
+                             np.frombuffer(branch_counts, dtype=np.intc))
+    return TreeTypeBatch(codes)
 
 if __name__ == "__main__":
+    import argparse
+    import sys
+
     parser = argparse.ArgumentParser(
         prog="glycan_composition_identification",
-        description="""Identify whether your glycan tree is high mannose, complex or hybrid."""
+        description="""Identify whether your glycan tree is high mannose, complex or hybrid. The type of each WURCS
+        is printed on its own line, in input order."""
+    )
+    parser.add_argument(
+        "-w",
+        "--wurcs",
+        nargs="+",
+        action="extend",
+        default=[],
+        help="One or more WURCS strings"
     )
     parser.add_argument(
-        "-w ",
-        "--wurcs"
+        "-f",
+        "--file",
+        help="File of WURCS strings, one per line, or - for stdin"
     )
 
     args = parser.parse_args()
     user_wurcs = args.wurcs
+    if args.file:
+        with (open(args.file) if args.file != "-" else sys.stdin) as file:
+            user_wurcs.extend(line.strip() for line in file if line.strip())
+    if not user_wurcs:
+        parser.error("Please provide WURCS strings with --wurcs or --file")
 
     # Test glycans
     hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
@@ -230,5 +787,16 @@ if __name__ == "__main__":
     branch_issue_2 = "WURCS=2.0/3,6,5/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-1-3/a4-b1_b4-c1_c3-d1_c6-f1_d2-e1"
     hm_linear_fucose = "WURCS=2.0/3,4,3/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1221m-1a_1-5]/1-1-2-3/a4-b1_a6-d1_b4-c1" # this was being classified as hybrid, it should return unsuitable as its too short to be classified
 
-    result = check_type(user_wurcs)
-    # print(result)
+    results = {}
+    malformed = False
+    for wurcs in user_wurcs:
+        result = results.get(wurcs)
+        if result is None:
+            try:
+                result = results[wurcs] = check_type(wurcs)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                result = results[wurcs] = "Malformed WURCS string"
+                malformed = True
+        print(result)
+    sys.exit(1 if malformed else 0)
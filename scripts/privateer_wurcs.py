@@ -1,15 +1,24 @@
+import argparse
+import functools
 import os
 import signal
+import sys
+import time
 from privateer import privateer_core as pvt
-import pandas as pd
 from tqdm import tqdm
+from extraction_pool import ExtractionPool
+from crawl_manifest import CrawlManifest, PendingCheckpoints
+from crawl_scheduler import CrawlSchedule, scan_pdb_files
+from crawl_telemetry import TelemetryLog
+from structure_files import (STRUCTURE_SUFFIXES, discard_decompressed, privateer_input, scratch_directory,
+                             select_structures, structure_name)
+from wurcs_writer import WurcsWriter, OUTPUT_COLUMNS, OUTPUT_FORMATS, part_path
+import stage_profiler
 
 directory = "/Users/lcs551/phd/year_1/xhpi/glycan_composition_identification/data"
 output_csv_file_path = "/Users/lcs551/phd/year_1/xhpi/glycan_composition_identification/data/delete_WURCS_privateer_output.csv"
-error_output_directory = "/Users/lcs551/phd/year_1/xhpi/glycan_composition_identification/data/fail_outputs"
-
-if not os.path.exists(error_output_directory):
-    os.makedirs(error_output_directory)
+# Directory for a fail_*.txt file per failed file, None to only return the error messages
+error_output_directory = None
 
 class TimeoutException(Exception):
     pass
@@ -17,81 +26,322 @@ class TimeoutException(Exception):
 def timeout_handler(signum, frame):
     raise TimeoutException()
 
-def get_sugar_id(totalWurcs_list, output_csv_file_path, file_name):
-    ids = []
-    wurcs_list = []
+def write_error(file_name, message):
+    if error_output_directory is None:
+        return message
+    error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
+    with open(error_file_path, 'w') as file:
+        file.write(message)
+    return message
+
+def get_sugar_id(totalWurcs_list, file_name):
+    """
+    :param totalWurcs_list: The lines output by pvt.print_wurcs, a header line then alternating ID and WURCS lines.
+    :param file_name: Name of the PDB file without its extension.
+    :return: A list of (FileName, TSChainId, ID, WURCS) rows.
+    """
+    rows = []
 
     for i in range(1, len(totalWurcs_list), 2):  # Start from the second line, skipping the first line
-        ids.append(totalWurcs_list[i].strip())
-        wurcs_list.append(totalWurcs_list[i + 1].strip())
-
-    df = pd.DataFrame({"ID": ids, "WURCS": wurcs_list})
-    df['TSChainId'] = df['ID'].apply(lambda x: x.split('_')[0][-1] if x.split('_')[0] else None)
-    df['FileName'] = file_name
-    df = df[['FileName', 'TSChainId', 'ID', 'WURCS']]
-    
+        sugar_id = totalWurcs_list[i].strip()
+        chain = sugar_id.split('_')[0]
+        rows.append((file_name, chain[-1] if chain else '', sugar_id, totalWurcs_list[i + 1].strip()))
+
+    return rows
+
+def write_wurcs(totalWURCS, writer, file_name):
+    """
+    Write the WURCS returned by Privateer for one PDB file.
+
+    :param totalWURCS: The output of pvt.print_wurcs for the file.
+    :param writer: The WurcsWriter that buffers rows for the output file.
+    :param file_name: Name of the PDB file without its extension.
+    :return: (status, glycans, rows, error), where status is 'ok', 'empty' if Privateer found no glycans, or
+        'error' if its output could not be read, glycans is the number of glycans in the output, rows the number of
+        rows written and error the error message or None.
+    :raises Exception: Any error of the writer, which is not specific to the file, such as a row of an earlier file
+        that a ClassifyingWriter without a quarantine could not classify.
+    """
+    totalWurcs_list = totalWURCS.splitlines()
+    if not totalWurcs_list:
+        return "empty", 0, 0, write_error(file_name, "Empty WURCS data")
+
     try:
-        df.to_csv(output_csv_file_path, mode='a', header=not os.path.exists(output_csv_file_path))
+        rows = get_sugar_id(totalWurcs_list, file_name)
     except Exception as e:
-        error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-        with open(error_file_path, 'w') as file:
-            file.write(f"CSV Write Error: {e}")
+        return "error", len(totalWurcs_list) // 2, 0, write_error(file_name, f"{e}")
+    writer.write_rows(rows)
+    return "ok", len(rows), len(rows), None
+
+def get_wurcs(file_path, writer, timeout=600, scratch=None):
+    """
+    Run Privateer on one structure file in this process and write its results.
 
-def get_wurcs(file_path, output_csv_file_path):
-    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    :param file_path: Path to the PDB or mmCIF file, optionally gzip-compressed.
+    :param writer: The WurcsWriter for the output file.
+    :param timeout: Seconds Privateer may spend on the file.
+    :param scratch: Directory a compressed file is decompressed to, see privateer_input.
+    :return: (status, seconds, glycans, rows, error) as for write_wurcs, where status may also be 'timeout' and
+        seconds is the time spent decompressing the file and running Privateer on it.
+    """
+    file_name = structure_name(file_path)
+
+    profiler = stage_profiler.active
+    if profiler is not None:
+        outer = profiler.switch("privateer")
 
     signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(600)  # 10 minutes
+    signal.alarm(timeout)  # 10 minutes by default
 
+    start = time.perf_counter()
     try:
-        totalWURCS = pvt.print_wurcs(file_path)
+        with privateer_input(file_path, scratch) as input_path:
+            totalWURCS = pvt.print_wurcs(input_path)
         signal.alarm(0)  # Disable the alarm
     except TimeoutException:
-        error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-        with open(error_file_path, 'w') as file:
-            file.write("Timeout Error: Function call took too long")
-        return
+        seconds = time.perf_counter() - start
+        error = write_error(file_name, "Timeout Error: Function call took too long")
+        status, glycans, rows = "timeout", 0, 0
     except Exception as e:
         signal.alarm(0)  # Disable the alarm
-        error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-        with open(error_file_path, 'w') as file:
-            file.write(f"{e}")
-        return
+        seconds = time.perf_counter() - start
+        status, glycans, rows, error = "error", 0, 0, write_error(file_name, f"{e}")
+    else:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.switch("write")
+        status, glycans, rows, error = write_wurcs(totalWURCS, writer, file_name)
 
-    totalWurcs_list = totalWURCS.splitlines()
-    if not totalWurcs_list:
-        error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-        with open(error_file_path, 'w') as file:
-            file.write("Empty WURCS data")
-        return
+    if profiler is not None:
+        profiler.switch(outer, enter=False)
+    return status, seconds, glycans, rows, error
 
-    try:
-        get_sugar_id(totalWurcs_list, output_csv_file_path, file_name)
-    except Exception as e:
-        error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-        with open(error_file_path, 'w') as file:
-            file.write(f"{e}")
+def run_privateer(file_path, scratch=None):
+    # Module level so that worker processes can unpickle it under any start method
+    with privateer_input(file_path, scratch) as input_path:
+        return pvt.print_wurcs(input_path)
+
+def get_wurcs_parallel(file_paths, writer, workers, timeout=600, scratch=None):
+    """
+    Run Privateer on many structure files in a pool of worker processes, writing results as each file finishes.
+
+    Each file has its own wall-clock timeout. A worker that runs past it is killed and replaced, so a single
+    pathological structure does not hold up the rest of the crawl.
+
+    :param file_paths: Paths to the PDB or mmCIF files, optionally gzip-compressed.
+    :param writer: The WurcsWriter for the output file, written to by this process only.
+    :param workers: Number of worker processes.
+    :param timeout: Seconds Privateer may spend on one file.
+    :param scratch: Directory compressed files are decompressed to by the workers, see privateer_input.
+    :return: Generator of (file_path, status, seconds, glycans, rows, error) as files finish, as for get_wurcs, where
+        seconds is the time the worker spent on the file.
+    """
+    profiler = stage_profiler.active
+    with ExtractionPool(functools.partial(run_privateer, scratch=scratch), workers=workers, timeout=timeout) as pool:
+        for file_path, status, value, seconds in pool.imap_unordered(file_paths):
+            file_name = structure_name(file_path)
+            if status != "ok" and scratch is not None:
+                # A killed worker leaves its decompressed copy behind
+                discard_decompressed(file_path, scratch)
+            if profiler is not None:
+                # Time spent by the worker process, so the stage shares add up to more than the wall-clock time
+                profiler.add("privateer", int(seconds * 1e9))
+                outer = profiler.switch("write")
+            if status == "timeout":
+                glycans, rows, error = 0, 0, write_error(file_name, "Timeout Error: Function call took too long")
+            elif status == "error":
+                glycans, rows, error = 0, 0, write_error(file_name, value)
+            else:
+                status, glycans, rows, error = write_wurcs(value, writer, file_name)
+            if profiler is not None:
+                profiler.switch(outer, enter=False)
+            yield file_path, status, seconds, glycans, rows, error
 
 if __name__ == "__main__":
-    # List all files in the directory with a ".pdb" extension
-    pdb_files = [f for f in os.listdir(directory) if f.endswith(".pdb")]
-    
+    parser = argparse.ArgumentParser(
+        prog="privateer_wurcs",
+        description="""Extract the WURCS and sugar chain IDs of the glycans in a directory of PDB or mmCIF files."""
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        default=directory,
+        help="Directory of structure files, searched recursively so that a PDB mirror can be crawled in place"
+    )
+    parser.add_argument(
+        "--suffixes",
+        nargs="+",
+        default=list(STRUCTURE_SUFFIXES),
+        help="File name endings of the structure files to process, most preferred first: of the files of a structure "
+             "in several formats or directories, only the one with the first ending is processed. Files ending in .gz "
+             "are decompressed to /dev/shm just before Privateer reads them"
+    )
+    parser.add_argument(
+        "-o",
+        "--output_csv",
+        default=output_csv_file_path,
+        help="Path to the output file, or - to write CSV to stdout, e.g. to pipe it into process_wurcs.py -i -, with "
+             "--manifest as there is no output file to keep it next to. Progress and summaries go to stderr"
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="Output file format, parquet and arrow need pyarrow. As they cannot be appended to, a run resumed from "
+             "the manifest writes its rows to a new part next to the output file, e.g. output.1.parquet, and the files "
+             "of a run are only recorded in the manifest once its part is complete"
+    )
+    parser.add_argument(
+        "--flush-rows",
+        type=int,
+        default=10000,
+        help="Number of buffered rows written to the output file at a time"
+    )
+    parser.add_argument(
+        "-e",
+        "--errors",
+        help="Directory to also write a fail_*.txt file to for each failed file. By default errors are only recorded "
+             "in the telemetry log"
+    )
+    parser.add_argument(
+        "--telemetry",
+        help="JSON Lines log of the size, Privateer time, glycan and row counts and outcome of each file, appended to "
+             "and by default next to the output CSV, or to the manifest with -o -. Report on it with crawl_telemetry.py"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes running Privateer, 1 to process files one at a time in this process"
+    )
+    parser.add_argument("--timeout", type=int, default=600, help="Seconds Privateer may spend on one file")
+    parser.add_argument(
+        "--manifest",
+        help="Checkpoint manifest of processed files, by default next to the output CSV. A rerun skips files that "
+             "finished and retries files that failed or timed out"
+    )
+    parser.add_argument(
+        "--only-changed",
+        action="store_true",
+        help="Only process files that are new or whose mtime or size changed since they were recorded in the "
+             "manifest. Rows for changed files are appended again, so keep the last rows for each FileName"
+    )
+    parser.add_argument(
+        "--order",
+        choices=("longest-first", "listdir"),
+        default="longest-first",
+        help="Order in which files are handed to Privateer: the slowest first, by their time on previous runs in the "
+             "manifest or else by size, so large structures do not hold up the end of the run, or directory order"
+    )
+    parser.add_argument(
+        "--classify",
+        action="store_true",
+        help="Classify each glycan as it is extracted and add a Results column, instead of running process_wurcs.py "
+             "on the output afterwards"
+    )
+    parser.add_argument(
+        "--details",
+        action="store_true",
+        help="With --classify, add the reason for each result and the counts it was based on as extra columns"
+    )
+    parser.add_argument(
+        "--quarantine",
+        help="With --classify, path to a CSV file for the rows whose WURCS cannot be classified, which are left out of "
+             "the output. Without it, the first such row stops the run"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time spent running Privateer, writing rows and updating the manifest, and the count of each "
+             "file status, at the end of the run"
+    )
+
+    args = parser.parse_args()
+    directory = args.directory
+    output_csv_file_path = args.output_csv
+    error_output_directory = args.errors
+    if output_csv_file_path == "-":
+        if args.format != "csv":
+            parser.error(f"{args.format} output cannot be written to stdout")
+        if args.manifest is None:
+            parser.error("-o - needs --manifest, as there is no output file to keep it next to")
+
+    if error_output_directory is not None and not os.path.exists(error_output_directory):
+        os.makedirs(error_output_directory)
+
+    # List all structure files under the directory, with their sizes
+    pdb_files, duplicates = select_structures(scan_pdb_files(directory, tuple(args.suffixes), recursive=True),
+                                              directory, tuple(args.suffixes))
+    if duplicates:
+        print(f"Skipping {len(duplicates)} files of structures also found in a preferred format or directory",
+              file=sys.stderr)
+
+    # Parquet and Arrow files cannot be appended to, so each run writes its own part
+    output_path = output_csv_file_path if args.format == "csv" else part_path(output_csv_file_path)
+    if output_path != output_csv_file_path:
+        print(f"Writing to {output_path}, as {output_csv_file_path} cannot be appended to", file=sys.stderr)
+
+    # Files are recorded by their path relative to the directory, so files of the same name in a mirror stay apart
+    manifest = CrawlManifest(args.manifest or f"{output_csv_file_path}.manifest.csv", root=directory)
+    pending = [(file_path, size) for file_path, size in pdb_files
+               if manifest.should_process(file_path, args.only_changed)]
+    print(f"Skipping {len(pdb_files) - len(pending)} files already in {manifest.path}", file=sys.stderr)
+    schedule = CrawlSchedule(pending, manifest.timings(), max(args.workers, 1), root=directory)
+    file_paths = schedule.order if args.order == "longest-first" else [file_path for file_path, _ in pending]
+    file_sizes = dict(pending)
+    log_prefix = manifest.path if output_csv_file_path == "-" else output_csv_file_path
+    telemetry = TelemetryLog(args.telemetry or f"{log_prefix}.telemetry.jsonl", root=directory)
+
     file_count = 0
 
-    with tqdm(total=len(pdb_files), desc="Processing files", unit="file") as pbar:
-        for file in pdb_files:
-            file_count += 1
-            file_name = file.replace(".pdb", "")
-            file_path = os.path.join(directory, file)
+    def record(file_path, status, seconds=None):
+        # A file is only marked as done once its rows have left the writer's buffer, so a crash cannot lose them
+        if profiler is not None:
+            profiler.outcome(status)
+            outer = profiler.switch("manifest")
+        checkpoints.add(file_path, status, seconds)
+        if profiler is not None:
+            profiler.switch(outer, enter=False)
+
+    def finish(file_path, status, seconds, glycans, rows, error, pbar):
+        record(file_path, status, seconds)
+        telemetry.record(file_path, status, file_sizes[file_path], seconds, glycans, rows, error)
+        schedule.finish(file_path, seconds)
+        pbar.set_postfix_str(f"ETA {schedule.format_remaining()}", refresh=False)
+        pbar.update(1)
 
-            try:
-                get_wurcs(file_path, output_csv_file_path)
-            except Exception as e:
-                error_file_path = os.path.join(error_output_directory, f"fail_{file_name}.txt")
-                with open(error_file_path, 'w') as file:
-                    file.write(f"{e}")
-                break
+    with stage_profiler.profile_stages(args.profile) as profiler, manifest, telemetry, scratch_directory() as scratch:
+        # Created once profiling is set up, as a ClassifyingWriter only classifies in a thread when it is not
+        if args.classify:
+            from classifying_writer import ClassifyingWriter, classified_columns
+            from process_wurcs import Quarantine
+            quarantine = Quarantine(args.quarantine, OUTPUT_COLUMNS) if args.quarantine else None
+            writer = ClassifyingWriter(WurcsWriter(output_path, output_format=args.format,
+                                                   max_rows=args.flush_rows, columns=classified_columns(args.details)),
+                                       details=args.details, quarantine=quarantine)
+        else:
+            writer = WurcsWriter(output_path, output_format=args.format, max_rows=args.flush_rows)
+        # Parquet and Arrow rows cannot be read back until the footer is written on close
+        checkpoints = PendingCheckpoints(manifest, writer, at_close=args.format != "csv")
+        # Errors of the writer are not specific to the file being processed, so they stop the run without recording
+        # it, and the files still pending are only recorded once the writer has closed without an error
+        with writer, tqdm(total=len(file_paths), desc="Processing files", unit="file") as pbar:
+            if args.workers > 1:
+                for file_path, *result in get_wurcs_parallel(file_paths, writer, args.workers, args.timeout, scratch):
+                    file_count += 1
+                    finish(file_path, *result, pbar)
+            else:
+                for file_path in file_paths:
+                    file_count += 1
+                    finish(file_path, *get_wurcs(file_path, writer, args.timeout, scratch), pbar)
+        checkpoints.flush()
 
-            pbar.update(1)
+        if profiler is not None:
+            print(profiler.format_table(), file=sys.stderr)
 
-    print(f"Processed {file_count} files")
+    # Status lines go to stderr, so they do not mix with CSV output written to stdout
+    print(f"Processed {file_count} files", file=sys.stderr)
+    if args.classify:
+        print(writer.cache.format_stats(), file=sys.stderr)
+        if writer.quarantine is not None and writer.quarantine.count:
+            print(writer.quarantine.format_summary(), file=sys.stderr)
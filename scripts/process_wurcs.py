@@ -1,29 +1,378 @@
 # Take a .csv of multiple WURCS and add result from glycan_tree_type_identified
 # python process_wurcs.py -i file.csv -o output.csv
+# Use - for stdin/stdout, e.g. cat file.csv | python process_wurcs.py -i - -o - > output.csv
 
 import argparse
+import contextlib
 import csv
-from glycan_tree_type_identifier import check_type
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+from glycan_tree_type_identifier import RESULT_COLUMNS, check_type, classify_glycan
+from classification_cache import ClassificationCache, normalise_wurcs
+from classification_store import ClassificationStore, DEFAULT_STORE_PATH
+import stage_profiler
 
-def process_csv(input_csv, output_csv):
-    with open(input_csv, 'r') as infile, open(output_csv, 'w', newline='') as outfile:
-        reader = csv.reader(infile)
-        header = next(reader, None) 
+def process_csv(input_csv, output_csv, cache_size=100000, print_cache_stats=False, store_path=None, workers=1,
+                chunk_size=5000, profile=False, details=False, quarantine_csv=None, max_errors=None):
+    """
+    Add a 'Results' column with the glycan tree type of each WURCS in the input CSV, or with details=True the
+    RESULT_COLUMNS of its GlycanResult.
 
-        wurcs_index = header.index('WURCS')
+    Rows are streamed through classify_rows, so memory use does not depend on the size of the input.
 
-        header_with_results = header + ['Results']
+    :param input_csv: Path to the input CSV file, which must have a 'WURCS' column, or '-' for stdin.
+    :param output_csv: Path to the output CSV file, or '-' for stdout.
+    :param cache_size: Number of distinct WURCS results to keep in memory, 0 to only deduplicate within a chunk.
+    :param print_cache_stats: Print the cache hit, miss and eviction counters at the end of the run.
+    :param store_path: Path to a persistent ClassificationStore, so only WURCS not classified by a previous run
+        are classified.
+    :param workers: Number of worker processes to classify with, 1 to classify in this process.
+    :param chunk_size: Number of rows read and classified at a time.
+    :param profile: Time the stages of check_type, in this process and the workers, and print a summary table at
+        the end of the run. Also enabled by GLYCAN_PROFILE=1.
+    :param details: Add the reason for each type and the counts it was based on, in one pass.
+    :param quarantine_csv: Path to a CSV file for the rows that cannot be classified, with the exception each raised.
+        Such rows are left out of the output. Without it, the first such row stops the run, so the output always
+        has one row per input row.
+    :param max_errors: With quarantine_csv, stop the run with TooManyErrors once more than this many rows could not
+        be classified, None for no limit. The rows of the chunks before it are kept in the output.
+    :return: The ClassificationCache used for the run, or None if caching was disabled.
+    :raises ValueError: If the input has no WURCS column, details are requested with a store, which only keeps the
+        type of each WURCS, max_errors is given without quarantine_csv, or, without quarantine_csv, a row cannot be
+        classified, with the number of the row.
+    :raises TooManyErrors: If more than max_errors rows could not be classified.
+    """
+    if details and store_path:
+        raise ValueError("Detailed results cannot be read from a ClassificationStore")
+    if max_errors is not None and quarantine_csv is None:
+        raise ValueError("A maximum number of errors needs a quarantine file for the rows left out")
+    store = ClassificationStore(store_path) if store_path else None
+    if store is not None and store.database_update.database_modified:
+        print(store.database_update.format(), file=sys.stderr)
+    classify = classify_glycan if details else check_type
+    cache = ClassificationCache(cache_size, classify=classify, canonical=True) if cache_size > 0 else None
+    throughput = Throughput()
 
-        writer = csv.writer(outfile)
-        writer.writerow(header_with_results) 
+    try:
+        with stage_profiler.profile_stages(profile) as profiler, _open_csv(input_csv, 'r') as infile:
+            reader = csv.reader(infile)
+            header = next(reader, None)
+            if header is None or 'WURCS' not in header:
+                raise ValueError(f"{input_csv} has no WURCS column")
+            wurcs_index = header.index('WURCS')
 
-        for row in reader:
-            wurcs_code = row[wurcs_index]
-            user_wurcs = f'"{wurcs_code}"'
+            quarantine = Quarantine(quarantine_csv, header, max_errors) if quarantine_csv is not None else None
+            with _open_csv(output_csv, 'w') as outfile, quarantine or contextlib.nullcontext():
+                writer = csv.writer(outfile)
+                writer.writerow(header + (list(RESULT_COLUMNS) if details else ['Results']))
+                try:
+                    writer.writerows(classify_rows(reader, wurcs_index, cache=cache, store=store, workers=workers,
+                                                   chunk_size=chunk_size, throughput=throughput, details=details,
+                                                   quarantine=quarantine))
+                finally:
+                    if quarantine is not None and quarantine.count:
+                        print(quarantine.format_summary(), file=sys.stderr)
+    finally:
+        if store is not None:
+            store.close()
 
-            result = check_type(user_wurcs)
-            row_with_result = row + [result]
-            writer.writerow(row_with_result)
+    if workers > 1:
+        print(throughput.format_summary(), file=sys.stderr)
+    if print_cache_stats:
+        if cache is not None:
+            print(cache.format_stats(), file=sys.stderr)
+        if store is not None:
+            print(store.format_stats(), file=sys.stderr)
+    if profiler is not None:
+        print(profiler.format_table(), file=sys.stderr)
+
+    return cache
+
+def _open_csv(path, mode):
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        # Left to translate newlines, the standard streams would add a blank line after each row on Windows and
+        # split quoted fields with newlines in them. A stream replaced by e.g. a StringIO has none to turn off
+        if hasattr(stream, "reconfigure"):
+            stream.reconfigure(newline='')
+        return contextlib.nullcontext(stream)
+    return open(path, mode, newline='')
+
+class Throughput:
+    """
+    Row and per-worker classification counters for a classify_rows run.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.classified = 0
+        self.worker_classified = {}
+        self.worker_seconds = {}
+
+    def record(self, pid, classified, seconds):
+        self.classified += classified
+        self.worker_classified[pid] = self.worker_classified.get(pid, 0) + classified
+        self.worker_seconds[pid] = self.worker_seconds.get(pid, 0.0) + seconds
+
+    def format_summary(self):
+        """
+        :return: The overall rows/s, then the distinct WURCS classified per second by each worker, one per line.
+        """
+        elapsed = time.perf_counter() - self.start
+        lines = [f"Processed {self.rows} rows in {elapsed:.1f} s ({self.rows / elapsed if elapsed else 0:.0f} rows/s), "
+                 f"{self.classified} distinct WURCS classified by {len(self.worker_classified)} workers"]
+        for pid in sorted(self.worker_classified):
+            classified = self.worker_classified[pid]
+            seconds = self.worker_seconds[pid]
+            lines.append(f"  worker {pid}: {classified} WURCS in {seconds:.1f} s "
+                         f"({classified / seconds if seconds else 0:.0f} WURCS/s)")
+        return "\n".join(lines)
+
+def _read_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+_worker_cache = None
+_worker_classify = check_type
+
+def _init_worker(cache_size, profile, details=False):
+    global _worker_cache, _worker_classify
+    _worker_classify = classify_glycan if details else check_type
+    _worker_cache = (ClassificationCache(cache_size, classify=_worker_classify, canonical=True)
+                     if cache_size > 0 else None)
+    stage_profiler.active = stage_profiler.StageProfiler() if profile else None
+
+class _RowError:
+    # Stands in for the result of a WURCS string that raised an exception, so the rest of its chunk is kept
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+def _classify_chunk(wurcs_list, classify=None):
+    start = time.perf_counter()
+    if classify is None:
+        classify = _worker_cache.classify if _worker_cache is not None else _worker_classify
+    results = []
+    append = results.append
+    for wurcs in wurcs_list:
+        # A try block costs nothing until something is raised, so isolating each WURCS is free when none fails
+        try:
+            append(classify(wurcs))
+        except Exception as error:
+            append(_RowError(error))
+    return results, os.getpid(), time.perf_counter() - start
+
+def _classify_chunk_in_worker(wurcs_list):
+    # Stage timings are sent back with each chunk, to be merged into the profiler of the main process
+    results, pid, seconds = _classify_chunk(wurcs_list)
+    profiler = stage_profiler.active
+    return results, pid, seconds, profiler.drain() if profiler is not None else None
+
+class _Completed:
+    # Stands in for an AsyncResult when a chunk is classified in this process
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+class TooManyErrors(Exception):
+    """
+    Raised when more rows fail to be classified than a Quarantine allows.
+    """
+
+class Quarantine:
+    """
+    Rows that could not be classified, each with the exception it raised, so a run can carry on without them.
+
+    :param path: Path to a CSV file to write the quarantined rows to, or None to only count them.
+    :param header: Header of the input CSV, written after the RowNumber, Error and Message columns.
+    :param max_errors: Number of rows that may be quarantined, None for no limit.
+    :ivar count: Number of rows quarantined.
+    :ivar errors: Dictionary of exception class name to the number of rows that raised it.
+    """
+    def __init__(self, path: str = None, header=(), max_errors: int = None):
+        self.path = path
+        self.max_errors = max_errors
+        self.count = 0
+        self.errors = {}
+        self._file = open(path, 'w', newline='') if path is not None else None
+        self._writer = csv.writer(self._file) if path is not None else None
+        if self._writer is not None:
+            self._writer.writerow(["RowNumber", "Error", "Message"] + list(header))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, row_number: int, row, error: Exception):
+        """
+        :param row_number: Number of the row in the input, counted from 1 after the header.
+        :param row: The row, as read from the input.
+        :param error: The exception the row raised.
+        :raises TooManyErrors: If the row takes the count past max_errors.
+        """
+        name = type(error).__name__
+        self.count += 1
+        self.errors[name] = self.errors.get(name, 0) + 1
+        if self._writer is not None:
+            self._writer.writerow([row_number, name, str(error)] + row)
+        if self.max_errors is not None and self.count > self.max_errors:
+            raise TooManyErrors(f"More than {self.max_errors} rows could not be classified, "
+                                f"the last at row {row_number}: {name}: {error}")
+
+    def format_summary(self):
+        """
+        :return: The number of quarantined rows by exception class, as a single human readable line.
+        """
+        errors = ", ".join(f"{name}: {count}" for name, count in sorted(self.errors.items(), key=lambda item: -item[1]))
+        destination = f" to {self.path}" if self.path is not None else ""
+        return f"Quarantined {self.count} rows{destination} ({errors})"
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def classify_rows(rows, wurcs_index, cache=None, store=None, workers=1, chunk_size=5000, throughput=None,
+                  details=False, quarantine=None):
+    """
+    Classify a stream of CSV rows, yielding each row with its result appended, in input order.
+
+    Rows are read chunk_size at a time and at most two chunks per worker are held at once. Each chunk only
+    classifies its distinct WURCS that are not in the store or the cache, which acts as a sliding deduplication
+    window over the most recently seen WURCS. A canonical cache, and the cache of each worker, also reuses the
+    result of an equivalent glycan written differently, found by its classification_key.
+
+    :param rows: Iterable of rows, each a list of strings.
+    :param wurcs_index: Index of the WURCS column in each row.
+    :param cache: Optional ClassificationCache of recent results, shared between chunks.
+    :param store: Optional ClassificationStore of results from previous runs.
+    :param workers: Number of worker processes to classify with, 1 to classify in this process.
+    :param chunk_size: Number of rows read and classified at a time.
+    :param throughput: Optional Throughput to record row and worker counters in.
+    :param details: Append the RESULT_COLUMNS of the GlycanResult of each row instead of its type. The cache must
+        classify with classify_glycan, and the store cannot be used.
+    :param quarantine: Optional Quarantine to move rows that cannot be classified to, e.g. a malformed WURCS or a
+        row without a WURCS column, while the other rows carry on. Without one, the first such row raises a
+        ValueError with its row number.
+    :return: Generator of rows with the glycan tree type appended.
+    :raises TooManyErrors: If the quarantine reaches its max_errors.
+    """
+    if throughput is None:
+        throughput = Throughput()
+
+    def lookup(key):
+        result = cache.get(key) if cache is not None else None
+        if result is None and store is not None:
+            result = store.get(key)
+            if result is not None and cache is not None:
+                cache.put(key, result)
+        return result
+
+    def complete(first_row, chunk, keys, results, pending_keys, pending, failed):
+        if pending is not None:
+            classified, pid, seconds, profile = pending.get()
+            throughput.record(pid, len(classified), seconds)
+            if profile is not None:
+                stage_profiler.active.merge(profile)
+            for key, result in zip(pending_keys, classified):
+                if type(result) is _RowError:
+                    failed = True
+                    continue
+                if cache is not None:
+                    cache.put(key, result)
+                if store is not None:
+                    store.put(key, result)
+            classified = dict(zip(pending_keys, classified))
+            for index, key in enumerate(keys):
+                if results[index] is None:
+                    results[index] = classified[key]
+        if failed:
+            chunk, results = _quarantine_failed(first_row, chunk, results, quarantine)
+        if details:
+            for row, result in zip(chunk, results):
+                row.extend(result.to_row())
+        else:
+            for row, result in zip(chunk, results):
+                row.append(result)
+        return chunk
+
+    worker_cache_size = cache.maxsize if cache is not None else 0
+    profile = stage_profiler.active is not None
+    with (Pool(workers, initializer=_init_worker, initargs=(worker_cache_size, profile, details))
+          if workers > 1 else contextlib.nullcontext()) as pool:
+        max_in_flight = 2 * workers if pool is not None else 1
+        in_flight = deque()
+        first_row = 1
+        for chunk in _read_chunks(rows, chunk_size):
+            throughput.rows += len(chunk)
+            try:
+                keys = [normalise_wurcs(row[wurcs_index]) for row in chunk]
+                results = [lookup(key) for key in keys]
+                failed = False
+            except IndexError:
+                keys, results = _split_short_rows(chunk, wurcs_index, lookup)
+                failed = True
+            pending_keys = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+            if not pending_keys:
+                pending = None
+            elif pool is not None:
+                pending = pool.apply_async(_classify_chunk_in_worker, (pending_keys,))
+            else:
+                # The WURCS strings already missed the cache, so only look for an equivalent glycan in it
+                classify = (cache.classify_equivalent if cache is not None
+                            else classify_glycan if details else check_type)
+                pending = _Completed(_classify_chunk(pending_keys, classify) + (None,))
+            in_flight.append((first_row, chunk, keys, results, pending_keys, pending, failed))
+            first_row += len(chunk)
+
+            if len(in_flight) >= max_in_flight:
+                yield from complete(*in_flight.popleft())
+
+        while in_flight:
+            yield from complete(*in_flight.popleft())
+
+def _split_short_rows(chunk, wurcs_index, lookup):
+    # Rows without a WURCS column get a _RowError for a result and no key
+    keys = []
+    results = []
+    for row in chunk:
+        if len(row) > wurcs_index:
+            key = normalise_wurcs(row[wurcs_index])
+            keys.append(key)
+            results.append(lookup(key))
+        else:
+            keys.append(None)
+            results.append(_RowError(IndexError(f"Row has {len(row)} columns, so no WURCS column")))
+    return keys, results
+
+def _quarantine_failed(first_row, chunk, results, quarantine):
+    # Only reached for chunks with a failed row, so the rows of other chunks are not checked one by one
+    kept_rows = []
+    kept_results = []
+    for row_number, (row, result) in enumerate(zip(chunk, results), first_row):
+        if type(result) is _RowError:
+            if quarantine is None:
+                # Whatever the row raised, it stops the run as a ValueError that says which row it was
+                raise ValueError(f"Row {row_number}: {type(result.error).__name__}: {result.error}") from result.error
+            quarantine.add(row_number, row, result.error)
+        else:
+            kept_rows.append(row)
+            kept_results.append(result)
+    return kept_rows, kept_results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -33,17 +382,77 @@ if __name__ == "__main__":
     parser.add_argument(
         "-i",
         "--input_csv",
-        help="Path to the input CSV file containing WURCS codes"
+        help="Path to the input CSV file containing WURCS codes, or - for stdin"
     )
     parser.add_argument(
         "-o",
         "--output_csv",
-        help="Path to the output CSV file with added 'Results' column"
+        help="Path to the output CSV file with added 'Results' column, or - for stdout"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=100000,
+        help="Number of distinct WURCS results to keep in memory (0 only deduplicates within a chunk)"
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print cache hits, misses and evictions at the end of the run"
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const=DEFAULT_STORE_PATH,
+        help="Reuse results from a persistent SQLite store, by default next to the residue database"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to classify rows"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Number of rows read and classified at a time"
+    )
+    parser.add_argument(
+        "--details",
+        action="store_true",
+        help="Add the reason for each result and the residue, mannose and branch counts it was based on as extra columns"
+    )
+    parser.add_argument(
+        "--quarantine",
+        help="Path to a CSV file for the rows that cannot be classified, with the exception each raised. They are "
+             "left out of the output, which otherwise stops at the first such row"
+    )
+    parser.add_argument(
+        "--max-errors",
+        type=int,
+        help="With --quarantine, stop the run once more than this many rows could not be classified (default: no "
+             "limit)"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time spent in each stage of the classifier and the count of each result it returned at the end of the run"
     )
 
     args = parser.parse_args()
+    if args.details and args.store:
+        parser.error("--details cannot be used with --store, which only keeps the type of each WURCS")
+    if args.max_errors is not None and not args.quarantine:
+        parser.error("--max-errors needs --quarantine for the rows left out of the output")
 
     if args.input_csv and args.output_csv:
-        process_csv(args.input_csv, args.output_csv)
+        try:
+            process_csv(args.input_csv, args.output_csv, cache_size=args.cache_size,
+                        print_cache_stats=args.cache_stats, store_path=args.store, workers=args.workers,
+                        chunk_size=args.chunk_size, profile=args.profile, details=args.details,
+                        quarantine_csv=args.quarantine, max_errors=args.max_errors)
+        except (ValueError, TooManyErrors) as e:
+            sys.exit(f"Error: {e}")
     else:
         print("Please provide paths to the input and output CSV files using -i/--input_csv and -o/--output_csv options.")
@@ -0,0 +1,142 @@
+# Opt-in timing of the stages of check_type and of the Privateer crawl, with counts of each outcome.
+# Enable with the profile_stages() context manager, the --profile options of process_wurcs.py and privateer_wurcs.py,
+# or by setting GLYCAN_PROFILE=1 in the environment. When disabled, the instrumented code only checks that
+# stage_profiler.active is None.
+
+import contextlib
+import os
+from time import perf_counter_ns
+
+PROFILE_ENV = "GLYCAN_PROFILE"
+
+class StageProfiler:
+    """
+    Cumulative per-stage call counts and timings, and a count of each outcome.
+
+    Instrumented code calls switch() as it moves from one stage to the next, so the time between two calls is
+    attributed to the stage switched to by the first.
+
+    :ivar stages: Dictionary of stage name to [calls, nanoseconds], in the order the stages were first entered.
+    :ivar outcomes: Dictionary of outcome, e.g. a glycan tree type, to count.
+    """
+    __slots__ = ("stages", "outcomes", "_stage", "_start")
+
+    def __init__(self):
+        self.stages = {}
+        self.outcomes = {}
+        self._stage = None
+        self._start = 0
+
+    def switch(self, stage, enter: bool = True):
+        """
+        End the current stage, if any, and start timing another.
+
+        :param stage: Name of the stage to start, or None to stop timing.
+        :param enter: Count a call of the stage. False when resuming a stage that a nested stage interrupted.
+        :return: The stage that was being timed, so it can be resumed with switch(previous, enter=False).
+        """
+        now = perf_counter_ns()
+        previous = self._stage
+        if previous is not None:
+            self.stages[previous][1] += now - self._start
+        if stage is not None:
+            counters = self.stages.get(stage)
+            if counters is None:
+                counters = self.stages[stage] = [0, 0]
+            if enter:
+                counters[0] += 1
+        self._stage = stage
+        self._start = now
+        return previous
+
+    def add(self, stage, nanoseconds: int, calls: int = 1):
+        """
+        Record time spent in a stage that was timed elsewhere, e.g. in a worker process.
+        """
+        counters = self.stages.get(stage)
+        if counters is None:
+            counters = self.stages[stage] = [0, 0]
+        counters[0] += calls
+        counters[1] += nanoseconds
+
+    def outcome(self, label):
+        self.outcomes[label] = self.outcomes.get(label, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: The counters as a picklable dictionary, which merge() adds to another profiler.
+        """
+        return {"stages": {stage: list(counters) for stage, counters in self.stages.items()},
+                "outcomes": dict(self.outcomes)}
+
+    def drain(self):
+        """
+        :return: The snapshot of the counters, which are then reset.
+        """
+        snapshot = self.snapshot()
+        self.clear()
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        """
+        :param snapshot: Counters from snapshot() or drain() of another profiler.
+        """
+        for stage, (calls, nanoseconds) in snapshot["stages"].items():
+            self.add(stage, nanoseconds, calls)
+        for label, count in snapshot["outcomes"].items():
+            self.outcomes[label] = self.outcomes.get(label, 0) + count
+
+    def clear(self):
+        self.stages = {}
+        self.outcomes = {}
+        self._stage = None
+
+    def format_table(self):
+        """
+        :return: A summary table of the stages, then of the outcomes.
+        """
+        total = sum(nanoseconds for _, nanoseconds in self.stages.values())
+        lines = [f"{'stage':<28} {'calls':>10} {'total s':>10} {'mean us':>10} {'share':>7}"]
+        for stage, (calls, nanoseconds) in self.stages.items():
+            lines.append(f"{stage:<28} {calls:>10} {nanoseconds / 1e9:>10.3f} "
+                         f"{nanoseconds / calls / 1000 if calls else 0:>10.1f} "
+                         f"{nanoseconds / total if total else 0:>7.1%}")
+        if self.outcomes:
+            lines.append(f"{'outcome':<28} {'count':>10}")
+            for label, count in sorted(self.outcomes.items(), key=lambda item: -item[1]):
+                lines.append(f"{label:<28} {count:>10}")
+        return "\n".join(lines)
+
+# The profiler that instrumented code records into, or None when profiling is disabled
+active = StageProfiler() if os.environ.get(PROFILE_ENV, "") not in ("", "0") else None
+
+def set_active(profiler):
+    """
+    Replace the active profiler, e.g. to run a test without the one enabled for the whole run by GLYCAN_PROFILE.
+
+    :param profiler: StageProfiler to record into, or None to disable profiling.
+    :return: The profiler that was active, to restore with set_active once done.
+    """
+    global active
+    previous, active = active, profiler
+    return previous
+
+@contextlib.contextmanager
+def profile_stages(enabled: bool = True):
+    """
+    Profile the code run in the context.
+
+    If a profiler is already active, e.g. from GLYCAN_PROFILE, it is used instead of a new one.
+
+    :param enabled: False to yield the active profiler, if any, without starting a new one.
+    :return: Context manager yielding the StageProfiler, or None if profiling is disabled.
+    """
+    global active
+    if active is not None or not enabled:
+        yield active
+        return
+    active = StageProfiler()
+    try:
+        yield active
+    finally:
+        active = None
@@ -0,0 +1,114 @@
+# Input structures of the Privateer crawl: PDB and mmCIF files, optionally gzip-compressed, in a mirror directory.
+# Compressed files are decompressed into a scratch directory in shared memory just before Privateer reads them, and
+# removed as soon as it is done, so the mirror can stay compressed on disk.
+
+import contextlib
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+
+# In order of preference when a structure is in the mirror in more than one format
+STRUCTURE_SUFFIXES = (".cif", ".cif.gz", ".pdb", ".pdb.gz")
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+def structure_name(file_path: str):
+    """
+    :param file_path: Path to a structure file, e.g. 'pdb/ab/1abc.cif.gz'.
+    :return: Name of the file without its compression and format extensions, e.g. '1abc'.
+    """
+    file_name = os.path.basename(file_path)
+    if file_name.endswith(".gz"):
+        file_name = file_name[:-3]
+    return os.path.splitext(file_name)[0]
+
+def select_structures(files, root: str, suffixes=STRUCTURE_SUFFIXES):
+    """
+    Keep one file of each structure, so a structure in the mirror in several formats or directories is only run
+    through Privateer once and only has one set of rows.
+
+    :param files: List of (path, size in bytes) of files under root, each ending in one of suffixes.
+    :param root: Directory the files were found in.
+    :param suffixes: File name endings, most preferred first. Of the files of one structure_name, the one with the
+        most preferred ending is kept, and of those the first by path relative to root.
+    :return: (kept, duplicates), lists of (path, size in bytes) in the order of files.
+    """
+    def preference(file):
+        path = file[0]
+        rank = next(rank for rank, suffix in enumerate(suffixes) if path.endswith(suffix))
+        return rank, os.path.relpath(path, root)
+
+    chosen = {}
+    for file in files:
+        name = structure_name(file[0])
+        if name not in chosen or preference(file) < preference(chosen[name]):
+            chosen[name] = file
+    kept_paths = {path for path, _ in chosen.values()}
+    kept = [file for file in files if file[0] in kept_paths]
+    duplicates = [file for file in files if file[0] not in kept_paths]
+    return kept, duplicates
+
+@contextlib.contextmanager
+def scratch_directory(parent: str = None):
+    """
+    Temporary directory for decompressed structures, removed with everything left in it on exit.
+
+    :param parent: Directory to create it in. By default /dev/shm, so decompressed files stay in memory, or the
+        system temporary directory where there is no writable /dev/shm.
+    :return: Context manager yielding the path of the directory.
+    """
+    if parent is None and os.access(SHARED_MEMORY_DIRECTORY, os.W_OK):
+        parent = SHARED_MEMORY_DIRECTORY
+    path = tempfile.mkdtemp(prefix="privateer_wurcs_", dir=parent)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def decompressed_path(file_path: str, scratch: str):
+    """
+    :param file_path: Path to a structure file.
+    :param scratch: Scratch directory.
+    :return: Path that privateer_input decompresses the file to, or None if it is not compressed. It is prefixed
+        with a hash of the absolute path of the file, so files of the same name in different directories do not
+        share one.
+    """
+    file_name = os.path.basename(file_path)
+    if not file_name.endswith(".gz"):
+        return None
+    digest = hashlib.blake2b(os.path.abspath(file_path).encode(), digest_size=8).hexdigest()
+    return os.path.join(scratch, f"{digest}_{file_name[:-3]}")
+
+def discard_decompressed(file_path: str, scratch: str):
+    """
+    Remove the decompressed copy of a file, if any, e.g. after its worker was killed before it could.
+    """
+    path = decompressed_path(file_path, scratch)
+    if path is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+@contextlib.contextmanager
+def privateer_input(file_path: str, scratch: str = None):
+    """
+    Path of a structure file that Privateer can read, decompressing it first if it is gzip-compressed.
+
+    :param file_path: Path to a structure file.
+    :param scratch: Scratch directory for the decompressed copy, e.g. from scratch_directory(). By default /dev/shm
+        or the system temporary directory.
+    :return: Context manager yielding the path of the file or of its decompressed copy, which is removed on exit.
+    """
+    if scratch is None:
+        scratch = SHARED_MEMORY_DIRECTORY if os.access(SHARED_MEMORY_DIRECTORY, os.W_OK) else tempfile.gettempdir()
+    path = decompressed_path(file_path, scratch)
+    if path is None:
+        yield file_path
+        return
+    try:
+        with gzip.open(file_path, 'rb') as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        yield path
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
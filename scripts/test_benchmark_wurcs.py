@@ -0,0 +1,43 @@
+import random
+import unittest
+from benchmark_wurcs import (generate_corpus, generate_glycan, compare_results, percentile, summarise,
+                             DEFAULT_TYPE_MIX)
+from glycan_tree_type_identifier import check_type, parse_wurcs
+
+class BenchmarkWurcsTest(unittest.TestCase):
+    def test_generate_corpus(self):
+        corpus = generate_corpus(1000, seed=3, duplicate_ratio=0.9)
+        self.assertEqual(len(corpus), 1000)
+        self.assertLessEqual(len(set(corpus)), 100)
+        self.assertListEqual(corpus, generate_corpus(1000, seed=3, duplicate_ratio=0.9))
+
+    def test_generate_glycan(self):
+        rng = random.Random(0)
+        expected = {"complex": "Complex", "other": "Unsuitable core glycan",
+                    "unrecognised": "Sugar WURCS not recognised", "error": "Error producing WURCS string"}
+        for kind in DEFAULT_TYPE_MIX:
+            wurcs = generate_glycan(rng, kind, max_extensions=20)
+            if kind != "error":
+                self.assertIsNotNone(parse_wurcs(wurcs).tree)
+            if kind in expected:
+                self.assertEqual(check_type(wurcs), expected[kind])
+
+    def test_percentiles(self):
+        result = summarise(2.0, 100, list(range(1000, 101000, 1000)))
+        self.assertEqual(result["calls_per_second"], 50)
+        self.assertEqual(result["p50_us"], 50)
+        self.assertEqual(result["p99_us"], 99)
+        self.assertEqual(result["max_us"], 100)
+        self.assertEqual(percentile([], 0.5), 0)
+
+    def test_compare_results(self):
+        baseline = {"benchmarks": {"parse": {"seconds": 1.0, "p50_us": 10.0, "peak_rss_kb": 1000}}}
+        current = {"benchmarks": {"parse": {"seconds": 1.5, "p50_us": 10.5, "peak_rss_kb": 1000},
+                                  "classify": {"seconds": 1.0}}}
+        rows = compare_results(baseline, current, tolerance=0.1)
+        self.assertListEqual([(row[1], row[-1]) for row in rows],
+                             [("seconds", True), ("p50_us", False), ("peak_rss_kb", False)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from classification_cache import ClassificationCache, normalise_wurcs
+
+class ClassificationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.wurcs = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        self.calls = []
+
+    def classify(self, WURCS):
+        self.calls.append(WURCS)
+        return "High Mannose"
+
+    def test_normalise_wurcs(self):
+        self.assertEqual(normalise_wurcs(f' "{self.wurcs}"\n'), self.wurcs)
+
+    def test_hits_and_misses(self):
+        cache = ClassificationCache(10, classify=self.classify)
+        self.assertEqual(cache.classify(self.wurcs), "High Mannose")
+        self.assertEqual(cache.classify(f'"{self.wurcs}"'), "High Mannose")
+        self.assertListEqual(self.calls, [self.wurcs])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 1, 0))
+
+    def test_lru_eviction(self):
+        cache = ClassificationCache(2, classify=self.classify)
+        cache.classify("a")
+        cache.classify("b")
+        cache.classify("a")
+        cache.classify("c")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_check_type_default(self):
+        cache = ClassificationCache()
+        self.assertEqual(cache.classify(self.wurcs), "High Mannose")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from classification_service import ClassificationService, LoopbackClient, ServiceClient, ServiceError
+
+class ClassificationServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        self.nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        self.service = ClassificationService(max_batch_size=64, max_delay=0.01)
+
+    async def asyncTearDown(self):
+        await self.service.stop()
+
+    async def test_loopback_batching(self):
+        await self.service.start(port=None)
+        client = LoopbackClient(self.service)
+        results = await asyncio.gather(client.classify(self.hm), client.classify(self.nag),
+                                       client.classify([self.hm, "WURCS=2.0/1,1,0/", "ERROR"]))
+        self.assertListEqual(results, ["High Mannose", "Unsuitable core glycan",
+                                       ["High Mannose", None, "Error producing WURCS string"]])
+        with self.assertRaises(ServiceError):
+            await client.classify("WURCS=2.0/1,1,0/")
+
+        metrics = await client.metrics()
+        self.assertEqual(metrics["requests"], 4)
+        self.assertEqual(metrics["wurcs"], 6)
+        self.assertEqual(metrics["batches"], 2)
+        self.assertEqual(metrics["cache"]["hits"], 1)
+
+    async def test_failed_string_in_batch(self):
+        await self.service.start(port=None)
+        client = LoopbackClient(self.service)
+        # Raises an IndexError rather than a ValueError when parsed
+        short = "WURCS=2.0/1,2,0/[a2122h-1b_1-5_2*NCC/3=O]/1-2/"
+        results = await asyncio.gather(client.classify(self.hm), client.classify(short), client.classify(self.nag),
+                                       return_exceptions=True)
+        self.assertEqual(results[0], "High Mannose")
+        self.assertIsInstance(results[1], ServiceError)
+        self.assertEqual(results[2], "Unsuitable core glycan")
+        self.assertListEqual(await client.classify([self.nag, short]), ["Unsuitable core glycan", None])
+
+    async def test_http(self):
+        port = await self.service.start(port=0)
+        client = ServiceClient(f"http://127.0.0.1:{port}")
+        result = await asyncio.to_thread(client.classify, [self.hm, self.nag])
+        self.assertListEqual(result, ["High Mannose", "Unsuitable core glycan"])
+        status, response = await self.service.handle("POST", "/classify", b"{not json")
+        self.assertEqual(status, 400)
+        status, response = await self.service.handle("GET", f"/classify?wurcs={self.nag}")
+        self.assertEqual(response["result"], "Unsuitable core glycan")
+
+    async def test_content_length(self):
+        port = await self.service.start(port=0)
+        for length, status in (("abc", b"400"), ("-5", b"400"), (str(2 ** 40), b"413")):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"POST /classify HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            self.assertEqual(response.split()[1], status)
+            if status == b"400":
+                self.assertIn(b"Invalid Content-Length", response)
+
+
+if __name__ == "__main__":
+    unittest.main()
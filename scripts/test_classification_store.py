@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from classification_store import ClassificationStore, classifier_fingerprint
+from glycan_tree_type_identifier import get_residue_descriptors
+
+class ClassificationStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "store.sqlite")
+        self.wurcs = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        self.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def classify(self, WURCS):
+        self.calls.append(WURCS)
+        return "High Mannose"
+
+    def test_reuse_across_runs(self):
+        with ClassificationStore(self.path, classify=self.classify) as store:
+            self.assertEqual(store.classify(f'"{self.wurcs}"'), "High Mannose")
+        with ClassificationStore(self.path, classify=self.classify) as store:
+            self.assertEqual(store.classify(self.wurcs), "High Mannose")
+            self.assertEqual((store.hits, store.misses), (1, 0))
+            self.assertIsNone(store.get("WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"))
+        self.assertListEqual(self.calls, [self.wurcs])
+
+    def test_fingerprint_change(self):
+        with ClassificationStore(self.path, fingerprint="old", classify=self.classify) as store:
+            store.classify(self.wurcs)
+        with ClassificationStore(self.path, fingerprint="new", classify=self.classify) as store:
+            store.classify(self.wurcs)
+            self.assertEqual(store.stale, 1)
+            self.assertEqual(len(store), 1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_database_update(self):
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        sia = "WURCS=2.0/2,2,1/[a2122h-1b_1-5_2*NCC/3=O][Aad21122h-2a_2-6_5*NGC/3=O]/1-2/a6-b2"
+        database = {"a2122h-1b_1-5_2*NCC/3=O": "NAG", "a1122h-1b_1-5": "BMA", "a1122h-1a_1-5": "MAN"}
+        results = {}
+
+        def classify(WURCS):
+            self.calls.append(WURCS)
+            residues = get_residue_descriptors(WURCS)
+            if any(residue not in database for residue in residues):
+                return "Sugar WURCS not recognised"
+            return results.get(WURCS, "Unsuitable core glycan")
+
+        with ClassificationStore(self.path, classify=classify, database=dict(database)) as store:
+            self.assertFalse(store.database_update.database_modified)
+            for wurcs in (nag, sia, self.wurcs):
+                store.classify(wurcs)
+
+        database["Aad21122h-2a_2-6_5*NGC/3=O"] = "NGC"
+        self.calls.clear()
+        with ClassificationStore(self.path, classify=classify, database=dict(database)) as store:
+            update = store.database_update
+            self.assertEqual(update.added, ["Aad21122h-2a_2-6_5*NGC/3=O"])
+            self.assertEqual((update.reclassified, update.changed), (1, 1))
+            self.assertDictEqual(update.transitions, {("Sugar WURCS not recognised", "Unsuitable core glycan"): 1})
+            self.assertEqual(store.classify(sia), "Unsuitable core glycan")
+        self.assertListEqual(self.calls, [sia])
+
+        database["a1122h-1a_1-5"] = "BMA"
+        results[self.wurcs] = "Hybrid"
+        self.calls.clear()
+        with ClassificationStore(self.path, classify=classify, database=dict(database)) as store:
+            self.assertEqual(store.database_update.renamed, ["a1122h-1a_1-5"])
+            self.assertEqual(store.get(self.wurcs), "Hybrid")
+        self.assertListEqual(self.calls, [self.wurcs])
+
+    def test_classifier_fingerprint(self):
+        self.assertEqual(classifier_fingerprint(), classifier_fingerprint())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import csv
+import os
+import tempfile
+import unittest
+from classifying_writer import ClassifyingWriter, classified_columns
+from crawl_manifest import CrawlManifest, PendingCheckpoints
+from process_wurcs import Quarantine
+from stage_profiler import profile_stages
+from wurcs_writer import WurcsWriter, OUTPUT_COLUMNS
+import stage_profiler
+
+class ClassifyingWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "output.csv")
+        hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        self.files = [[("1abc", "A", "A-NAG-1_A", hm), ("1abc", "B", "B-NAG-1_B", "WURCS=2.0/malformed")],
+                      [("2xyz", "A", "A-NAG-1_A", nag), ("2xyz", "B", "B-NAG-1_B", "ERROR")]]
+        self.expected = [["1abc", "A", "A-NAG-1_A", hm, "High Mannose"],
+                         ["2xyz", "A", "A-NAG-1_A", nag, "Unsuitable core glycan"],
+                         ["2xyz", "B", "B-NAG-1_B", "ERROR", "Error producing WURCS string"]]
+        self.addCleanup(stage_profiler.set_active, stage_profiler.set_active(None))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_files(self, **options):
+        quarantine_path = os.path.join(self.tmpdir.name, "quarantine.csv")
+        with ClassifyingWriter(WurcsWriter(self.path, columns=classified_columns(options.get("details", False))),
+                               quarantine=Quarantine(quarantine_path, OUTPUT_COLUMNS), **options) as writer:
+            for rows in self.files:
+                writer.write_rows(rows)
+            writer.flush()
+            self.assertEqual((writer.buffered_rows, writer.rows_written), (0, 3))
+            self.assertEqual(writer.quarantine.errors, {"ValueError": 1})
+        with open(self.path, newline="") as file:
+            output = list(csv.reader(file))
+        with open(quarantine_path, newline="") as file:
+            quarantined = list(csv.reader(file))
+        self.assertListEqual([row[:2] + row[3:] for row in quarantined[1:]],
+                             [["2", "ValueError", "1abc", "B", "B-NAG-1_B", "WURCS=2.0/malformed"]])
+        return output
+
+    def test_classifying_writer(self):
+        output = self.write_files(queue_size=1)
+        self.assertListEqual(output[0], OUTPUT_COLUMNS + ["Results"])
+        self.assertListEqual(output[1:], self.expected)
+
+    def test_details(self):
+        output = self.write_files(details=True)
+        self.assertListEqual(output[0][4:6], ["Results", "Reason"])
+        self.assertListEqual([row[:5] for row in output[1:]], self.expected)
+
+    def test_without_quarantine(self):
+        with self.assertRaisesRegex(ValueError, "Malformed WURCS"):
+            with ClassifyingWriter(WurcsWriter(self.path, columns=classified_columns())) as writer:
+                for rows in self.files:
+                    writer.write_rows(rows)
+
+    def test_manifest_after_deferred_error(self):
+        with CrawlManifest(os.path.join(self.tmpdir.name, "manifest.csv")) as manifest:
+            writer = ClassifyingWriter(WurcsWriter(self.path, columns=classified_columns()))
+            checkpoints = PendingCheckpoints(manifest, writer)
+            writer.write_rows(self.files[0])
+            checkpoints.add("1abc.pdb", "ok")
+            with self.assertRaisesRegex(ValueError, "Malformed WURCS"):
+                writer.flush()
+            # The rows of later files are not written either, so they stay buffered and are not checkpointed
+            writer.write_rows(self.files[1])
+            checkpoints.add("2xyz.pdb", "ok")
+            with self.assertRaises(RuntimeError):
+                writer.flush()
+            self.assertEqual((writer.buffered_rows, writer.rows_written), (4, 0))
+            with self.assertRaises(RuntimeError):
+                writer.close()
+            self.assertEqual((len(manifest), len(checkpoints)), (0, 2))
+
+    def test_profiled_without_thread(self):
+        with profile_stages() as profiler:
+            self.assertListEqual(self.write_files()[1:], self.expected)
+        self.assertEqual(profiler.outcomes["High Mannose"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
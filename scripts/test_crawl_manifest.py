@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from crawl_manifest import CrawlManifest, PendingCheckpoints
+
+class CrawlManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "manifest.csv")
+        self.files = {}
+        for name in ("1abc.pdb", "2xyz.pdb", "3def.pdb"):
+            self.files[name] = os.path.join(self.tmpdir.name, name)
+            with open(self.files[name], "w") as file:
+                file.write("ATOM\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resume_retries_failures(self):
+        with CrawlManifest(self.path) as manifest:
+            manifest.record(self.files["1abc.pdb"], "ok")
+            manifest.record(self.files["2xyz.pdb"], "timeout")
+        with CrawlManifest(self.path) as manifest:
+            self.assertEqual(len(manifest), 2)
+            self.assertFalse(manifest.should_process(self.files["1abc.pdb"]))
+            self.assertTrue(manifest.should_process(self.files["2xyz.pdb"]))
+            self.assertTrue(manifest.should_process(self.files["3def.pdb"]))
+
+    def test_only_changed(self):
+        with CrawlManifest(self.path) as manifest:
+            manifest.record(self.files["1abc.pdb"], "ok")
+            manifest.record(self.files["2xyz.pdb"], "error")
+        with open(self.files["1abc.pdb"], "a") as file:
+            file.write("HETATM\n")
+        with CrawlManifest(self.path) as manifest:
+            self.assertTrue(manifest.should_process(self.files["1abc.pdb"], only_changed=True))
+            self.assertFalse(manifest.should_process(self.files["2xyz.pdb"], only_changed=True))
+            self.assertTrue(manifest.should_process(self.files["3def.pdb"], only_changed=True))
+
+    def test_timings_and_old_manifest(self):
+        stat = os.stat(self.files["1abc.pdb"])
+        with open(self.path, "w") as file:
+            file.write(f"FileName,mtime,size,status\n1abc.pdb,{stat.st_mtime_ns},{stat.st_size},ok\n")
+        with CrawlManifest(self.path) as manifest:
+            self.assertFalse(manifest.should_process(self.files["1abc.pdb"]))
+            manifest.record(self.files["2xyz.pdb"], "ok", 12.5)
+        with CrawlManifest(self.path) as manifest:
+            self.assertDictEqual(manifest.timings(), {"2xyz.pdb": 12.5})
+            self.assertFalse(manifest.should_process(self.files["1abc.pdb"]))
+        with open(self.path) as file:
+            self.assertEqual(file.readline().strip(), "FileName,mtime,size,status,seconds")
+
+    def test_pending_checkpoints(self):
+        class Writer:
+            buffered_rows = 2
+
+        writer = Writer()
+        with CrawlManifest(self.path) as manifest:
+            checkpoints = PendingCheckpoints(manifest, writer)
+            checkpoints.add(self.files["1abc.pdb"], "ok", 1.0)
+            self.assertEqual((len(checkpoints), len(manifest)), (1, 0))
+            writer.buffered_rows = 0
+            checkpoints.add(self.files["2xyz.pdb"], "empty")
+            self.assertEqual((len(checkpoints), len(manifest)), (0, 2))
+
+            checkpoints = PendingCheckpoints(manifest, writer, at_close=True)
+            checkpoints.add(self.files["1abc.pdb"], "error")
+            self.assertEqual((len(checkpoints), manifest.entries["1abc.pdb"][2]), (1, "ok"))
+            checkpoints.flush()
+            self.assertEqual((len(checkpoints), manifest.entries["1abc.pdb"][2]), (0, "error"))
+
+
+if __name__ == "__main__":
+    unittest.main()
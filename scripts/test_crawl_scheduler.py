@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from crawl_scheduler import CrawlSchedule, scan_pdb_files
+
+class CrawlScheduleTest(unittest.TestCase):
+    def test_scan_pdb_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, size in (("1abc.pdb", 10), ("2xyz.pdb", 30), ("notes.txt", 5)):
+                with open(os.path.join(tmpdir, name), "w") as file:
+                    file.write("x" * size)
+            os.mkdir(os.path.join(tmpdir, "3def.pdb"))
+            os.mkdir(os.path.join(tmpdir, "ab"))
+            with open(os.path.join(tmpdir, "ab", "4abc.cif.gz"), "w") as file:
+                file.write("x" * 7)
+            files = sorted(scan_pdb_files(tmpdir))
+            self.assertListEqual(files, [(os.path.join(tmpdir, "1abc.pdb"), 10), (os.path.join(tmpdir, "2xyz.pdb"), 30)])
+            files = sorted(scan_pdb_files(tmpdir, (".pdb", ".cif.gz"), recursive=True))
+            self.assertListEqual([path for path, _ in files], [os.path.join(tmpdir, "1abc.pdb"),
+                                                               os.path.join(tmpdir, "2xyz.pdb"),
+                                                               os.path.join(tmpdir, "ab", "4abc.cif.gz")])
+
+    def test_longest_first_by_size(self):
+        schedule = CrawlSchedule([("a.pdb", 10), ("b.pdb", 300), ("c.pdb", 20)], workers=2)
+        self.assertListEqual(schedule.order, ["b.pdb", "c.pdb", "a.pdb"])
+        self.assertEqual(schedule.format_remaining(), "?")
+        schedule.finish("c.pdb", 2.0)
+        # 0.1 seconds per byte, and b.pdb cannot be shared between the workers
+        self.assertAlmostEqual(schedule.remaining_seconds(), 30.0)
+
+    def test_timings_override_size(self):
+        files = [("d/a.pdb", 100), ("d/b.pdb", 1000), ("d/c.pdb", 500)]
+        schedule = CrawlSchedule(files, {"a.pdb": 60.0, "b.pdb": 10.0}, workers=1)
+        # c.pdb is estimated at the 70 seconds per 1100 bytes of the files with timings
+        self.assertListEqual(schedule.order, ["d/a.pdb", "d/c.pdb", "d/b.pdb"])
+        self.assertAlmostEqual(schedule.remaining_seconds(), 70.0 + 500 * 70.0 / 1100)
+        for path in schedule.order:
+            schedule.finish(path, 1.0)
+        self.assertEqual(schedule.remaining_seconds(), 0.0)
+        self.assertEqual(schedule.format_remaining(), "0m00s")
+
+
+if __name__ == "__main__":
+    unittest.main()
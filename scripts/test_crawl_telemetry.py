@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+from crawl_telemetry import TelemetryLog, format_report, percentiles, read_telemetry, slowest, throughput
+
+class CrawlTelemetryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "telemetry.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_log_and_report(self):
+        with TelemetryLog(self.path) as log:
+            log.record("/pdb/1abc.pdb", "ok", 2000000, 3.25, glycans=4, rows=4)
+            log.record("/pdb/2xyz.pdb", "timeout", 9000000, 600.0, error="Timeout Error")
+            log.record("/pdb/3def.pdb", "empty", 1000, 0.5)
+        with open(self.path, "a") as file:
+            file.write('{"run": 1, "time"')
+        records = list(read_telemetry(self.path))
+        self.assertEqual(len(records), 3)
+        self.assertDictEqual({key: records[0][key] for key in ("file", "outcome", "bytes", "seconds", "glycans", "rows")},
+                             {"file": "1abc.pdb", "outcome": "ok", "bytes": 2000000, "seconds": 3.25, "glycans": 4,
+                              "rows": 4})
+        self.assertEqual(records[1]["error"], "Timeout Error")
+        self.assertListEqual([record["file"] for record in slowest(records, 2)], ["2xyz.pdb", "1abc.pdb"])
+        self.assertDictEqual(percentiles(records, (50, 100)), {50: 3.25, 100: 600.0})
+
+        buckets = throughput(records, interval=1e12)
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(buckets[0][1:], (3, 9001000 + 2000000, 4, 603.75, 1))
+        report = format_report(records, top=1)
+        self.assertIn("2xyz.pdb", report)
+        self.assertNotIn("3def.pdb", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import time
+import unittest
+from extraction_pool import ExtractionPool
+
+def run_task(task):
+    if task == "slow":
+        time.sleep(30)
+    if task == "fail":
+        raise RuntimeError("bad structure")
+    if task == "crash":
+        os._exit(3)
+    return task.upper()
+
+class ExtractionPoolTest(unittest.TestCase):
+    def test_results(self):
+        with ExtractionPool(run_task, workers=2, timeout=10) as pool:
+            results = sorted(pool.imap_unordered(["a", "b", "c"]))
+        self.assertListEqual([(task, status, value) for task, status, value, _ in results],
+                             [("a", "ok", "A"), ("b", "ok", "B"), ("c", "ok", "C")])
+
+    def test_timeout_kills_and_respawns(self):
+        start = time.monotonic()
+        with ExtractionPool(run_task, workers=2, timeout=0.5) as pool:
+            results = {task: (status, value) for task, status, value, _ in pool.imap_unordered(["slow", "a", "b"])}
+            self.assertEqual(pool.respawned, 1)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(results["slow"], ("timeout", None))
+        self.assertEqual(results["b"], ("ok", "B"))
+
+    def test_errors(self):
+        with ExtractionPool(run_task, workers=1) as pool:
+            results = {task: (status, value) for task, status, value, _ in pool.imap_unordered(["fail", "crash", "a"])}
+        self.assertEqual(results["fail"], ("error", "RuntimeError: bad structure"))
+        self.assertEqual(results["crash"], ("error", "Worker exited with code 3"))
+        self.assertEqual(results["a"], ("ok", "A"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from classification_cache import ClassificationCache
+from glycan_fingerprint import CompositionIndex, classification_key, composition_vector, format_composition, \
+    topology_hash
+from glycan_tree_type_identifier import check_type, parse_wurcs
+
+class GlycanFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        # The same glycan with the unique residues listed in another order and other linkage carbons
+        self.permuted = "WURCS=2.0/3,7,6/[a1122h-1b_1-5][a2122h-1b_1-5_2*NCC/3=O][a1122h-1a_1-5]/2-2-1-3-3-3-3/a3-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        # The same topology with the letters of the two arms swapped
+        self.relettered = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c6-d1_c3-e1_d3-f1_f2-g1"
+
+    def test_keys(self):
+        hm, permuted, relettered = (parse_wurcs(wurcs) for wurcs in (self.hm, self.permuted, self.relettered))
+        self.assertEqual(classification_key(hm), classification_key(permuted))
+        self.assertNotEqual(classification_key(hm), classification_key(relettered))
+        self.assertEqual(topology_hash(hm), topology_hash(permuted))
+        self.assertEqual(topology_hash(hm), topology_hash(relettered))
+        nag = parse_wurcs("WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/")
+        self.assertNotEqual(topology_hash(hm), topology_hash(nag))
+        self.assertEqual(format_composition(composition_vector(hm)), "NAG2 BMA1 MAN4")
+
+    def test_canonical_cache(self):
+        cache = ClassificationCache(10, canonical=True)
+        for wurcs in (self.hm, self.permuted, self.relettered, self.hm, "ERROR"):
+            self.assertEqual(cache.classify(wurcs), check_type(wurcs))
+        self.assertEqual((cache.hits, cache.misses, cache.equivalent_hits), (1, 4, 1))
+
+    def test_composition_index(self):
+        index = CompositionIndex()
+        for wurcs in (self.hm, self.permuted, self.relettered, "ERROR"):
+            index.add(wurcs, check_type(wurcs))
+        index.add("WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/", "Unsuitable core glycan")
+        summary = index.summary("topology")
+        self.assertEqual(len(summary), 2)
+        self.assertEqual(summary[0][2:], (3, {"High Mannose": 3}))
+        self.assertEqual(index.topologies((2, 1, 4, 0, 0, 0, 0)), {summary[0][1]: {"High Mannose": 3}})
+
+
+if __name__ == "__main__":
+    unittest.main()
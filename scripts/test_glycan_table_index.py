@@ -0,0 +1,45 @@
+import csv
+import os
+import tempfile
+import unittest
+from glycan_table_index import GlycanTableIndex, build_index
+
+class GlycanTableIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_csv = os.path.join(self.tmpdir.name, "output.csv")
+        self.index_path = os.path.join(self.tmpdir.name, "output.gtix")
+        hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        self.rows = [["2xyz", "A", "A-NAG-1", hm, "High Mannose"],
+                     ["1abc", "A", "A-NAG-1", nag, "Unsuitable core glycan"],
+                     ["1abc", "B", "B-NAG-1", hm, "High Mannose"],
+                     ["2xyz", "B", "B-NAG-1", nag, "Unsuitable core glycan"],
+                     ["1abc", "C", "C-NAG-1", "ERROR", "Error producing WURCS string"]]
+        with open(self.input_csv, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["FileName", "TSChainId", "ID", "WURCS", "Results"])
+            writer.writerows(self.rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lookups(self):
+        self.assertEqual(build_index(self.input_csv, self.index_path), 5)
+        with GlycanTableIndex(self.index_path) as index:
+            self.assertEqual(len(index), 5)
+            self.assertListEqual(list(index.file_names()), ["1abc", "2xyz"])
+            rows = index.file_rows("1abc")
+            self.assertIsInstance(rows, memoryview)
+            self.assertListEqual(rows.tolist(), [1, 2, 4])
+            rows.release()
+            self.assertListEqual(index.find(result="High Mannose").tolist(), [0, 2])
+            self.assertListEqual(index.find("2xyz", "Unsuitable core glycan"), [3])
+            self.assertListEqual(index.find("3def").tolist(), [])
+            self.assertListEqual(index.find(result="Hybrid").tolist(), [])
+            self.assertListEqual([list(index.row(row).values()) for row in index.find()], self.rows)
+            self.assertEqual(index.column("TSChainId")[3], "B")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,15 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
 from glycan_tree_type_identifier import (get_unique_sugars, get_sugar_order, get_linkages, organise_linkages,
-                                         branches_to_sugars, check_type)
+                                         branches_to_sugars, check_type, check_types, parse_wurcs, TREE_TYPES,
+                                         residue_index, IS_MANNOSE, IS_FUCOSE, IS_HEXNAC, UNRECOGNISED,
+                                         residue_position, residue_id, load_residue_index, classify_glycan,
+                                         GlycanResult, REASON_MANNOSE_TAIL, REASON_NO_MANNOSE,
+                                         REASON_PRIVATEER_ERROR, REASON_MANNOSE_ONLY_BRANCH)
 
 class GlycanTreeTypeIdentifierTest(unittest.TestCase):
     def setUp(self):
@@ -29,9 +38,105 @@ class GlycanTreeTypeIdentifierTest(unittest.TestCase):
         result = branches_to_sugars(branches, sugar_alphabet_map)
         self.assertListEqual(result, [['SugarA', 'SugarB', 'SugarC']])
 
+    def test_parse_wurcs(self):
+        parsed = parse_wurcs(f'"{self.wurcs}"')
+        self.assertListEqual(parsed.residues, ['NAG', 'BMA', 'MAN'])
+        self.assertListEqual(parsed.order.tolist(), [1, 1, 2, 3, 3, 3, 3])
+        self.assertListEqual(parsed.donors.tolist(), [0, 1, 2, 2, 4, 5])
+        self.assertListEqual(parsed.acceptors.tolist(), [1, 2, 3, 4, 5, 6])
+        self.assertListEqual(get_linkages(parsed), get_linkages(self.wurcs))
+        self.assertIsNone(parse_wurcs("ERROR"))
+
+    def test_residue_index(self):
+        def flags(descriptor):
+            return residue_index.flags[residue_index.codes[descriptor]]
+        self.assertEqual(flags("a1122h-1b_1-5"), IS_MANNOSE)
+        self.assertEqual(flags("a1221m-1a_1-5"), IS_FUCOSE)
+        self.assertEqual(flags("a2122h-1b_1-5_2*NCC/3=O"), IS_HEXNAC)
+        self.assertEqual(flags("a2112h-1b_1-5"), 0)
+        self.assertEqual(residue_index.names[residue_index.man_code], "MAN")
+        parsed = parse_wurcs("WURCS=2.0/2,2,1/[a2122h-1b_1-5_2*NCC/3=O][unknown]/1-2/a4-b1")
+        self.assertListEqual(parsed.residue_codes.tolist(), [residue_index.codes["a2122h-1b_1-5_2*NCC/3=O"], UNRECOGNISED])
+        self.assertListEqual(parsed.residues, ["NAG", None])
+
+    def test_residue_ids(self):
+        self.assertListEqual([residue_position(id) for id in ('a', 'w', 'z', 'A', 'Z', 'aa', 'aZ', 'ba')],
+                             [0, 22, 25, 26, 51, 52, 103, 104])
+        self.assertListEqual([residue_position(residue_id(position)) for position in range(3000)], list(range(3000)))
+
+    def test_tree(self):
+        tree = parse_wurcs(self.wurcs).tree
+        self.assertEqual(tree.branch_point, 2)
+        self.assertListEqual(tree.parent, [-1, 0, 1, 2, 2, 4, 5])
+        self.assertListEqual(tree.depth, [0, 1, 2, 3, 3, 4, 5])
+        self.assertListEqual(tree.subtree_size, [7, 6, 5, 1, 3, 2, 1])
+        self.assertListEqual(tree.branches(), [[3], [4, 5, 6]])
+
+    def test_large_and_deep_tree(self):
+        # A linear chain of 3000 residues with multi-letter IDs and a branch at the 'w' residue
+        count = 3000
+        linkages = [f"{residue_id(i)}4-{residue_id(i + 1)}1" for i in range(count - 1)]
+        linkages.append(f"w6-{residue_id(count)}1")
+        wurcs = f"WURCS=2.0/1,{count + 1},{count}/[a1122h-1a_1-5]/{'-'.join(['1'] * (count + 1))}/{'_'.join(linkages)}"
+        tree = parse_wurcs(wurcs).tree
+        self.assertEqual(len(tree), count + 1)
+        self.assertEqual(tree.branch_point, 22)
+        self.assertEqual(tree.depth[count - 1], count - 1)
+        self.assertListEqual([len(branch) for branch in tree.branches()], [count - 23, 1])
+
+    def test_load_residue_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database_path = os.path.join(tmpdir, "database.json")
+            with open(database_path, "w") as file:
+                json.dump({"a1122h-1a_1-5": "MAN"}, file)
+            index = load_residue_index(database_path)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "database.marshal")))
+            compiled = load_residue_index(database_path)
+            self.assertEqual(compiled.to_compiled(), index.to_compiled())
+
+            with open(database_path, "w") as file:
+                json.dump({"a1122h-1a_1-5": "MAN", "a1221m-1a_1-5": "FUC"}, file)
+            self.assertEqual(load_residue_index(database_path).flags, [IS_MANNOSE, IS_FUCOSE])
+
+    def test_cli(self):
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "glycan_tree_type_identifier.py")
+        result = subprocess.run([sys.executable, script, "--wurcs", self.wurcs, nag, "--file", "-"],
+                                input=f"{nag}\n\nERROR\n", capture_output=True, text=True, check=True)
+        self.assertListEqual(result.stdout.splitlines(),
+                             ["High Mannose", "Unsuitable core glycan", "Unsuitable core glycan",
+                              "Error producing WURCS string"])
+
+    def test_parse_wurcs_malformed(self):
+        with self.assertRaises(ValueError):
+            parse_wurcs("WURCS=2.0/1,1,0/")
+
     def test_check_type(self):
         self.assertEqual(check_type(self.wurcs), 'High Mannose')
 
+    def test_classify_glycan(self):
+        result = classify_glycan(self.wurcs)
+        self.assertEqual(result, GlycanResult("High Mannose", REASON_MANNOSE_TAIL, 7, 5, 2, "c"))
+        self.assertListEqual(result.to_row(), ["High Mannose", REASON_MANNOSE_TAIL, "7", "5", "2", "c", ""])
+        self.assertEqual(GlycanResult.from_row(result.to_row()), result)
+        hybrid = "WURCS=2.0/4,8,7/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5][a2112h-1b_1-5]/1-2-3-1-4-3-3-3/a4-b1_b3-c1_b6-f1_c2-d1_d4-e1_f3-g1_f6-h1"
+        self.assertEqual(classify_glycan(hybrid),
+                         GlycanResult("Hybrid", REASON_MANNOSE_ONLY_BRANCH, 8, 5, 2, "b", 1))
+        self.assertEqual(classify_glycan("WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/").reason, REASON_NO_MANNOSE)
+        self.assertEqual(list(classify_glycan("ERROR")),
+                         ["Error producing WURCS string", REASON_PRIVATEER_ERROR, None, None, None, None, None])
+
+    def test_check_types(self):
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        batch = check_types(iter([self.wurcs, nag, "ERROR", self.wurcs]), counts=True)
+        self.assertEqual(len(batch), 4)
+        self.assertListEqual([batch[i] for i in range(4)],
+                             ['High Mannose', 'Unsuitable core glycan', 'Error producing WURCS string', 'High Mannose'])
+        self.assertListEqual([TREE_TYPES[code] for code in batch.codes], [batch[i] for i in range(4)])
+        self.assertListEqual(batch.residue_counts.tolist(), [7, 1, 0, 7])
+        self.assertListEqual(batch.branch_counts.tolist(), [2, 0, 0, 2])
+        self.assertIsNone(check_types([nag]).residue_counts)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
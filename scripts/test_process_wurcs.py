@@ -0,0 +1,124 @@
+import contextlib
+import csv
+import io
+import os
+import sys
+import tempfile
+import unittest
+from classification_cache import ClassificationCache
+from process_wurcs import Quarantine, Throughput, TooManyErrors, classify_rows, process_csv
+
+class ProcessWurcsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_csv = os.path.join(self.tmpdir.name, "input.csv")
+        self.output_csv = os.path.join(self.tmpdir.name, "output.csv")
+        hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        self.rows = [["1abc", "A", hm], ["1abc", "B", nag], ["2xyz", "A", hm]]
+        self.expected = ["High Mannose", "Unsuitable core glycan", "High Mannose"]
+        with open(self.input_csv, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["FileName", "TSChainId", "WURCS"])
+            writer.writerows(self.rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_output(self):
+        with open(self.output_csv, newline="") as file:
+            return list(csv.reader(file))
+
+    def test_process_csv(self):
+        cache = process_csv(self.input_csv, self.output_csv, chunk_size=1)
+        output = self.read_output()
+        self.assertListEqual(output[0], ["FileName", "TSChainId", "WURCS", "Results"])
+        self.assertListEqual([row[-1] for row in output[1:]], self.expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_process_csv_details(self):
+        process_csv(self.input_csv, self.output_csv, chunk_size=2, details=True)
+        output = self.read_output()
+        self.assertListEqual(output[0], ["FileName", "TSChainId", "WURCS", "Results", "Reason", "Residues",
+                                         "Mannoses", "Branches", "BranchPoint", "MannoseOnlyBranches"])
+        self.assertListEqual([row[3:] for row in output[1:]],
+                             [["High Mannose", "mannose_tail", "7", "5", "2", "c", ""],
+                              ["Unsuitable core glycan", "no_mannose", "1", "0", "", "", ""],
+                              ["High Mannose", "mannose_tail", "7", "5", "2", "c", ""]])
+        with self.assertRaises(ValueError):
+            process_csv(self.input_csv, self.output_csv, store_path=os.path.join(self.tmpdir.name, "store.sqlite"),
+                        details=True)
+
+    def test_quarantine(self):
+        rows = [list(row) for row in self.rows]
+        rows.insert(1, ["1abc", "C", "WURCS=2.0/malformed"])
+        rows.append(["2xyz", "B"])
+        with open(self.input_csv, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["FileName", "TSChainId", "WURCS"])
+            writer.writerows(rows)
+        quarantine_csv = os.path.join(self.tmpdir.name, "quarantine.csv")
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            process_csv(self.input_csv, self.output_csv, chunk_size=2, quarantine_csv=quarantine_csv)
+        self.assertIn("Quarantined 2 rows", errors.getvalue())
+        self.assertListEqual([row[-1] for row in self.read_output()[1:]], self.expected)
+        with open(quarantine_csv, newline="") as file:
+            quarantined = list(csv.reader(file))
+        self.assertListEqual(quarantined[0], ["RowNumber", "Error", "Message", "FileName", "TSChainId", "WURCS"])
+        self.assertListEqual([row[:2] + row[3:] for row in quarantined[1:]],
+                             [["2", "ValueError", "1abc", "C", "WURCS=2.0/malformed"],
+                              ["5", "IndexError", "2xyz", "B"]])
+
+        with self.assertRaises(TooManyErrors), contextlib.redirect_stderr(io.StringIO()):
+            process_csv(self.input_csv, self.output_csv, chunk_size=2, quarantine_csv=quarantine_csv, max_errors=1)
+        with self.assertRaises(ValueError):
+            process_csv(self.input_csv, self.output_csv, chunk_size=2, max_errors=1)
+        # Without a quarantine file, a row that cannot be classified stops the run instead of being left out
+        with self.assertRaisesRegex(ValueError, "Row 2: ValueError: Malformed WURCS"):
+            process_csv(self.input_csv, self.output_csv, chunk_size=2)
+        with self.assertRaises(ValueError):
+            list(classify_rows(rows, 2))
+        # A row too short to have a WURCS column raises an IndexError, which the CLI would not have caught
+        with self.assertRaisesRegex(ValueError, "Row 2: IndexError"):
+            list(classify_rows([rows[0], rows[4]], 2))
+        quarantine = Quarantine()
+        self.assertEqual(len(list(classify_rows(rows, 2, quarantine=quarantine))), 3)
+        self.assertDictEqual(quarantine.errors, {"ValueError": 1, "IndexError": 1})
+
+    def test_process_csv_without_wurcs_column(self):
+        with open(self.input_csv, "w", newline="") as file:
+            csv.writer(file).writerow(["FileName", "TSChainId"])
+        with self.assertRaises(ValueError):
+            process_csv(self.input_csv, self.output_csv)
+
+    def test_process_csv_without_cache(self):
+        self.assertIsNone(process_csv(self.input_csv, self.output_csv, cache_size=0))
+        self.assertListEqual([row[-1] for row in self.read_output()[1:]], self.expected)
+
+    def test_process_csv_parallel(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            process_csv(self.input_csv, self.output_csv, workers=2, chunk_size=1)
+        self.assertListEqual([row[-1] for row in self.read_output()[1:]], self.expected)
+        self.assertListEqual([row[:-1] for row in self.read_output()[1:]], self.rows)
+
+    def test_classify_rows_deduplicates(self):
+        cache = ClassificationCache(10)
+        throughput = Throughput()
+        rows = [list(row) for row in self.rows]
+        output = list(classify_rows(rows, 2, cache=cache, throughput=throughput))
+        self.assertListEqual([row[-1] for row in output], self.expected)
+        self.assertEqual((throughput.rows, throughput.classified), (3, 2))
+
+    def test_process_csv_stdin_stdout(self):
+        with open(self.input_csv, newline="") as infile, contextlib.redirect_stdout(io.StringIO()) as output:
+            sys.stdin = infile
+            try:
+                process_csv("-", "-")
+            finally:
+                sys.stdin = sys.__stdin__
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+        self.assertListEqual([row[-1] for row in rows[1:]], self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import stage_profiler
+from stage_profiler import StageProfiler, profile_stages
+from glycan_tree_type_identifier import check_type
+
+class StageProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(stage_profiler.set_active, stage_profiler.set_active(None))
+
+    def test_check_type_stages(self):
+        hm = "WURCS=2.0/3,7,6/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5]/1-1-2-3-3-3-3/a4-b1_b4-c1_c3-d1_c6-e1_e3-f1_f2-g1"
+        nag = "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"
+        with profile_stages() as profiler:
+            for wurcs in (hm, hm, nag, "ERROR", "WURCS=2.0/1,1,0/[unknown]/1/"):
+                check_type(wurcs)
+        self.assertIsNone(stage_profiler.active)
+        self.assertDictEqual({stage: calls for stage, (calls, _) in profiler.stages.items()},
+                             {"parse": 5, "lookup": 4, "core": 4, "tree": 2, "branches": 2})
+        self.assertDictEqual(profiler.outcomes, {"High Mannose": 2, "Unsuitable core glycan": 1,
+                                                 "Error producing WURCS string": 1, "Sugar WURCS not recognised": 1})
+        self.assertIn("Sugar WURCS not recognised", profiler.format_table())
+
+    def test_disabled(self):
+        with profile_stages(enabled=False) as profiler:
+            self.assertIsNone(profiler)
+            check_type("ERROR")
+
+    def test_stage_ends_on_error(self):
+        with profile_stages() as profiler:
+            profiler.switch("rows")
+            with self.assertRaises(ValueError):
+                check_type("WURCS=2.0/no sections")
+            self.assertEqual(profiler.switch("rows", enter=False), "rows")
+            with self.assertRaises(IndexError):
+                check_type("WURCS=2.0/1,2,0/[a2122h-1b_1-5_2*NCC/3=O]/1-2/")
+            self.assertEqual(profiler.switch(None), "rows")
+
+    def test_nested_switch_and_merge(self):
+        profiler = StageProfiler()
+        profiler.switch("outer")
+        outer = profiler.switch("inner")
+        profiler.switch(outer, enter=False)
+        profiler.switch(None)
+        profiler.outcome("ok")
+        self.assertEqual(profiler.stages["outer"][0], 1)
+        self.assertEqual(profiler.stages["inner"][0], 1)
+
+        total = StageProfiler()
+        total.add("outer", 5)
+        total.merge(profiler.drain())
+        self.assertEqual(total.stages["outer"][0], 2)
+        self.assertDictEqual(total.outcomes, {"ok": 1})
+        self.assertDictEqual(profiler.stages, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import gzip
+import os
+import tempfile
+import unittest
+from crawl_manifest import CrawlManifest
+from crawl_scheduler import scan_pdb_files
+from structure_files import (STRUCTURE_SUFFIXES, decompressed_path, discard_decompressed, privateer_input,
+                             scratch_directory, select_structures, structure_name)
+
+class StructureFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_structure_name(self):
+        self.assertEqual(structure_name("mirror/ab/1abc.cif.gz"), "1abc")
+        self.assertEqual(structure_name("1abc.pdb.gz"), "1abc")
+        self.assertEqual(structure_name("data/2xyz.pdb"), "2xyz")
+
+    def test_privateer_input(self):
+        compressed = os.path.join(self.tmpdir.name, "1abc.cif.gz")
+        with gzip.open(compressed, "wt") as file:
+            file.write("data_1ABC\n")
+        plain = os.path.join(self.tmpdir.name, "2xyz.pdb")
+        with scratch_directory() as scratch:
+            with privateer_input(compressed, scratch) as path:
+                self.assertEqual(os.path.dirname(path), scratch)
+                self.assertTrue(path.endswith("_1abc.cif"))
+                with open(path) as file:
+                    self.assertEqual(file.read(), "data_1ABC\n")
+            self.assertListEqual(os.listdir(scratch), [])
+            with privateer_input(plain, scratch) as path:
+                self.assertEqual(path, plain)
+            with self.assertRaises(RuntimeError), privateer_input(compressed, scratch):
+                raise RuntimeError()
+            self.assertListEqual(os.listdir(scratch), [])
+            open(decompressed_path(compressed, scratch), "w").close()
+            discard_decompressed(compressed, scratch)
+            self.assertListEqual(os.listdir(scratch), [])
+        self.assertFalse(os.path.exists(scratch))
+
+    def test_nested_mirror(self):
+        root = self.tmpdir.name
+        paths = {}
+        for relative_path in ("ab/1abc.pdb.gz", "ab/1abc.cif.gz", "cd/1abc.cif.gz", "ab/2abc.pdb", "ef/2abc.pdb",
+                              "ef/3abc.pdb.gz"):
+            paths[relative_path] = os.path.join(root, *relative_path.split("/"))
+            os.makedirs(os.path.dirname(paths[relative_path]), exist_ok=True)
+            with gzip.open(paths[relative_path], "wt") as file:
+                file.write("ATOM\n")
+
+        files, duplicates = select_structures(scan_pdb_files(root, STRUCTURE_SUFFIXES, recursive=True), root)
+        self.assertListEqual(sorted(os.path.relpath(path, root) for path, _ in files),
+                             [os.path.join("ab", "1abc.cif.gz"), os.path.join("ab", "2abc.pdb"),
+                              os.path.join("ef", "3abc.pdb.gz")])
+        self.assertEqual(len(duplicates), 3)
+
+        # Files of the same name in different directories have their own manifest entries and scratch paths
+        manifest_path = os.path.join(root, "manifest.csv")
+        with CrawlManifest(manifest_path, root=root) as manifest:
+            manifest.record(paths["ab/2abc.pdb"], "ok", 1.5)
+        with CrawlManifest(manifest_path, root=root) as manifest:
+            self.assertDictEqual(manifest.timings(), {"ab/2abc.pdb": 1.5})
+            self.assertFalse(manifest.should_process(paths["ab/2abc.pdb"]))
+            self.assertTrue(manifest.should_process(paths["ef/2abc.pdb"]))
+        self.assertNotEqual(decompressed_path(paths["ab/1abc.cif.gz"], root),
+                            decompressed_path(paths["cd/1abc.cif.gz"], root))
+
+
+if __name__ == "__main__":
+    unittest.main()
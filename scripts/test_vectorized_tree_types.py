@@ -0,0 +1,38 @@
+import unittest
+from benchmark_wurcs import generate_corpus
+from glycan_tree_type_identifier import check_type, check_types
+from vectorized_tree_types import classify_batch
+
+class VectorizedTreeTypesTest(unittest.TestCase):
+    def test_parity_with_check_type(self):
+        corpus = generate_corpus(5000, seed=7, duplicate_ratio=0.5, max_extensions=4)
+        batch = classify_batch(corpus, counts=True)
+        self.assertListEqual(list(batch), [check_type(wurcs) for wurcs in corpus])
+        expected = check_types(corpus, counts=True)
+        self.assertListEqual(batch.residue_counts.tolist(), expected.residue_counts.tolist())
+        self.assertListEqual(batch.branch_counts.tolist(), expected.branch_counts.tolist())
+
+    def test_malformed_trees(self):
+        residues = "[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5][a1122h-1a_1-5][a1221m-1a_1-5]"
+        corpus = [
+            # Residue f has two children but is in a cycle with g, so it is not reachable and not the branch point
+            f"WURCS=2.0/4,8,7/{residues}/1-1-2-3-3-3-3-1/f2-g1_f3-h1_g4-f1_a4-b1_b4-c1_c3-d1_c6-e1",
+            # Second parent of c and a linkage to a residue outside the glycan are ignored
+            f"WURCS=2.0/4,7,8/{residues}/1-1-2-3-3-3-3/a4-b1_b4-c1_a6-c1_c3-d1_c6-e1_e3-f1_f2-g1_g2-z1",
+            # Lone fucose on the root, so the root is the branch point
+            f"WURCS=2.0/4,8,7/{residues}/1-1-2-3-3-1-3-4/a4-b1_a6-h1_b4-c1_c3-d1_c6-e1_d2-f1_e2-g1",
+            # Index 0 refers to the last unique residue
+            f"WURCS=2.0/4,4,3/{residues}/1-1-2-0/a4-b1_b4-c1_b6-d1",
+            # Unrecognised residue
+            "WURCS=2.0/2,3,2/[a2122h-1b_1-5_2*NCC/3=O][unknown]/1-1-2/a4-b1_a6-c1",
+            "ERROR",
+        ]
+        self.assertListEqual(list(classify_batch(corpus)), [check_type(wurcs) for wurcs in corpus])
+
+    def test_out_of_range_residue(self):
+        with self.assertRaises(IndexError):
+            classify_batch(["WURCS=2.0/1,2,1/[a2122h-1b_1-5_2*NCC/3=O]/1-2/a4-b1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
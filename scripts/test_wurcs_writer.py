@@ -0,0 +1,81 @@
+import contextlib
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+from wurcs_writer import WurcsWriter, OUTPUT_COLUMNS, part_path
+
+class WurcsWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rows = [("1abc", "A", "A-NAG-1_A", "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/"),
+                     ("2xyz", "", "NAG-2", "WURCS=2.0/1,1,0/[a2122h-1b_1-5_2*NCC/3=O]/1/")]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_csv_buffering_and_append(self):
+        path = os.path.join(self.tmpdir.name, "output.csv")
+        with WurcsWriter(path, max_rows=3) as writer:
+            writer.write_rows(self.rows)
+            self.assertEqual((writer.rows_written, writer.buffered_rows), (0, 2))
+            writer.write_rows(self.rows[:1])
+            self.assertEqual((writer.rows_written, writer.buffered_rows), (3, 0))
+        with WurcsWriter(path) as writer:
+            writer.write_rows(self.rows[1:])
+        with open(path, newline="") as file:
+            rows = list(csv.reader(file))
+        self.assertListEqual(rows[0], OUTPUT_COLUMNS)
+        self.assertListEqual([tuple(row) for row in rows[1:]], self.rows + self.rows)
+
+    def test_csv_columns(self):
+        path = os.path.join(self.tmpdir.name, "output.csv")
+        with WurcsWriter(path, columns=OUTPUT_COLUMNS + ["Results"]) as writer:
+            writer.write_rows([row + ("Unsuitable core glycan",) for row in self.rows])
+        with self.assertRaises(ValueError):
+            WurcsWriter(path)
+
+    def test_stdout(self):
+        # A stream that translates newlines, as sys.stdout does on Windows
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", newline="\r\n")
+        with contextlib.redirect_stdout(stdout):
+            with WurcsWriter("-") as writer:
+                writer.write_rows(self.rows)
+        self.assertFalse(stdout.closed)
+        stdout.flush()
+        expected = io.StringIO(newline="")
+        csv.writer(expected).writerows([OUTPUT_COLUMNS] + list(self.rows))
+        self.assertEqual(stdout.buffer.getvalue().decode(), expected.getvalue())
+        with self.assertRaises(ValueError):
+            WurcsWriter("-", output_format="parquet")
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        path = os.path.join(self.tmpdir.name, "output.parquet")
+        with WurcsWriter(path, output_format="parquet", max_rows=1) as writer:
+            writer.write_rows(self.rows)
+            # Not readable until the footer is written on close
+            self.assertFalse(os.path.exists(path))
+        table = pq.read_table(path)
+        self.assertListEqual(table.column_names, OUTPUT_COLUMNS)
+        self.assertListEqual(table.column("FileName").to_pylist(), ["1abc", "2xyz"])
+        with self.assertRaises(FileExistsError):
+            WurcsWriter(path, output_format="parquet")
+
+        # Each run resumed from a manifest writes its own part, which an error leaves unpublished
+        part = part_path(path)
+        self.assertEqual(part, os.path.join(self.tmpdir.name, "output.1.parquet"))
+        with self.assertRaises(RuntimeError):
+            with WurcsWriter(part, output_format="parquet") as writer:
+                writer.write_rows(self.rows)
+                raise RuntimeError()
+        self.assertFalse(os.path.exists(part))
+        self.assertEqual(pq.read_table(f"{part}.partial").num_rows, 2)
+        self.assertEqual(part_path(path), part)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# Long-lived buffered writer for the rows extracted by privateer_wurcs.py.
+# Rows from many PDB files are batched and written when the buffer reaches a number of rows or an age, instead of
+# building a DataFrame and reopening the output file for every PDB file.
+
+import csv
+import os
+import sys
+import time
+
+OUTPUT_COLUMNS = ['FileName', 'TSChainId', 'ID', 'WURCS']
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+
+class WurcsWriter:
+    """
+    Buffered writer of (FileName, TSChainId, ID, WURCS) rows.
+
+    CSV output is appended to, writing the header only if the file is new, or written to stdout with its header if
+    the path is '-', so it can be piped into process_wurcs.py. Parquet and Arrow output need pyarrow, are written as
+    one row group or record batch per flush, and cannot be appended to between runs, see part_path. As they cannot
+    be read before their footer is written on close, they are written to the path with a '.partial' suffix, renamed
+    to the path only once the writer closes without an error.
+
+    :param path: Path to the output file, or '-' for stdout.
+    :param output_format: 'csv', 'parquet' or 'arrow'.
+    :param max_rows: Number of buffered rows that triggers a flush.
+    :param max_seconds: Age in seconds of the oldest buffered row that triggers a flush.
+    :param columns: Names of the columns of each row, OUTPUT_COLUMNS by default.
+    :raises ValueError: If an existing CSV file has other columns, or Parquet or Arrow output is written to stdout.
+    """
+    def __init__(self, path: str, output_format: str = 'csv', max_rows: int = 10000, max_seconds: float = 30.0,
+                 columns=OUTPUT_COLUMNS):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.path = path
+        self.columns = list(columns)
+        self.output_format = output_format
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows_written = 0
+        self._buffer = []
+        self._buffer_started = None
+
+        if path == '-':
+            if output_format != 'csv':
+                raise ValueError(f"{output_format} output cannot be written to stdout")
+            self._file = sys.stdout
+            # As for the files opened below, csv needs the newlines left alone
+            if hasattr(self._file, "reconfigure"):
+                self._file.reconfigure(newline='')
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(self.columns)
+        elif output_format == 'csv':
+            write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+            if not write_header:
+                with open(path, newline='') as file:
+                    header = next(csv.reader(file), None)
+                if header != self.columns:
+                    raise ValueError(f"{path} has columns {header}, so rows with columns {self.columns} cannot be "
+                                     f"appended to it")
+            self._file = open(path, 'a', newline='')
+            self._csv_writer = csv.writer(self._file)
+            if write_header:
+                self._csv_writer.writerow(self.columns)
+        else:
+            if os.path.exists(path):
+                raise FileExistsError(f"{output_format} output cannot be appended to, {path} already exists")
+            import pyarrow as pa
+            self._pa = pa
+            self._schema = pa.schema([(column, pa.string()) for column in self.columns])
+            if output_format == 'parquet':
+                import pyarrow.parquet as pq
+                self._table_writer = pq.ParquetWriter(self.partial_path, self._schema)
+            else:
+                self._table_writer = pa.ipc.new_file(self.partial_path, self._schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Parquet or Arrow output cut short by an error is left under its partial path
+        self.close(publish=exc_type is None)
+
+    @property
+    def partial_path(self):
+        """
+        :return: Path Parquet or Arrow output is written to until the writer closes.
+        """
+        return f"{self.path}.partial"
+
+    @property
+    def buffered_rows(self):
+        """
+        :return: Number of rows waiting to be written.
+        """
+        return len(self._buffer)
+
+    def write_rows(self, rows):
+        """
+        Buffer rows, flushing if the buffer is full or old enough.
+
+        :param rows: List of (FileName, TSChainId, ID, WURCS) tuples, or of tuples of the columns of the writer.
+        """
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.max_rows or time.monotonic() - self._buffer_started >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows.
+        """
+        if self._buffer:
+            if self.output_format == 'csv':
+                self._csv_writer.writerows(self._buffer)
+            else:
+                columns = [list(column) for column in zip(*self._buffer)]
+                self._table_writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        if self.output_format == 'csv':
+            self._file.flush()
+
+    def close(self, publish: bool = True):
+        """
+        Flush buffered rows and close the output file, leaving stdout open.
+
+        :param publish: Rename Parquet or Arrow output from its partial_path to its path.
+        """
+        self.flush()
+        if self.output_format == 'csv':
+            if self.path != '-':
+                self._file.close()
+        else:
+            self._table_writer.close()
+            if publish:
+                os.replace(self.partial_path, self.path)
+
+def part_path(path: str):
+    """
+    Path for the Parquet or Arrow output of one run of a crawl resumed from its manifest, as such output cannot be
+    appended to. The parts can be read together with e.g. pyarrow.dataset.dataset(paths).
+
+    :param path: Path to the output file, e.g. 'output.parquet'.
+    :return: The path if there is no file there yet, otherwise the first free part next to it, e.g.
+        'output.1.parquet'.
+    """
+    if not os.path.exists(path):
+        return path
+    stem, extension = os.path.splitext(path)
+    part = 1
+    while os.path.exists(f"{stem}.{part}{extension}"):
+        part += 1
+    return f"{stem}.{part}{extension}"